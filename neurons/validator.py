@@ -18,9 +18,16 @@ import time
 import torch
 import bittensor as bt
 from prompting.forward import forward
-from prompting.llms import HuggingFacePipeline, vLLMPipeline
+from prompting.llms import (
+    HuggingFacePipeline,
+    vLLMPipeline,
+    AsyncvLLMPipeline,
+    BatchingPipeline,
+)
 from prompting.base.validator import BaseValidatorNeuron
 from prompting.rewards import RewardPipeline
+from prompting.rewards.service import RemoteRewardPipeline
+from prompting.task_queue import TaskQueue
 
 
 class Validator(BaseValidatorNeuron):
@@ -34,11 +41,22 @@ class Validator(BaseValidatorNeuron):
         bt.logging.info("load_state()")
         self.load_state()
 
-        self.llm_pipeline = vLLMPipeline(
+        pipeline_class = (
+            AsyncvLLMPipeline if self.config.neuron.llm_async else vLLMPipeline
+        )
+        self.llm_pipeline = pipeline_class(
             model_id=self.config.neuron.model_id,
             device=self.device,
             mock=self.config.mock,
         )
+        # The async engine already batches requests which are in flight together
+        if self.config.neuron.llm_batch_window > 0 and not self.config.neuron.llm_async:
+            # Concurrent forwards and the task queue workers share the pipeline, so their calls are batched together
+            self.llm_pipeline = BatchingPipeline(
+                self.llm_pipeline,
+                window=self.config.neuron.llm_batch_window,
+                max_batch_size=self.config.neuron.llm_max_batch_size,
+            )
 
         if sum(self.config.neuron.task_p) != 1:
             raise ValueError("Task probabilities do not sum to 1.")
@@ -50,8 +68,38 @@ class Validator(BaseValidatorNeuron):
             if p > 0
         ]
         # Load the reward pipeline
-        self.reward_pipeline = RewardPipeline(
-            selected_tasks=self.active_tasks, device=self.device
+        reward_pipeline_kwargs = dict(
+            selected_tasks=self.active_tasks,
+            device=self.device,
+            cascade=self.config.neuron.reward_cascade,
+            cascade_floor=self.config.neuron.reward_cascade_floor,
+            cascade_fill=self.config.neuron.reward_cascade_fill,
+            model_kwargs={
+                "relevance": dict(
+                    backend=self.config.neuron.relevance_backend,
+                    max_length=self.config.neuron.relevance_max_length,
+                    chunking=self.config.neuron.relevance_chunking,
+                    num_threads=self.config.neuron.relevance_num_threads,
+                    cache_path=self.config.neuron.relevance_cache_path,
+                )
+            },
+        )
+        if self.config.neuron.reward_server_path:
+            # The reward models are hosted once for all validators on this machine
+            self.reward_pipeline = RemoteRewardPipeline(
+                path=self.config.neuron.reward_server_path, **reward_pipeline_kwargs
+            )
+        else:
+            self.reward_pipeline = RewardPipeline(**reward_pipeline_kwargs)
+
+        # Tasks and challenges are prepared in the background, workers are started on the first forward
+        self.task_queue = TaskQueue(
+            llm_pipeline=self.llm_pipeline,
+            tasks=self.config.neuron.tasks,
+            task_p=self.config.neuron.task_p,
+            maxsize=self.config.neuron.task_queue_size,
+            num_workers=self.config.neuron.task_queue_workers,
+            batch_size=self.config.neuron.task_queue_batch_size,
         )
 
     async def forward(self):
@@ -94,6 +142,8 @@ class Validator(BaseValidatorNeuron):
             self.is_running = False
             bt.logging.debug("Stopped")
 
+        self.task_queue.stop()
+
 
 # The main function parses the configuration and runs the validator.
 if __name__ == "__main__":
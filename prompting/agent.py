@@ -45,6 +45,8 @@ class HumanAgent(vLLM_LLM):
     """
     )
 
+    challenge_prompt = "Ask a question related to your goal"
+
     def __init__(
         self,
         task: Task,
@@ -88,9 +90,7 @@ class HumanAgent(vLLM_LLM):
         if hasattr(self.task, "cleaning_pipeline"):
             cleaner = CleanerPipeline(cleaning_pipeline=self.task.cleaning_pipeline)
 
-        self.challenge = super().query(
-            message="Ask a question related to your goal", cleaner=cleaner
-        )
+        self.challenge = super().query(message=self.challenge_prompt, cleaner=cleaner)
         self.challenge = self.task.format_challenge(self.challenge)
         self.challenge_time = time.time() - t0
 
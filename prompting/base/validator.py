@@ -79,6 +79,9 @@ class BaseValidatorNeuron(BaseNeuron):
         self.thread: threading.Thread = None
         self.lock = asyncio.Lock()
 
+        # Uids currently being queried by one of the concurrent forward passes.
+        self.uids_in_flight = set()
+
     def serve_axon(self):
         """Serve axon to enable external connections."""
 
@@ -136,23 +139,8 @@ class BaseValidatorNeuron(BaseNeuron):
             while True:
                 bt.logging.info(f"step({self.step}) block({self.block})")
 
-                forward_timeout = self.config.neuron.forward_max_time
-                try:
-                    task = self.loop.create_task(self.forward())
-                    self.loop.run_until_complete(
-                        asyncio.wait_for(task, timeout=forward_timeout)
-                    )
-                except torch.cuda.OutOfMemoryError as e:
-                    bt.logging.error(f"Out of memory error: {e}")
-                    continue
-                except MaxRetryError as e:
-                    bt.logging.error(f"MaxRetryError: {e}")
-                    continue
-                except asyncio.TimeoutError as e:
-                    bt.logging.error(
-                        f"Forward timeout: Task execution exceeded {forward_timeout} seconds and was cancelled.: {e}"
-                    )
-                    continue
+                # Run multiple forwards concurrently.
+                self.loop.run_until_complete(self.concurrent_forward())
 
                 # Check if we should exit.
                 if self.should_exit:
@@ -175,6 +163,33 @@ class BaseValidatorNeuron(BaseNeuron):
             bt.logging.debug(print_exception(type(err), err, err.__traceback__))
             self.should_exit = True
 
+    async def concurrent_forward(self):
+        """Runs `neuron.num_concurrent_forwards` forward passes concurrently and waits for all of them to finish."""
+        coroutines = [
+            self.timed_forward()
+            for _ in range(self.config.neuron.num_concurrent_forwards)
+        ]
+        await asyncio.gather(*coroutines)
+
+    async def timed_forward(self):
+        """Runs a single forward pass which is cancelled if it exceeds `neuron.forward_max_time`.
+        Errors are logged here so that a failing forward does not cancel the other concurrent forwards.
+        """
+        forward_timeout = self.config.neuron.forward_max_time
+        try:
+            await asyncio.wait_for(self.forward(), timeout=forward_timeout)
+        except torch.cuda.OutOfMemoryError as e:
+            bt.logging.error(f"Out of memory error: {e}")
+        except MaxRetryError as e:
+            bt.logging.error(f"MaxRetryError: {e}")
+        except asyncio.TimeoutError as e:
+            bt.logging.error(
+                f"Forward timeout: Task execution exceeded {forward_timeout} seconds and was cancelled.: {e}"
+            )
+        except Exception as e:
+            bt.logging.error(f"Error during forward: {e}")
+            bt.logging.debug(print_exception(type(e), e, e.__traceback__))
+
     def run_in_background_thread(self):
         """
         Starts the validator's operations in a background thread upon entering the context.
@@ -314,7 +329,10 @@ class BaseValidatorNeuron(BaseNeuron):
         self.hotkeys = copy.deepcopy(self.metagraph.hotkeys)
 
     def update_scores(self, rewards: torch.FloatTensor, uids: List[int]):
-        """Performs exponential moving average on the scores based on the rewards received from the miners."""
+        """Performs exponential moving average on the scores based on the rewards received from the miners.
+
+        Concurrent forwards call this from the same event loop without awaiting in between, so updates are applied one at a time.
+        """
 
         # Check if rewards contains NaN values.
         if torch.isnan(rewards).any():
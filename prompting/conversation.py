@@ -16,7 +16,9 @@ from prompting.tools import (
 from transformers import Pipeline
 
 
-def create_task(llm_pipeline: Pipeline, task_name: str, create_reference=True) -> Task:
+def create_task(
+    llm_pipeline: Pipeline, task_name: str, create_reference=True, create_query=True
+) -> Task:
     wiki_based_tasks = ["summarization", "qa"]
     coding_based_tasks = ["debugging"]
     # TODO: Abstract dataset classes into common dynamic interface
@@ -37,6 +39,7 @@ def create_task(llm_pipeline: Pipeline, task_name: str, create_reference=True) -
             llm_pipeline=llm_pipeline,
             context=dataset.next(),
             create_reference=create_reference,
+            create_query=create_query,
         )
 
     elif task_name == "qa":
@@ -44,6 +47,7 @@ def create_task(llm_pipeline: Pipeline, task_name: str, create_reference=True) -
             llm_pipeline=llm_pipeline,
             context=dataset.next(),
             create_reference=create_reference,
+            create_query=create_query,
         )
 
     elif task_name == "debugging":
@@ -51,6 +55,7 @@ def create_task(llm_pipeline: Pipeline, task_name: str, create_reference=True) -
             llm_pipeline=llm_pipeline,
             context=dataset.next(),
             create_reference=create_reference,
+            create_query=create_query,
         )
 
     elif task_name == "math":
@@ -58,6 +63,7 @@ def create_task(llm_pipeline: Pipeline, task_name: str, create_reference=True) -
             llm_pipeline=llm_pipeline,
             context=dataset.next(),
             create_reference=create_reference,
+            create_query=create_query,
         )
 
     elif task_name == "date_qa":
@@ -65,6 +71,7 @@ def create_task(llm_pipeline: Pipeline, task_name: str, create_reference=True) -
             llm_pipeline=llm_pipeline,
             context=dataset.next(),
             create_reference=create_reference,
+            create_query=create_query,
         )
 
     else:
@@ -17,18 +17,17 @@
 #  THE SOFTWARE.
 
 import time
-import sys
+import torch
 import asyncio
-import numpy as np
 import bittensor as bt
 import traceback
+from functools import partial
 from typing import List, Dict, Awaitable
 from prompting.agent import HumanAgent
 from prompting.dendrite import DendriteResponseEvent
-from prompting.conversation import create_task
 from prompting.protocol import StreamPromptingSynapse
 from prompting.rewards import RewardResult
-from prompting.utils.uids import get_random_uids
+from prompting.utils.uids import reserve_uids
 from prompting.utils.logging import log_event
 from prompting.utils.misc import async_log, serialize_exception_to_string
 from dataclasses import dataclass
@@ -131,6 +130,10 @@ async def handle_response(responses: Dict[int, Awaitable]) -> List[StreamResult]
 
 @async_log
 async def generate_reference(agent: HumanAgent):
+    # Async pipelines generate on their own engine loop, and the request is aborted if the forward is cancelled
+    if hasattr(agent.llm_pipeline, "agenerate"):
+        return await agent.task.agenerate_reference(agent.llm_pipeline)
+
     loop = asyncio.get_running_loop()
     result = await loop.run_in_executor(
         None, agent.task.generate_reference, agent.llm_pipeline
@@ -187,8 +190,21 @@ async def run_step(
 
     # Record event start time.
     start_time = time.time()
-    # Get the list of uids to query for this step.
-    uids = get_random_uids(self, k=k, exclude=exclude or []).to(self.device)
+    # Get the list of uids to query for this step, skipping uids that concurrent forwards are already querying.
+    uids = await reserve_uids(self, k=k, exclude=exclude or [])
+    try:
+        return await query_and_reward(
+            self, agent=agent, uids=uids, timeout=timeout, start_time=start_time
+        )
+    finally:
+        self.uids_in_flight.difference_update(uids.tolist())
+
+
+async def query_and_reward(
+    self, agent: HumanAgent, uids: torch.LongTensor, timeout: float, start_time: float
+):
+    """Queries the given uids with the agent challenge, rewards their responses and updates the scores."""
+    uids = uids.to(self.device)
     uids_cpu = uids.cpu().tolist()
 
     axons = [self.metagraph.axons[uid] for uid in uids]
@@ -207,7 +223,8 @@ async def run_step(
         handle_response(responses=dict(zip(uids_cpu, streams_responses)))
     )
 
-    if not agent.task.static_reference:
+    # The reference may already have been generated in a batch by the task queue
+    if not agent.task.static_reference and not agent.task.reference:
         reference_generation_task = generate_reference(agent)
         _, stream_results = await asyncio.gather(
             reference_generation_task, handle_stream_responses_task
@@ -227,11 +244,17 @@ async def run_step(
     bt.logging.info(f"Created DendriteResponseEvent:\n {response_event}")
     # Reward the responses and get the reward result (dataclass)
     # This contains a list of RewardEvents but can be exported as a dict (column-wise) for logging etc
-    reward_result = RewardResult(
-        self.reward_pipeline,
-        agent=agent,
-        response_event=response_event,
-        device=self.device,
+    # The reward models run on their own executors, and waiting for them must not block the other forwards
+    loop = asyncio.get_running_loop()
+    reward_result = await loop.run_in_executor(
+        None,
+        partial(
+            RewardResult,
+            self.reward_pipeline,
+            agent=agent,
+            response_event=response_event,
+            device=self.device,
+        ),
     )
     bt.logging.info(f"Created RewardResult:\n {reward_result}")
 
@@ -266,33 +289,9 @@ async def forward(self):
     bt.logging.info("🚀 Starting forward loop...")
     forward_start_time = time.time()
 
-    while True:
-        bt.logging.info(
-            f"📋 Selecting task... from {self.config.neuron.tasks} with distribution {self.config.neuron.task_p}"
-        )
-        # Create a specific task
-        task_name = np.random.choice(
-            self.config.neuron.tasks, p=self.config.neuron.task_p
-        )
-        bt.logging.info(f"📋 Creating {task_name} task... ")
-        try:
-            task = create_task(
-                llm_pipeline=self.llm_pipeline,
-                task_name=task_name,
-                create_reference=False,
-            )
-            break
-        except Exception as e:
-            bt.logging.error(
-                f"Failed to create {task_name} task. {sys.exc_info()}. Skipping to next task."
-            )
-            continue
-
-    # Create random agent with task, topic, profile...
-    bt.logging.info(f"🤖 Creating agent for {task_name} task... ")
-    agent = HumanAgent(
-        task=task, llm_pipeline=self.llm_pipeline, begin_conversation=True
-    )
+    # Pop an agent whose task and challenge were prepared in the background
+    agent = await self.task_queue.get()
+    task = agent.task
 
     rounds = 0
     exclude_uids = []
@@ -311,12 +310,16 @@ async def forward(self):
 
             # Adds forward time to event and logs it to wandb
             event["forward_time"] = time.time() - forward_start_time
+            event.update(self.task_queue.__state_dict__())
             log_event(self, event)
 
             exclude_uids += event["uids"]
             task.complete = True
 
             rounds += 1
+        except asyncio.CancelledError:
+            # Forward timeouts cancel the whole forward, so the cancellation must not be swallowed here.
+            raise
         except BaseException as e:
             unexpected_errors = serialize_exception_to_string(e)
             bt.logging.error(
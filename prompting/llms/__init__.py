@@ -4,5 +4,14 @@ from .hf import (
     HuggingFacePipeline,
     HuggingFaceLLM,
     CustomTextIteratorStreamer,
+    CancellationCriteria,
 )
-from .vllm_llm import vLLM_LLM, vLLMPipeline, load_vllm_pipeline
+from .vllm_llm import (
+    vLLM_LLM,
+    vLLMPipeline,
+    AsyncvLLMPipeline,
+    load_vllm_pipeline,
+    batch_query,
+)
+from .batching import BatchingPipeline
+from .continuous_batching import ContinuousBatchingScheduler
@@ -9,6 +9,23 @@ class BasePipeline(ABC):
     def __call__(self, composed_prompt: str, **kwargs: dict) -> Any:
         ...
 
+    def generate_batch(
+        self, composed_prompts: List[str], model_kwargs: List[dict]
+    ) -> List[Any]:
+        """Generates a response for each prompt. Pipelines which can batch requests should override this.
+
+        Args:
+            composed_prompts (List[str]): The prompts to generate responses for.
+            model_kwargs (List[dict]): The generation kwargs for each prompt.
+
+        Returns:
+            List[Any]: The responses, in the same order as the prompts.
+        """
+        return [
+            self(composed_prompt, **kwargs)
+            for composed_prompt, kwargs in zip(composed_prompts, model_kwargs)
+        ]
+
 
 class BaseLLM(ABC):
     def __init__(
@@ -0,0 +1,138 @@
+import time
+import threading
+import bittensor as bt
+from typing import Any, Dict, List
+from prompting.llms.base_llm import BasePipeline
+
+
+class _Request:
+    def __init__(self, composed_prompt: str, model_kwargs: Dict):
+        self.composed_prompt = composed_prompt
+        self.model_kwargs = model_kwargs
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class BatchingPipeline(BasePipeline):
+    """Wraps a pipeline so that concurrent calls from several threads are generated together.
+
+    Requests are collected for up to `window` seconds after the first one arrives, or until `max_batch_size` requests
+    are pending, and are then generated with a single `generate_batch` call on the wrapped pipeline. Callers block
+    until their own response is ready, so the `__call__` interface is unchanged. The prompts of `generate_batch` calls
+    are queued in the same way, so that they are batched with concurrent calls and the wrapped pipeline is only ever
+    called from the dispatcher thread.
+    """
+
+    def __init__(
+        self, llm_pipeline: BasePipeline, window: float = 0.01, max_batch_size: int = 16
+    ):
+        super().__init__()
+        self.llm_pipeline = llm_pipeline
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self.pending: List[_Request] = []
+        self.condition = threading.Condition()
+        self.dispatcher = None
+
+        # Statistics used for tuning the window and batch size
+        self.num_batches = 0
+        self.num_requests = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.llm_pipeline!r}, window={self.window}, max_batch_size={self.max_batch_size})"
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes which are not found on the wrapper, e.g. the tokenizer of the wrapped pipeline
+        if name == "llm_pipeline":
+            raise AttributeError(name)
+        return getattr(self.llm_pipeline, name)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.num_requests / self.num_batches if self.num_batches else 0
+
+    def start(self):
+        """Starts the dispatcher thread if it is not running yet."""
+        with self.condition:
+            if self.dispatcher is None or not self.dispatcher.is_alive():
+                self.dispatcher = threading.Thread(
+                    target=self.dispatch, name="llm_batch_dispatcher", daemon=True
+                )
+                self.dispatcher.start()
+
+    def submit(self, requests: List[_Request]) -> List[Any]:
+        """Queues the requests for the dispatcher and waits for their responses."""
+        self.start()
+        with self.condition:
+            self.pending.extend(requests)
+            self.condition.notify_all()
+
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+        return [request.response for request in requests]
+
+    def __call__(self, composed_prompt: str, **model_kwargs: Dict) -> Any:
+        return self.submit([_Request(composed_prompt, model_kwargs)])[0]
+
+    def generate_batch(
+        self, composed_prompts: List[str], model_kwargs: List[Dict]
+    ) -> List[Any]:
+        return self.submit(
+            [
+                _Request(composed_prompt, kwargs)
+                for composed_prompt, kwargs in zip(composed_prompts, model_kwargs)
+            ]
+        )
+
+    def next_batch(self) -> List[_Request]:
+        """Waits for a request, then keeps collecting requests until the window closes or the batch is full."""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+
+            deadline = time.time() + self.window
+            while len(self.pending) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.pending[: self.max_batch_size]
+            self.pending = self.pending[self.max_batch_size :]
+            return batch
+
+    def dispatch(self):
+        """Dispatcher loop which generates the pending requests in batches and hands the responses back."""
+        while True:
+            batch = self.next_batch()
+            try:
+                responses = self.llm_pipeline.generate_batch(
+                    [request.composed_prompt for request in batch],
+                    [request.model_kwargs for request in batch],
+                )
+                if len(responses) != len(batch):
+                    raise ValueError(
+                        f"{self.llm_pipeline!r} returned {len(responses)} responses for {len(batch)} requests"
+                    )
+                for request, response in zip(batch, responses):
+                    request.response = response
+            except Exception as e:
+                bt.logging.error(
+                    f"Batched generation of {len(batch)} requests failed: {e}"
+                )
+                for request in batch:
+                    request.error = e
+            except BaseException as e:
+                # The dispatcher stops, and is restarted by the next call, but the callers must not wait forever
+                for request in batch:
+                    request.error = e
+                raise
+            finally:
+                self.num_batches += 1
+                self.num_requests += len(batch)
+                for request in batch:
+                    request.done.set()
@@ -0,0 +1,333 @@
+import torch
+import threading
+import bittensor as bt
+from typing import List, Tuple
+from transformers import (
+    LogitsProcessorList,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+from prompting.llms.hf import CancellationCriteria, CustomTextIteratorStreamer
+
+
+class _Sequence:
+    def __init__(
+        self,
+        input_ids: torch.Tensor,
+        streamer: CustomTextIteratorStreamer,
+        max_new_tokens: int,
+        do_sample: bool,
+        temperature: float,
+        top_k: int,
+        top_p: float,
+        deadline: float,
+    ):
+        self.input_ids = input_ids
+        self.streamer = streamer
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = do_sample
+        self.stopping_criteria = CancellationCriteria(streamer.cancelled, deadline)
+
+        self.warpers = LogitsProcessorList()
+        if do_sample:
+            if temperature != 1.0:
+                self.warpers.append(TemperatureLogitsWarper(temperature))
+            if top_k:
+                self.warpers.append(TopKLogitsWarper(int(top_k)))
+            if top_p < 1.0:
+                self.warpers.append(TopPLogitsWarper(top_p))
+
+        # The token which was sampled last and is fed to the model at the next step, and the number of tokens of the
+        # sequence in the KV cache, which is the position of that token
+        self.next_token: int = None
+        self.position = input_ids.shape[-1]
+        self.num_generated_tokens = 0
+
+    @property
+    def reserved_tokens(self) -> int:
+        """The length of the sequence if it generates all of its tokens."""
+        return self.input_ids.shape[-1] + self.max_new_tokens
+
+    def sample(self, logits: torch.Tensor) -> int:
+        """Samples the next token from the logits of the last position, of shape (vocab_size,)."""
+        if not self.do_sample:
+            return int(logits.argmax())
+        scores = self.warpers(self.input_ids, logits[None].float())
+        return int(torch.multinomial(torch.softmax(scores, dim=-1), 1))
+
+
+class ContinuousBatchingScheduler:
+    """Generates the requests of concurrent callers in one shared decoding batch.
+
+    Each request is prefilled on its own and then joins the batch at the next token boundary, so that a request does
+    not wait for the longest one of a batch to finish. At each step the model decodes one token of every sequence of
+    the batch, and each token is put in the streamer of its request. Finished and cancelled sequences leave the batch
+    at once.
+
+    The KV cache of the batch is left-padded to its longest sequence. A request is only admitted while the cache would
+    fit in `max_kv_bytes` if every sequence generated all of its tokens.
+
+    Args:
+        model: A causal language model of transformers whose KV cache is a tuple of (key, value) per layer, each of
+            shape (batch_size, num_heads, seq_len, head_dim).
+        tokenizer: Its tokenizer.
+        max_batch_size (int, optional): The maximum number of sequences in the batch. Defaults to 8.
+        max_kv_bytes (int, optional): The maximum size of the KV cache of the batch. Defaults to None, which only
+            limits the batch size.
+    """
+
+    def __init__(
+        self, model, tokenizer, max_batch_size: int = 8, max_kv_bytes: int = None
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_kv_bytes = max_kv_bytes
+
+        config = model.config
+        num_heads = config.num_attention_heads
+        num_kv_heads = getattr(config, "num_key_value_heads", None) or num_heads
+        self.kv_bytes_per_token = (
+            2
+            * config.num_hidden_layers
+            * num_kv_heads
+            * (config.hidden_size // num_heads)
+            * torch.finfo(model.dtype).bits
+            // 8
+        )
+
+        self.pending: List[_Sequence] = []
+        self.active: List[_Sequence] = []
+        self.past_key_values: Tuple[Tuple[torch.Tensor, torch.Tensor]] = None
+        self.attention_mask: torch.Tensor = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+        # Statistics used for tuning the batch size and memory cap
+        self.num_steps = 0
+        self.num_decoded_tokens = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(max_batch_size={self.max_batch_size}, max_kv_bytes={self.max_kv_bytes})"
+
+    @property
+    def device(self) -> torch.device:
+        return self.model.device
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.num_decoded_tokens / self.num_steps if self.num_steps else 0
+
+    def start(self) -> "ContinuousBatchingScheduler":
+        """Starts the decoding thread if it is not running, or if it stopped."""
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="continuous_batching", daemon=True
+                )
+                self.thread.start()
+        return self
+
+    def submit(
+        self,
+        prompt: str,
+        max_new_tokens: int = 256,
+        do_sample: bool = True,
+        temperature: float = 0.7,
+        top_k: int = 50,
+        top_p: float = 0.95,
+        deadline: float = None,
+        **kwargs,
+    ) -> CustomTextIteratorStreamer:
+        """Queues the prompt for generation.
+
+        Args:
+            prompt (str): The composed prompt.
+            deadline (float, optional): Time since the epoch at which generation stops. Defaults to None.
+
+        Returns:
+            CustomTextIteratorStreamer: Streamer of the generated text, which can also cancel the generation.
+        """
+        input_ids = self.tokenizer(
+            prompt, add_special_tokens=False, return_tensors="pt"
+        )["input_ids"]
+        streamer = CustomTextIteratorStreamer(self.tokenizer, skip_prompt=True)
+        streamer.put(input_ids)
+        sequence = _Sequence(
+            input_ids.to(self.device),
+            streamer,
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_k=top_k,
+            top_p=top_p,
+            deadline=deadline,
+        )
+
+        with self.condition:
+            self.pending.append(sequence)
+            # Under the lock, so that a thread which is stopping either ends the sequence or is replaced
+            self.start()
+            self.condition.notify_all()
+        return streamer
+
+    def fits(self, sequences: List[_Sequence]) -> bool:
+        """Whether the sequences fit in one batch until all of them are finished."""
+        if len(sequences) > self.max_batch_size:
+            return False
+        # A sequence which does not fit on its own is still generated alone, so that it is not queued forever
+        if self.max_kv_bytes is None or len(sequences) == 1:
+            return True
+        max_length = max(sequence.reserved_tokens for sequence in sequences)
+        kv_bytes = len(sequences) * max_length * self.kv_bytes_per_token
+        return kv_bytes <= self.max_kv_bytes
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.active:
+                    self.condition.wait()
+                admitted = []
+                while self.pending and self.fits(
+                    self.active + admitted + self.pending[:1]
+                ):
+                    admitted.append(self.pending.pop(0))
+
+            try:
+                for sequence in admitted:
+                    self.prefill(sequence)
+                if self.active:
+                    self.decode()
+            except BaseException as e:
+                bt.logging.error(f"Continuous batching failed: {e}")
+                # The cache is reset, so every streamer is ended, including those still waiting to be admitted
+                with self.condition:
+                    failed = self.active + admitted + self.pending
+                    self.pending = []
+                    self.active = []
+                    self.past_key_values = None
+                    self.attention_mask = None
+                    # The thread stops on exits and interrupts, and is restarted by the next submit
+                    if not isinstance(e, Exception):
+                        self.thread = None
+                for sequence in failed:
+                    if not sequence.streamer.ended:
+                        sequence.streamer.error = e
+                        self.finish(sequence)
+                if not isinstance(e, Exception):
+                    raise
+
+    @torch.no_grad()
+    def prefill(self, sequence: _Sequence):
+        """Encodes the prompt of the sequence and adds it to the batch."""
+        outputs = self.model(input_ids=sequence.input_ids, use_cache=True)
+        if not self.accept(sequence, outputs.logits[0, -1]):
+            return
+
+        attention_mask = torch.ones_like(sequence.input_ids)
+        if not self.active:
+            self.past_key_values = outputs.past_key_values
+            self.attention_mask = attention_mask
+        else:
+            self.past_key_values, self.attention_mask = self.concat(
+                (self.past_key_values, self.attention_mask),
+                (outputs.past_key_values, attention_mask),
+            )
+        self.active.append(sequence)
+
+    @staticmethod
+    def concat(*caches) -> Tuple[tuple, torch.Tensor]:
+        """Concatenates the KV caches and attention masks of batches, left-padded to the longest one."""
+        length = max(attention_mask.shape[1] for _, attention_mask in caches)
+
+        def pad(tensor: torch.Tensor, dim: int) -> torch.Tensor:
+            shape = list(tensor.shape)
+            shape[dim] = length - tensor.shape[dim]
+            return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+        past_key_values = tuple(
+            tuple(
+                torch.cat([pad(cache[layer][i], dim=2) for cache, _ in caches])
+                for i in range(2)
+            )
+            for layer in range(len(caches[0][0]))
+        )
+        attention_mask = torch.cat([pad(mask, dim=1) for _, mask in caches])
+        return past_key_values, attention_mask
+
+    @torch.no_grad()
+    def decode(self):
+        """Generates one token of every sequence of the batch."""
+        input_ids = torch.tensor(
+            [[sequence.next_token] for sequence in self.active], device=self.device
+        )
+        position_ids = torch.tensor(
+            [[sequence.position] for sequence in self.active], device=self.device
+        )
+        attention_mask = torch.cat(
+            [self.attention_mask, self.attention_mask.new_ones(len(self.active), 1)],
+            dim=1,
+        )
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self.past_key_values,
+            use_cache=True,
+        )
+        self.num_steps += 1
+        self.num_decoded_tokens += len(self.active)
+
+        keep = []
+        for i, sequence in enumerate(self.active):
+            sequence.position += 1
+            if self.accept(sequence, outputs.logits[i, -1]):
+                keep.append(i)
+
+        self.past_key_values = outputs.past_key_values
+        self.attention_mask = attention_mask
+        if len(keep) < len(self.active):
+            self.evict(keep)
+
+    def evict(self, keep: List[int]):
+        """Removes the sequences which are not kept from the batch, and the padding which only they needed."""
+        self.active = [self.active[i] for i in keep]
+        if not self.active:
+            self.past_key_values = None
+            self.attention_mask = None
+            return
+
+        index = torch.tensor(keep, device=self.device)
+        attention_mask = self.attention_mask.index_select(0, index)
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        self.attention_mask = attention_mask[:, start:]
+        self.past_key_values = tuple(
+            tuple(tensor.index_select(0, index)[:, :, start:] for tensor in layer_cache)
+            for layer_cache in self.past_key_values
+        )
+
+    def accept(self, sequence: _Sequence, logits: torch.Tensor) -> bool:
+        """Samples the next token of the sequence and streams it.
+
+        Returns:
+            bool: Whether the sequence continues.
+        """
+        token = sequence.sample(logits)
+        sequence.num_generated_tokens += 1
+        finished = (
+            token == self.tokenizer.eos_token_id
+            or sequence.num_generated_tokens >= sequence.max_new_tokens
+            or sequence.stopping_criteria(None, None)
+        )
+        if token != self.tokenizer.eos_token_id:
+            sequence.streamer.put(torch.tensor([token]))
+        sequence.next_token = token
+
+        if finished:
+            self.finish(sequence)
+        return not finished
+
+    def finish(self, sequence: _Sequence):
+        if not sequence.streamer.ended:
+            sequence.streamer.end()
@@ -16,10 +16,12 @@
 # DEALINGS IN THE SOFTWARE.
 
 import time
-from typing import List, Dict
+import threading
+from typing import Callable, List, Dict, Optional
 import bittensor as bt
 
 from transformers import Pipeline, pipeline, AutoTokenizer, TextIteratorStreamer
+from transformers import StoppingCriteria, StoppingCriteriaList
 from prompting.mock import MockPipeline
 from prompting.cleaners.cleaner import CleanerPipeline
 from transformers import pipeline, TextIteratorStreamer, AutoTokenizer
@@ -34,8 +36,100 @@ class CustomTextIteratorStreamer(TextIteratorStreamer):
     TextIteratorStreamer has internal methods to raise a StopIteration if a stop signal is received
     (stop signal is when the value returned from the Queue is None), but this is not flexible enough.
     Therefore, we add methods to check and clean the queue manually.
+
+    Generation runs in a background thread which is started with `start`, so that text can be consumed while it is
+    generated. The thread is joined when the stream is exhausted, and an exception raised by the generation is raised
+    to the consumer after the text generated before it. Generation which is started with a CancellationCriteria of
+    the streamer stops at the next token after `cancel` is called.
     """
 
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.thread: threading.Thread = None
+        self.error: Exception = None
+        self.ended = False
+        self.cancelled = threading.Event()
+        # The composed prompt, which the stream starts with unless skip_prompt is set
+        self.prompt: str = None
+
+        # The first tokens put in the streamer are the prompt
+        self.prompt_received = False
+        self.num_generated_tokens = 0
+        self.first_token_time: float = None
+        self.last_token_time: float = None
+
+    def put(self, value):
+        if self.prompt_received:
+            now = time.time()
+            self.num_generated_tokens += value.shape[-1]
+            if self.first_token_time is None:
+                self.first_token_time = now
+            self.last_token_time = now
+        self.prompt_received = True
+        super().put(value)
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """The decoding rate after the first generated token, or None if too few tokens were generated to measure it."""
+        if (
+            self.num_generated_tokens < 2
+            or self.last_token_time == self.first_token_time
+        ):
+            return None
+        return (self.num_generated_tokens - 1) / (
+            self.last_token_time - self.first_token_time
+        )
+
+    @property
+    def max_echo_length(self) -> int:
+        """The number of characters at the start of the stream which may be an echo of the prompt."""
+        if self.skip_prompt or self.prompt is None:
+            return 0
+        # Decoding may add spaces around special tokens
+        return 2 * len(self.prompt)
+
+    def cancel(self):
+        """Asks the generation to stop, e.g. because nobody will read the rest of the text."""
+        self.cancelled.set()
+
+    def end(self):
+        super().end()
+        self.ended = True
+
+    def start(
+        self, generate: Callable, *args, **kwargs
+    ) -> "CustomTextIteratorStreamer":
+        """Calls generate(*args, streamer=self, **kwargs) in a background thread and returns immediately."""
+
+        def run():
+            try:
+                generate(*args, streamer=self, **kwargs)
+            except Exception as e:
+                self.error = e
+            finally:
+                # The consumer stops waiting for text if generation failed or did not end the stream
+                if not self.ended:
+                    self.end()
+
+        self.thread = threading.Thread(target=run, name="hf_generation", daemon=True)
+        self.thread.start()
+        return self
+
+    def __next__(self):
+        try:
+            return super().__next__()
+        except StopIteration:
+            self.join()
+            raise
+
+    def join(self, timeout: float = None):
+        """Waits for the generation thread to finish, and raises the exception of the generation if it failed."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
     def has_data(self):
         """Check if the queue has data."""
         return not self.text_queue.empty()
@@ -46,6 +140,24 @@ class CustomTextIteratorStreamer(TextIteratorStreamer):
             self.text_queue.queue.clear()
 
 
+class CancellationCriteria(StoppingCriteria):
+    """Stops generation when the streamer is cancelled or the deadline passes.
+
+    Args:
+        cancelled (threading.Event): Event which is set to cancel the generation.
+        deadline (float, optional): Time since the epoch after which nobody reads the text. Defaults to None.
+    """
+
+    def __init__(self, cancelled: threading.Event, deadline: float = None):
+        self.cancelled = cancelled
+        self.deadline = deadline
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.cancelled.is_set() or (
+            self.deadline is not None and time.time() > self.deadline
+        )
+
+
 def load_hf_pipeline(
     model_id: str,
     device=None,
@@ -188,15 +300,48 @@ class HuggingFaceLLM(BaseLLM):
         self,
         message: str,
         role: str = "user",
-    ):
+        deadline: float = None,
+        tokens_per_second: float = None,
+        scheduler=None,
+    ) -> CustomTextIteratorStreamer:
+        """Starts generating a response to the message, and returns a streamer of its text.
+
+        Args:
+            message (str): The message to respond to.
+            role (str, optional): Role of the message. Defaults to "user".
+            deadline (float, optional): Time since the epoch at which generation stops. Defaults to None.
+            tokens_per_second (float, optional): Measured decoding rate, which limits max_new_tokens to what can be
+                generated before the deadline. Defaults to None.
+            scheduler (ContinuousBatchingScheduler, optional): If given, the response is generated in the shared
+                decoding batch of the scheduler instead of by the pipeline. Defaults to None.
+
+        Returns:
+            CustomTextIteratorStreamer: The streamer, which can also cancel the generation.
+        """
         messages = self.messages + [{"content": message, "role": role}]
         prompt = self._make_prompt(messages)
 
         bt.logging.debug("Starting LLM streaming process...")
+        model_kwargs = dict(self.model_kwargs)
+        if deadline is not None and tokens_per_second:
+            budget = int(tokens_per_second * (deadline - time.time()))
+            model_kwargs["max_new_tokens"] = max(
+                1, min(model_kwargs["max_new_tokens"], budget)
+            )
+
+        if scheduler is not None:
+            streamer = scheduler.submit(prompt, deadline=deadline, **model_kwargs)
+            streamer.prompt = prompt
+            return streamer
+
         streamer = CustomTextIteratorStreamer(tokenizer=self.llm_pipeline.tokenizer)
-        _ = self.llm_pipeline(prompt, streamer=streamer, **self.model_kwargs)
+        streamer.prompt = prompt
+        model_kwargs["stopping_criteria"] = StoppingCriteriaList(
+            [CancellationCriteria(streamer.cancelled, deadline)]
+        )
 
-        return streamer
+        # Tokens are put in the streamer while they are generated, so the caller can send them right away
+        return streamer.start(self.llm_pipeline, prompt, **model_kwargs)
 
     def __call__(self, messages: List[Dict[str, str]]):
         return self.forward(messages=messages)
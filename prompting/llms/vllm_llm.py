@@ -16,10 +16,13 @@
 # DEALINGS IN THE SOFTWARE.
 import gc
 import time
+import uuid
+import asyncio
+import threading
 import torch
 import bittensor as bt
-from typing import List, Dict
-from vllm import LLM, SamplingParams
+from typing import Any, AsyncIterator, Callable, Dict, List
+from vllm import LLM, SamplingParams, AsyncLLMEngine, AsyncEngineArgs
 from prompting.cleaners.cleaner import CleanerPipeline
 from prompting.llms import BasePipeline, BaseLLM
 from prompting.mock import MockPipeline
@@ -38,11 +41,13 @@ def clean_gpu_cache():
     torch.cuda.synchronize()
 
 
-def load_vllm_pipeline(model_id: str, device: str, mock=False):
-    """Loads the VLLM pipeline for the LLM, or a mock pipeline if mock=True"""
-    if mock or model_id == "mock":
-        return MockPipeline(model_id)
+def load_with_memory_retry(load: Callable[[float], Any], device: str):
+    """Loads a vLLM engine within 20GB of GPU, and retries within 24GB after cleaning up the GPU if that fails.
 
+    Args:
+        load (Callable[[float], Any]): Loads the engine with the given gpu memory utilization.
+        device (str): The device of the engine.
+    """
     # Calculates the gpu memory utilization required to run the model within 20GB of GPU
     max_allowed_memory_in_gb = 20
     max_allowed_memory_allocation_in_bytes = max_allowed_memory_in_gb * 1e9
@@ -52,7 +57,7 @@ def load_vllm_pipeline(model_id: str, device: str, mock=False):
 
     try:
         # Attempt to initialize the LLM
-        return LLM(model=model_id, gpu_memory_utilization=gpu_mem_utilization)
+        return load(gpu_mem_utilization)
     except ValueError as e:
         bt.logging.error(
             f"Error loading the VLLM pipeline within {max_allowed_memory_in_gb}GB: {e}"
@@ -79,7 +84,7 @@ def load_vllm_pipeline(model_id: str, device: str, mock=False):
         )
 
         # Attempt to initialize the LLM again with increased memory allocation
-        return LLM(model=model_id, gpu_memory_utilization=gpu_mem_utilization)
+        return load(gpu_mem_utilization)
     except Exception as e:
         bt.logging.error(
             f"Error loading the VLLM pipeline within {max_allowed_memory_in_gb_second_attempt}GB: {e}"
@@ -87,28 +92,218 @@ def load_vllm_pipeline(model_id: str, device: str, mock=False):
         raise e
 
 
+def load_vllm_pipeline(model_id: str, device: str, mock=False):
+    """Loads the VLLM pipeline for the LLM, or a mock pipeline if mock=True"""
+    if mock or model_id == "mock":
+        return MockPipeline(model_id)
+
+    return load_with_memory_retry(
+        lambda gpu_mem_utilization: LLM(
+            model=model_id, gpu_memory_utilization=gpu_mem_utilization
+        ),
+        device,
+    )
+
+
 class vLLMPipeline(BasePipeline):
     def __init__(self, model_id: str, device: str = None, mock=False):
         super().__init__()
         self.llm = load_vllm_pipeline(model_id, device, mock)
         self.mock = mock
+        # The offline vLLM engine is not thread-safe, and concurrent forwards call it from several threads
+        self.lock = threading.Lock()
+
+    def _make_sampling_params(self, model_kwargs: Dict) -> SamplingParams:
+        return SamplingParams(
+            temperature=model_kwargs.get("temperature", 0.8),
+            top_p=model_kwargs.get("top_p", 0.95),
+            max_tokens=model_kwargs.get("max_tokens", 256),
+        )
 
     def __call__(self, composed_prompt: str, **model_kwargs: Dict) -> str:
         if self.mock:
             return self.llm(composed_prompt, **model_kwargs)
 
-        # Compose sampling params
-        temperature = model_kwargs.get("temperature", 0.8)
-        top_p = model_kwargs.get("top_p", 0.95)
-        max_tokens = model_kwargs.get("max_tokens", 256)
-
-        sampling_params = SamplingParams(
-            temperature=temperature, top_p=top_p, max_tokens=max_tokens
-        )
-        output = self.llm.generate(composed_prompt, sampling_params, use_tqdm=True)
+        sampling_params = self._make_sampling_params(model_kwargs)
+        with self.lock:
+            output = self.llm.generate(composed_prompt, sampling_params, use_tqdm=True)
         response = output[0].outputs[0].text
         return response
 
+    def generate_batch(
+        self, composed_prompts: List[str], model_kwargs: List[Dict]
+    ) -> List[str]:
+        """Generates responses for many prompts with as few calls to the engine as possible.
+        `LLM.generate` takes a single set of sampling params, so prompts are grouped by their sampling params and
+        each group is sent in one call.
+
+        Args:
+            composed_prompts (List[str]): The prompts to generate responses for.
+            model_kwargs (List[Dict]): The generation kwargs for each prompt.
+
+        Returns:
+            List[str]: The responses, in the same order as the prompts.
+        """
+        if self.mock:
+            return [
+                self.llm(composed_prompt, **kwargs)
+                for composed_prompt, kwargs in zip(composed_prompts, model_kwargs)
+            ]
+
+        groups = {}
+        for i, kwargs in enumerate(model_kwargs):
+            sampling_params = self._make_sampling_params(kwargs)
+            key = (
+                sampling_params.temperature,
+                sampling_params.top_p,
+                sampling_params.max_tokens,
+            )
+            groups.setdefault(key, (sampling_params, []))[1].append(i)
+
+        responses = [None] * len(composed_prompts)
+        for sampling_params, indices in groups.values():
+            prompts = [composed_prompts[i] for i in indices]
+            with self.lock:
+                outputs = self.llm.generate(prompts, sampling_params, use_tqdm=False)
+            # vLLM returns the outputs in the order of the prompts
+            for i, output in zip(indices, outputs):
+                responses[i] = output.outputs[0].text
+
+        return responses
+
+
+def load_async_vllm_engine(model_id: str, device: str, mock=False):
+    """Loads the async vLLM engine for the LLM, or a mock pipeline if mock=True"""
+    if mock or model_id == "mock":
+        return MockPipeline(model_id)
+
+    return load_with_memory_retry(
+        lambda gpu_mem_utilization: AsyncLLMEngine.from_engine_args(
+            AsyncEngineArgs(model=model_id, gpu_memory_utilization=gpu_mem_utilization)
+        ),
+        device,
+    )
+
+
+class AsyncvLLMPipeline(vLLMPipeline):
+    """vLLM pipeline built on the async engine, which batches all in-flight requests continuously.
+
+    The engine runs on its own event loop in a background thread, so it can be used from the validator loop with
+    `agenerate` and `astream` as well as from worker threads with `__call__`. Cancelling `agenerate` or `astream`
+    aborts the request in the engine, so no GPU work is left running after a timeout.
+    """
+
+    def __init__(self, model_id: str, device: str = None, mock=False):
+        BasePipeline.__init__(self)
+        self.llm = load_async_vllm_engine(model_id, device, mock)
+        self.mock = mock
+
+        self.loop = None
+        if not self.mock:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self.loop.run_forever, name="vllm_engine_loop", daemon=True
+            ).start()
+
+    async def _stream(
+        self, composed_prompt: str, model_kwargs: Dict
+    ) -> AsyncIterator[str]:
+        """Yields the newly generated text of the request. Runs on the engine loop."""
+        request_id = str(uuid.uuid4())
+        sampling_params = self._make_sampling_params(model_kwargs)
+        generated = ""
+        try:
+            async for output in self.llm.generate(
+                composed_prompt, sampling_params, request_id
+            ):
+                text = output.outputs[0].text
+                yield text[len(generated) :]
+                generated = text
+        finally:
+            # The engine only aborts on exceptions and cancellation, not when the consumer stops early
+            await self.llm.abort(request_id)
+
+    async def _generate(self, composed_prompt: str, model_kwargs: Dict) -> str:
+        return "".join(
+            [chunk async for chunk in self._stream(composed_prompt, model_kwargs)]
+        )
+
+    async def agenerate(self, composed_prompt: str, **model_kwargs: Dict) -> str:
+        """Generates a response without blocking the calling event loop.
+
+        Args:
+            composed_prompt (str): The prompt to generate a response for.
+
+        Returns:
+            str: The generated response.
+        """
+        if self.mock:
+            return self.llm(composed_prompt, **model_kwargs)
+
+        # Cancelling the wrapping future cancels the request on the engine loop
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(
+                self._generate(composed_prompt, model_kwargs), self.loop
+            )
+        )
+
+    async def astream(
+        self, composed_prompt: str, **model_kwargs: Dict
+    ) -> AsyncIterator[str]:
+        """Streams the response as it is generated, without blocking the calling event loop.
+
+        Args:
+            composed_prompt (str): The prompt to generate a response for.
+
+        Yields:
+            str: The newly generated text.
+        """
+        if self.mock:
+            yield self.llm(composed_prompt, **model_kwargs)
+            return
+
+        stream = self._stream(composed_prompt, model_kwargs)
+        step = None
+        try:
+            while True:
+                step = asyncio.run_coroutine_threadsafe(stream.__anext__(), self.loop)
+                try:
+                    chunk = await asyncio.wrap_future(step)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        finally:
+            # A generator cannot be closed while it runs. A step which was cancelled with this generator ends the
+            # stream itself, as the cancellation runs the finally of _stream which aborts the request. Otherwise the
+            # stream is suspended between steps, or already finished, and is closed here.
+            if step is None or not step.cancelled():
+                asyncio.run_coroutine_threadsafe(stream.aclose(), self.loop)
+
+    def __call__(self, composed_prompt: str, **model_kwargs: Dict) -> str:
+        if self.mock:
+            return self.llm(composed_prompt, **model_kwargs)
+
+        return asyncio.run_coroutine_threadsafe(
+            self._generate(composed_prompt, model_kwargs), self.loop
+        ).result()
+
+    def generate_batch(
+        self, composed_prompts: List[str], model_kwargs: List[Dict]
+    ) -> List[str]:
+        if self.mock:
+            return super().generate_batch(composed_prompts, model_kwargs)
+
+        # Requests which are in flight together are batched by the engine
+        async def generate_all():
+            return await asyncio.gather(
+                *[
+                    self._generate(composed_prompt, kwargs)
+                    for composed_prompt, kwargs in zip(composed_prompts, model_kwargs)
+                ]
+            )
+
+        return asyncio.run_coroutine_threadsafe(generate_all(), self.loop).result()
+
 
 class vLLM_LLM(BaseLLM):
     def __init__(
@@ -149,6 +344,30 @@ class vLLM_LLM(BaseLLM):
 
         return response
 
+    async def aquery(
+        self,
+        message: str,
+        role: str = "user",
+        cleaner: CleanerPipeline = None,
+    ) -> str:
+        """Async equivalent of `query`, for pipelines which implement `agenerate`."""
+        messages = self.messages + [{"content": message, "role": role}]
+
+        t0 = time.time()
+        composed_prompt = self._make_prompt(messages)
+        response = await self.llm_pipeline.agenerate(
+            composed_prompt, **self.model_kwargs
+        )
+        bt.logging.info(
+            f"{self.__class__.__name__} generated the following output:\n{response}"
+        )
+        response = self.clean_response(cleaner, response)
+
+        self.messages = messages + [{"content": response, "role": "assistant"}]
+        self.times = self.times + [0, time.time() - t0]
+
+        return response
+
     def _make_prompt(self, messages: List[Dict[str, str]]):
         composed_prompt = ""
 
@@ -180,6 +399,55 @@ class vLLM_LLM(BaseLLM):
         return response
 
 
+def batch_query(
+    llms: List[vLLM_LLM],
+    messages: List[str],
+    cleaners: List[CleanerPipeline] = None,
+    role: str = "user",
+) -> List[str]:
+    """Equivalent to calling `llm.query(message, cleaner=cleaner)` for each llm, but all prompts are generated
+    with a single call to the pipeline of the first llm. All llms are expected to share the same pipeline.
+
+    Args:
+        llms (List[vLLM_LLM]): The llms to query, their messages and times are updated as in `query`.
+        messages (List[str]): The message sent to each llm.
+        cleaners (List[CleanerPipeline], optional): The cleaner applied to each response. Defaults to None.
+        role (str, optional): The role of the messages. Defaults to "user".
+
+    Returns:
+        List[str]: The cleaned responses, in the same order as the llms.
+    """
+    if not llms:
+        return []
+    if cleaners is None:
+        cleaners = [None] * len(llms)
+
+    conversations = [
+        llm.messages + [{"content": message, "role": role}]
+        for llm, message in zip(llms, messages)
+    ]
+    composed_prompts = [
+        llm._make_prompt(conversation) for llm, conversation in zip(llms, conversations)
+    ]
+
+    t0 = time.time()
+    responses = llms[0].llm_pipeline.generate_batch(
+        composed_prompts, [llm.model_kwargs for llm in llms]
+    )
+    bt.logging.info(f"Generated a batch of {len(responses)} outputs.")
+
+    cleaned_responses = []
+    for llm, conversation, cleaner, response in zip(
+        llms, conversations, cleaners, responses
+    ):
+        response = llm.clean_response(cleaner, response)
+        llm.messages = conversation + [{"content": response, "role": "assistant"}]
+        llm.times = llm.times + [0, time.time() - t0]
+        cleaned_responses.append(response)
+
+    return cleaned_responses
+
+
 if __name__ == "__main__":
     # Example usage
     llm_pipeline = vLLMPipeline(
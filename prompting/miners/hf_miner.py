@@ -24,10 +24,17 @@ from typing import Awaitable
 
 # Bittensor Miner Template:
 from prompting.protocol import StreamPromptingSynapse
-from prompting.llms import HuggingFaceLLM, HuggingFacePipeline, load_hf_pipeline
+from prompting.llms import (
+    HuggingFaceLLM,
+    HuggingFacePipeline,
+    CustomTextIteratorStreamer,
+    ContinuousBatchingScheduler,
+    load_hf_pipeline,
+)
 
 # import base miner class which takes care of most of the boilerplate
 from prompting.base.prompting_miner import BaseStreamPromptingMiner
+from prompting.miners.utils import EchoFilter, StreamingWriter, iterate_in_thread
 
 
 class HuggingFaceMiner(BaseStreamPromptingMiner):
@@ -85,8 +92,37 @@ class HuggingFaceMiner(BaseStreamPromptingMiner):
             model_kwargs=model_kwargs,
         )
 
+        self.scheduler = None
+        if self.config.neuron.continuous_batching:
+            if mock:
+                bt.logging.warning(
+                    "Continuous batching needs a model, and is not used with the mock pipeline."
+                )
+            else:
+                max_kv_cache_gb = self.config.neuron.max_kv_cache_gb
+                self.scheduler = ContinuousBatchingScheduler(
+                    self.llm_pipeline.pipeline.model,
+                    self.llm_pipeline.tokenizer,
+                    max_batch_size=self.config.neuron.max_batch_size,
+                    max_kv_bytes=int(max_kv_cache_gb * 2**30)
+                    if max_kv_cache_gb
+                    else None,
+                ).start()
+
         self.model_id = self.config.neuron.model_id
         self.system_prompt = self.config.neuron.system_prompt
+        # Moving average of the decoding rate, which budgets the tokens generated before the timeout
+        self.tokens_per_second = None
+
+    def update_tokens_per_second(self, streamer: CustomTextIteratorStreamer):
+        if streamer.tokens_per_second is None:
+            return
+        if self.tokens_per_second is None:
+            self.tokens_per_second = streamer.tokens_per_second
+        else:
+            self.tokens_per_second = (
+                0.9 * self.tokens_per_second + 0.1 * streamer.tokens_per_second
+            )
 
     def forward(self, synapse: StreamPromptingSynapse) -> Awaitable:
         async def _forward(
@@ -107,10 +143,15 @@ class HuggingFaceMiner(BaseStreamPromptingMiner):
                 send (Send): bittensor aiohttp send function to send the response back to the validator.
             """
 
-            buffer = []
-            temp_completion = ""  # for wandb logging
             timeout_reached = False
-            system_message = ""
+            streamer = None
+            writer = StreamingWriter(
+                send,
+                max_tokens=self.config.neuron.streaming_batch_size,
+                max_bytes=self.config.neuron.streaming_batch_bytes,
+                max_latency=self.config.neuron.streaming_max_latency,
+                start_time=init_time,
+            )
             bt.logging.debug(f"📧 Message received, forwarding synapse: {synapse}")
 
             try:
@@ -122,58 +163,35 @@ class HuggingFaceMiner(BaseStreamPromptingMiner):
                     temperature=self.config.neuron.temperature,
                     top_k=self.config.neuron.top_k,
                     top_p=self.config.neuron.top_p,
-                ).stream(message=prompt)
+                ).stream(
+                    message=prompt,
+                    deadline=init_time + timeout_threshold,
+                    tokens_per_second=self.tokens_per_second,
+                    scheduler=self.scheduler,
+                )
 
                 bt.logging.debug("Starting streaming loop...")
-                synapse_message = synapse.messages[-1]
-                for token in streamer:
-                    system_message += token
-
-                    buffer.append(token)
-                    system_message += "".join(buffer)
-
-                    if synapse_message in system_message:
-                        # Cleans system message and challenge from model response
-                        bt.logging.warning(
-                            f"Discarding initial system_prompt / user prompt inputs from generation..."
-                        )
-                        buffer = []
-                        system_message = ""
-                        continue
+                # Cleans system message and challenge from model response
+                echo_filter = EchoFilter(
+                    synapse.messages[-1], max_hold=streamer.max_echo_length
+                )
+                # The streamer blocks until the next token is generated, so it is read in a thread to keep the event
+                # loop free for sending and for other requests
+                async for token in iterate_in_thread(streamer):
+                    await writer.write(echo_filter.feed(token))
 
                     if time.time() - init_time > timeout_threshold:
                         bt.logging.debug(f"⏰ Timeout reached, stopping streaming")
                         timeout_reached = True
+                        streamer.cancel()
                         break
 
-                    if len(buffer) == self.config.neuron.streaming_batch_size:
-                        joined_buffer = "".join(buffer)
-                        temp_completion += joined_buffer
-                        # bt.logging.debug(f"Streamed tokens: {joined_buffer}")
-
-                        await send(
-                            {
-                                "type": "http.response.body",
-                                "body": joined_buffer.encode("utf-8"),
-                                "more_body": True,
-                            }
-                        )
-                        buffer = []
-
-                if (
-                    buffer and not timeout_reached
-                ):  # Don't send the last buffer of data if timeout.
-                    joined_buffer = "".join(buffer)
-                    temp_completion += joined_buffer
-                    # bt.logging.debug(f"Streamed tokens: {joined_buffer}")
-
-                    await send(
-                        {
-                            "type": "http.response.body",
-                            "body": joined_buffer.encode("utf-8"),
-                            "more_body": False,
-                        }
-                    )
+                if not timeout_reached:
+                    # Text held back by the filter is not an echo if the stream ended before the prompt was found
+                    await writer.write(echo_filter.flush())
+
+                # The text generated before a timeout is also sent, so that the partial response counts
+                await writer.close()
 
             except Exception as e:
                 bt.logging.error(f"Error in forward: {e}")
@@ -181,15 +199,23 @@ class HuggingFaceMiner(BaseStreamPromptingMiner):
                     self.should_exit = True
 
             finally:
-                # _ = task.result() # wait for thread to finish
+                if streamer is not None:
+                    # Nobody reads the rest of the generation after a timeout or if the validator disconnected, so
+                    # the GPU is freed for other requests
+                    streamer.cancel()
+                    self.update_tokens_per_second(streamer)
+
                 bt.logging.debug("Finishing streaming loop...")
                 bt.logging.debug("-" * 50)
                 bt.logging.debug(f"---->>> Received message:")
                 bt.logging.debug(synapse.messages[0])
                 bt.logging.debug("-" * 50)
                 bt.logging.debug(f"<<<----- Returned message:")
-                bt.logging.debug(temp_completion)
+                bt.logging.debug(writer.completion)
                 bt.logging.debug("-" * 50)
+                bt.logging.debug(
+                    f"Sent {writer.num_flushes} chunks, time to first token: {writer.time_to_first_token}"
+                )
 
                 synapse_latency = time.time() - init_time
 
@@ -197,8 +223,12 @@ class HuggingFaceMiner(BaseStreamPromptingMiner):
                     self.log_event(
                         timing=synapse_latency,
                         prompt=prompt,
-                        completion=temp_completion,
+                        completion=writer.completion,
                         system_prompt=self.system_prompt,
+                        extra_info={
+                            "num_flushes": writer.num_flushes,
+                            "time_to_first_token": writer.time_to_first_token,
+                        },
                     )
 
         # bt.logging.debug(f"📧 Message received, forwarding synapse: {synapse}")
@@ -29,7 +29,7 @@ from prompting.protocol import StreamPromptingSynapse
 
 # import base miner class which takes care of most of the boilerplate
 
-from prompting.miners.utils import OpenAIUtils
+from prompting.miners.utils import OpenAIUtils, StreamingWriter
 
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -86,45 +86,25 @@ class OpenAIMiner(BaseStreamPromptingMiner, OpenAIUtils):
             chain_formatter: Dict[str, str],
             send: Send,
         ):
-            buffer = []
-            temp_completion = ""  # for wandb logging
-            timeout_reached = False
+            writer = StreamingWriter(
+                send,
+                max_tokens=self.config.neuron.streaming_batch_size,
+                max_bytes=self.config.neuron.streaming_batch_bytes,
+                max_latency=self.config.neuron.streaming_max_latency,
+                start_time=init_time,
+            )
 
             try:
-                # Langchain built in streaming. 'astream' also available for async
-                for token in chain.stream(chain_formatter):
-                    buffer.append(token)
+                # Langchain built in streaming, which does not block the event loop so that the writer can flush on time
+                async for token in chain.astream(chain_formatter):
+                    await writer.write(token)
 
                     if time.time() - init_time > timeout_threshold:
                         bt.logging.debug(f"⏰ Timeout reached, stopping streaming")
-                        timeout_reached = True
                         break
 
-                    if len(buffer) == self.config.neuron.streaming_batch_size:
-                        joined_buffer = "".join(buffer)
-                        temp_completion += joined_buffer
-                        bt.logging.debug(f"Streamed tokens: {joined_buffer}")
-
-                        await send(
-                            {
-                                "type": "http.response.body",
-                                "body": joined_buffer.encode("utf-8"),
-                                "more_body": True,
-                            }
-                        )
-                        buffer = []
-
-                if (
-                    buffer and not timeout_reached
-                ):  # Don't send the last buffer of data if timeout.
-                    joined_buffer = "".join(buffer)
-                    await send(
-                        {
-                            "type": "http.response.body",
-                            "body": joined_buffer.encode("utf-8"),
-                            "more_body": False,
-                        }
-                    )
+                # The text generated before a timeout is also sent, so that the partial response counts
+                await writer.close()
 
             except Exception as e:
                 bt.logging.error(f"Error in forward: {e}")
@@ -132,13 +112,20 @@ class OpenAIMiner(BaseStreamPromptingMiner, OpenAIUtils):
                     self.should_exit = True
 
             finally:
+                bt.logging.debug(
+                    f"Sent {writer.num_flushes} chunks, time to first token: {writer.time_to_first_token}"
+                )
                 synapse_latency = time.time() - init_time
                 if self.config.wandb.on:
                     self.log_event(
                         timing=synapse_latency,
                         prompt=message,
-                        completion=temp_completion,
+                        completion=writer.completion,
                         system_prompt=self.system_prompt,
+                        extra_info={
+                            "num_flushes": writer.num_flushes,
+                            "time_to_first_token": writer.time_to_first_token,
+                        },
                     )
 
         bt.logging.debug(f"📧 Message received, forwarding synapse: {synapse}")
@@ -1,4 +1,8 @@
+import time
+import asyncio
 import bittensor as bt
+from starlette.types import Send
+from typing import AsyncIterator, Iterator, List
 
 
 class OpenAIUtils:
@@ -26,3 +30,208 @@ class OpenAIUtils:
             "accumulated_completion_tokens": self.accumulated_completion_tokens,
             "accumulated_total_cost": self.accumulated_total_cost,
         }
+
+
+async def iterate_in_thread(iterator: Iterator) -> AsyncIterator:
+    """Iterates over a blocking iterator, such as a streamer of a generation thread, without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        item = await loop.run_in_executor(None, next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+class EchoFilter:
+    """Removes the echo of the prompt from the start of a stream of text, for pipelines which stream their input.
+
+    The stream is searched for `pattern`, usually the last message of the prompt, with a streaming KMP matcher, so
+    each character is examined a constant number of times. Text is held back until the pattern is found, and then
+    everything up to the end of the pattern is dropped. If more than `max_hold` characters arrive without the pattern,
+    the stream does not echo the prompt and the held text is released.
+
+    Args:
+        pattern (str): Text which ends the echo.
+        max_hold (int): The number of characters after which the stream is assumed not to echo the prompt.
+    """
+
+    def __init__(self, pattern: str, max_hold: int):
+        self.pattern = pattern
+        self.max_hold = max_hold
+
+        # failure[i] is the length of the longest proper prefix of pattern[: i + 1] which is also its suffix
+        self.failure = [0] * len(pattern)
+        k = 0
+        for i in range(1, len(pattern)):
+            while k and pattern[i] != pattern[k]:
+                k = self.failure[k - 1]
+            if pattern[i] == pattern[k]:
+                k += 1
+            self.failure[i] = k
+
+        self.matched = 0
+        self.held: List[str] = []
+        self.held_length = 0
+        self.echo_found = False
+        self.passthrough = not pattern or max_hold <= 0
+
+    def feed(self, text: str) -> str:
+        """Returns the part of the text which is not an echo of the prompt, which may include held back text."""
+        if self.passthrough:
+            return text
+
+        for i, char in enumerate(text):
+            while self.matched and char != self.pattern[self.matched]:
+                self.matched = self.failure[self.matched - 1]
+            if char == self.pattern[self.matched]:
+                self.matched += 1
+            if self.matched == len(self.pattern):
+                bt.logging.debug("Discarding the echo of the prompt from the stream")
+                self.held = []
+                self.echo_found = True
+                self.passthrough = True
+                return text[i + 1 :]
+
+        self.held.append(text)
+        self.held_length += len(text)
+        if self.held_length > self.max_hold:
+            return self.flush()
+        return ""
+
+    def flush(self) -> str:
+        """Releases the held text, e.g. at the end of the stream. Later text is passed through."""
+        text = "".join(self.held)
+        self.held = []
+        self.passthrough = True
+        return text
+
+
+class StreamingWriter:
+    """Sends streamed text to the validator as HTTP body chunks.
+
+    Text is flushed on whichever comes first: `max_tokens` chunks of text, `max_bytes` bytes, or `max_latency` seconds
+    after the oldest unsent text arrived, so that slow generations still send their first tokens quickly and fast ones
+    do not send many tiny bodies. Sends run in the background. Text which arrives while a send is in flight is
+    coalesced into the next send.
+
+    Args:
+        send (Send): The send function of the streaming response.
+        max_tokens (int, optional): Number of chunks of text which are flushed together. Defaults to 12.
+        max_bytes (int, optional): Number of bytes which are flushed together. Defaults to 1024.
+        max_latency (float, optional): Seconds text waits before it is flushed. Defaults to 0.1.
+        start_time (float, optional): Time at which the request was received, for the time to first token. Defaults
+            to the time the writer is created.
+    """
+
+    def __init__(
+        self,
+        send: Send,
+        max_tokens: int = 12,
+        max_bytes: int = 1024,
+        max_latency: float = 0.1,
+        start_time: float = None,
+    ):
+        self.send = send
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.start_time = time.time() if start_time is None else start_time
+
+        self.buffer: List[str] = []
+        self.buffer_bytes = 0
+        # Time at which the oldest text of the buffer arrived
+        self.pending_since: float = None
+        self.sent: List[str] = []
+        self.sending: asyncio.Future = None
+        self.timer: asyncio.TimerHandle = None
+        self.error: Exception = None
+        self.closed = False
+
+        # Statistics of the request
+        self.num_flushes = 0
+        self.time_to_first_token: float = None
+
+    @property
+    def completion(self) -> str:
+        """The text which was sent."""
+        return "".join(self.sent)
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _due(self) -> bool:
+        return (
+            len(self.buffer) >= self.max_tokens
+            or self.buffer_bytes >= self.max_bytes
+            or time.time() - self.pending_since >= self.max_latency
+        )
+
+    def _schedule(self):
+        """Sends the buffer if it is due and no send is in flight, or sets a timer for when it is due."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.buffer or self.error is not None or self.closed:
+            return
+        if self.sending is not None and not self.sending.done():
+            # The buffer is scheduled again when the send in flight is done
+            return
+        if self._due():
+            self.sending = asyncio.ensure_future(self._send(more_body=True))
+            self.sending.add_done_callback(self._on_sent)
+            return
+        delay = self.pending_since + self.max_latency - time.time()
+        self.timer = asyncio.get_running_loop().call_later(delay, self._schedule)
+
+    def _on_sent(self, sending: asyncio.Future):
+        if not sending.cancelled() and sending.exception() is not None:
+            self.error = sending.exception()
+            return
+        self._schedule()
+
+    async def _send(self, more_body: bool):
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.pending_since = None
+
+        self.num_flushes += 1
+        if self.time_to_first_token is None and text:
+            self.time_to_first_token = time.time() - self.start_time
+        self.sent.append(text)
+        await self.send(
+            {
+                "type": "http.response.body",
+                "body": text.encode("utf-8"),
+                "more_body": more_body,
+            }
+        )
+
+    async def write(self, text: str):
+        """Adds text to the stream. Raises the exception of a failed send, e.g. if the validator disconnected."""
+        self._raise_error()
+        if not text:
+            return
+
+        self.buffer.append(text)
+        self.buffer_bytes += len(text.encode("utf-8"))
+        if self.pending_since is None:
+            self.pending_since = time.time()
+        self._schedule()
+        # Lets a send which was started make progress
+        await asyncio.sleep(0)
+
+    async def close(self):
+        """Waits for the send in flight, and sends the rest of the text as the last body."""
+        self.closed = True
+        if self.sending is not None:
+            await asyncio.wait([self.sending])
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self._raise_error()
+
+        if self.buffer:
+            await self._send(more_body=False)
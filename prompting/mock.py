@@ -61,9 +61,19 @@ class MockPipeline:
     def __call__(self, composed_prompt, **kwargs):
         return self.forward(composed_prompt, **kwargs)
 
-    def forward(self, messages, **kwargs):
-        output = self.model(messages)
-        return self.postprocess(output)
+    def generate_batch(self, composed_prompts, model_kwargs):
+        return [
+            self(composed_prompt, **kwargs)
+            for composed_prompt, kwargs in zip(composed_prompts, model_kwargs)
+        ]
+
+    def forward(self, messages, streamer=None, **kwargs):
+        output = self.postprocess(self.model(messages))
+        if streamer is not None:
+            words = output.split(" ")
+            for i, word in enumerate(words):
+                streamer.on_finalized_text(word if i == 0 else f" {word}")
+        return output
 
     def postprocess(self, output, **kwargs):
         output = output.split(self.model.tokenizer.role_expr.format(role="assistant"))[
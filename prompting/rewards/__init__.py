@@ -5,9 +5,11 @@ from .reward import (
     BatchRewardOutput,
     RewardModelTypeEnum,
 )
+from .completion_batch import CompletionBatch
 from .code_diff import DiffRewardModel
 from .relevance import RelevanceRewardModel
 from .rouge import RougeRewardModel
 from .float_diff import FloatDiffModel
 from .date import DateRewardModel
+from .process_pool import ProcessPoolRewardModel
 from .pipeline import RewardPipeline, REWARD_MODELS
@@ -1,6 +1,8 @@
+import re
+import math
 import difflib
 import torch
-from typing import List
+from typing import Dict, List
 from prompting.rewards import (
     BaseRewardModel,
     BatchRewardOutput,
@@ -9,15 +11,140 @@ from prompting.rewards import (
 import time
 
 
+# Identifiers, numbers and single punctuation characters. Whitespace is not a token
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def lcs_length(
+    a: List[int], masks: Dict[int, int], b: List[int], min_lcs: int = 0
+) -> int:
+    """Length of the longest common subsequence of two sequences, with the bit-parallel algorithm of Hyyrö (2004).
+
+    Args:
+        a (List[int]): The first sequence, with one bit per element.
+        masks (Dict[int, int]): The bitmask of the positions of each element in a.
+        b (List[int]): The second sequence.
+        min_lcs (int, optional): Stop early and return 0 once the LCS cannot reach this length. Defaults to 0.
+
+    Returns:
+        int: The length of the LCS, or 0 if it is shorter than min_lcs.
+    """
+    full = (1 << len(a)) - 1
+    row = full
+    for i, element in enumerate(b, start=1):
+        match = row & masks.get(element, 0)
+        row = ((row + match) | (row - match)) & full
+        # The LCS grows by at most one per remaining element of b
+        if min_lcs and i % 64 == 0:
+            lcs = len(a) - bin(row).count("1")
+            if lcs + len(b) - i < min_lcs:
+                return 0
+    lcs = len(a) - bin(row).count("1")
+    return lcs if lcs >= min_lcs else 0
+
+
+class LCSRatio:
+    """Ratio of the LCS of a fixed reference and other texts, 2 * LCS / (len(reference) + len(other)) like
+    `SequenceMatcher.ratio`, but over tokens or lines rather than characters.
+
+    The reference is split and its LCS match masks are computed once for all the texts it is compared to.
+
+    Args:
+        reference (str): The fixed reference.
+        level (str, optional): "token" or "line", the units which are compared. Defaults to "token".
+        max_tokens (int, optional): Number of units of each text which are compared. Units past the cap count as not
+            matching. Defaults to 4096.
+    """
+
+    def __init__(self, reference: str, level: str = "token", max_tokens: int = 4096):
+        if level not in ("token", "line"):
+            raise ValueError(
+                f"level {level} not supported. Please choose from token, line"
+            )
+        self.level = level
+        self.max_tokens = max_tokens
+
+        units = self.split(reference)
+        self.length = len(units)
+        self.vocab: Dict[str, int] = {}
+        self.ids = [self.vocab.setdefault(unit, len(self.vocab)) for unit in units]
+        self.masks: Dict[int, int] = {}
+        for position, unit in enumerate(self.ids[:max_tokens]):
+            self.masks[unit] = self.masks.get(unit, 0) | (1 << position)
+
+    def split(self, text: str) -> List[str]:
+        if self.level == "line":
+            return [line.strip() for line in text.splitlines() if line.strip()]
+        return TOKEN_PATTERN.findall(text)
+
+    def ratio(self, other: str, min_score: float = 0.0) -> float:
+        """Scores another text against the reference.
+
+        Args:
+            other (str): The text to score.
+            min_score (float, optional): Scores below this are 0, which lets the LCS stop as soon as it cannot reach
+                it. Defaults to 0.
+
+        Returns:
+            float: The ratio, between 0 and 1. Two empty texts have a ratio of 1.
+        """
+        # Units which are not in the reference never match
+        other = [self.vocab.get(unit, -1) for unit in self.split(other)]
+        total = self.length + len(other)
+        if not total:
+            return 1.0
+
+        # The shortest LCS which reaches min_score
+        min_lcs = math.ceil(min_score * total / 2)
+        lcs = lcs_length(
+            self.ids[: self.max_tokens],
+            self.masks,
+            other[: self.max_tokens],
+            min_lcs=min_lcs,
+        )
+        return 2 * lcs / total
+
+
 class DiffRewardModel(BaseRewardModel):
+    """Scores completions by their similarity to the reference.
+
+    Args:
+        lines (bool, optional): Score with the length of the unified diff instead of a ratio. Defaults to False.
+        threshold (float, optional): Logged with the rewards. Defaults to None.
+        engine (str, optional): "difflib" for the character ratio of SequenceMatcher, or "lcs" for a ratio based on
+            the bit-parallel LCS of tokens or lines, which takes a few integer operations per token. Defaults to "difflib".
+        level (str, optional): "token" or "line", the units compared by the lcs engine. Defaults to "token".
+        max_tokens (int, optional): Number of units of each text compared by the lcs engine. Units past the cap
+            count as not matching. Defaults to 4096.
+        min_score (float, optional): Scores of the lcs engine below this are 0, so that it stops as soon as a
+            completion cannot reach it. Defaults to 0.
+    """
+
     @property
     def name(self) -> str:
         return "diff"
 
-    def __init__(self, lines=False, threshold=None, **kwargs):
+    def __init__(
+        self,
+        lines=False,
+        threshold=None,
+        engine="difflib",
+        level="token",
+        max_tokens=4096,
+        min_score=0.0,
+        **kwargs,
+    ):
         super().__init__()
         self.lines = lines
         self.threshold = threshold
+        if engine not in ("difflib", "lcs"):
+            raise ValueError(
+                f"engine {engine} not supported. Please choose from difflib, lcs"
+            )
+        self.engine = engine
+        self.level = level
+        self.max_tokens = max_tokens
+        self.min_score = min_score
 
     def unified_diff(self, reference, completion):
         return len(
@@ -25,7 +152,21 @@ class DiffRewardModel(BaseRewardModel):
         )
 
     def seq_match(self, reference, completion):
-        return difflib.SequenceMatcher(None, reference, completion).ratio()
+        # autojunk makes SequenceMatcher ignore frequent characters of texts longer than 200 characters, such as spaces
+        # in code, which is not what the ratio is meant to measure and which the lcs engine does not do either
+        return difflib.SequenceMatcher(
+            None, reference, completion, autojunk=False
+        ).ratio()
+
+    def lcs_rewards(self, reference: str, completions: List[str]):
+        reference = LCSRatio(reference, level=self.level, max_tokens=self.max_tokens)
+        rewards = []
+        timings = []
+        for completion in completions:
+            t0 = time.time()
+            rewards.append(reference.ratio(completion, min_score=self.min_score))
+            timings.append(time.time() - t0)
+        return rewards, timings
 
     def reward(self, reference: str, completions: List[str]) -> BatchRewardOutput:
         """Get the score between two strings.
@@ -40,6 +181,8 @@ class DiffRewardModel(BaseRewardModel):
                 t0 = time.time()
                 rewards.append(self.unified_diff(reference, completion))
                 timings.append(time.time() - t0)
+        elif self.engine == "lcs":
+            rewards, timings = self.lcs_rewards(reference, completions)
         else:
             for completion in completions:
                 t0 = time.time()
@@ -49,7 +192,12 @@ class DiffRewardModel(BaseRewardModel):
         output = BatchRewardOutput(
             rewards=torch.FloatTensor(rewards),
             timings=torch.FloatTensor(timings),
-            extra_info={"threshold": self.threshold, "lines": self.lines},
+            extra_info={
+                "threshold": self.threshold,
+                "lines": self.lines,
+                "engine": self.engine,
+                "level": self.level,
+            },
         )
 
         return output
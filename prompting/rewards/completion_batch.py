@@ -0,0 +1,81 @@
+import itertools
+import threading
+from collections import Counter
+from typing import Callable, List
+
+from prompting.rewards.native_rouge import ngrams, split_words
+from prompting.rewards.embedding_cache import EmbeddingCache
+
+
+class CompletionBatch(list):
+    """The completions of a step, which are shared by all the reward models applied to them.
+
+    It is a list of the completion strings, so models which only need the text are unchanged. Transformations which
+    several models need are computed lazily and memoized, so that each one happens once per completion per step, even
+    when the same model scores the completions against both the reference and the challenge. The batch must not be
+    modified after it is created.
+    """
+
+    def __init__(self, completions: List[str]):
+        super().__init__(completions)
+        self._memo = {}
+        # Set on subsets, which take the entries the parent batch has already computed instead of recomputing them
+        self._parent = None
+        self._indices = None
+        # Reward models run in several threads, and the first one to need a transformation computes it for the others
+        self._lock = threading.RLock()
+
+    def __reduce__(self):
+        # Pickled as a plain list, as the lock cannot be pickled
+        return list, (list(self),)
+
+    def _memoize(self, key, transform: Callable, inputs: list = None) -> list:
+        """Applies the transform to each completion, or to each of the inputs derived from them, once."""
+        with self._lock:
+            if key not in self._memo:
+                parent_values = self._parent._memo.get(key) if self._parent else None
+                if parent_values is not None:
+                    self._memo[key] = [parent_values[i] for i in self._indices]
+                else:
+                    self._memo[key] = [
+                        transform(x) for x in (self if inputs is None else inputs)
+                    ]
+            return self._memo[key]
+
+    def subset(self, indices: List[int]) -> "CompletionBatch":
+        """Returns a batch of the completions at the indices, which shares the transformations already memoized."""
+        indices = [int(i) for i in indices]
+        batch = CompletionBatch([self[i] for i in indices])
+        batch._parent = self
+        batch._indices = indices
+        return batch
+
+    @property
+    def normalized(self) -> List[str]:
+        """Lowercased text of each completion."""
+        return self._memoize("normalized", str.lower)
+
+    @property
+    def sentences(self) -> List[List[List[str]]]:
+        """Words of each sentence of each completion, split like the `rouge` package does."""
+        return self._memoize("sentences", split_words)
+
+    def ngram_counts(self, n: int) -> List[Counter]:
+        """Counts of the n-grams of the words of the sentences of each completion."""
+        return self._memoize(
+            ("ngram_counts", n),
+            lambda sentences: Counter(ngrams(list(itertools.chain(*sentences)), n)),
+            inputs=self.sentences,
+        )
+
+    @property
+    def hashes(self) -> List[str]:
+        """SHA-256 hex digests of the completions, which are also their keys in an EmbeddingCache."""
+        return self._memoize("hashes", EmbeddingCache.key)
+
+
+def as_completion_batch(completions: List[str]) -> CompletionBatch:
+    """Returns the completions as a CompletionBatch, so that models can also be called with a plain list."""
+    if isinstance(completions, CompletionBatch):
+        return completions
+    return CompletionBatch(completions)
@@ -1,13 +1,63 @@
+import re
 import time
 import torch
-import re
-import pandas as pd
 import numpy as np
-from typing import List
+from typing import List, Optional, Tuple
 from prompting.rewards import BaseRewardModel, BatchRewardOutput, RewardModelTypeEnum
 import bittensor as bt
 
 
+MONTHS = {
+    name: i + 1
+    for i, name in enumerate(
+        [
+            "January",
+            "February",
+            "March",
+            "April",
+            "May",
+            "June",
+            "July",
+            "August",
+            "September",
+            "October",
+            "November",
+            "December",
+        ]
+    )
+}
+# Dates are compared within the leap year 2000, so that February 29 is valid
+DAYS_IN_MONTH = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+DAYS_BEFORE_MONTH = [sum(DAYS_IN_MONTH[:i]) for i in range(12)]
+
+MONTH_NAMES = "|".join(MONTHS)
+# One alternative per supported format, in order of priority. The name of each alternative is the last group of a match
+DATE_PATTERN = re.compile(
+    r"\b(?:"
+    # MM/DD/YYYY or DD/MM/YYYY
+    r"(?P<numeric>(\d{1,2})[/-](\d{1,2})[/-](\d{3,4}))"
+    # MM/DD/YY or DD/MM/YY
+    r"|(?P<numeric_short>(\d{1,2})[-/](\d{1,2})[-/](\d{2}))"
+    # DD Month YYYY
+    rf"|(?P<day_month>(\d{{1,2}}) ({MONTH_NAMES}) (\d{{3,4}}))"
+    # Month DD, YYYY
+    rf"|(?P<month_day>({MONTH_NAMES}) (\d{{1,2}})(?:,\s*)?(\d{{3,4}}))"
+    r")\b"
+)
+PRIORITY = {"numeric": 0, "numeric_short": 1, "day_month": 2, "month_day": 3}
+
+
+# Scores of the differences in days, up to the first one which is clipped to 0. Looking up the scores of a batch is
+# vectorized and gives the same values as computing the exponential of each difference on its own
+DATE_SCORES = np.array([np.exp(-(diff**2 / 1000)) for diff in range(100)])
+DATE_SCORES[DATE_SCORES < 0.001] = 0
+
+
+def day_of_year(month: int, day: int) -> Optional[int]:
+    if 1 <= month <= 12 and 1 <= day <= DAYS_IN_MONTH[month - 1]:
+        return DAYS_BEFORE_MONTH[month - 1] + day
+
+
 class DateRewardModel(BaseRewardModel):
     @property
     def name(self) -> str:
@@ -16,54 +66,78 @@ class DateRewardModel(BaseRewardModel):
     def __init__(self, **kwargs):
         super().__init__()
 
-    def date_diff(self, ref_date: tuple, comp_date: tuple) -> int:
+    def date_diff(
+        self, ref_date: Optional[Tuple[int, int]], comp_date: Optional[Tuple[int, int]]
+    ) -> int:
         """
         Calculates the absolute difference in days between two dates.
         """
-        try:
-            return abs(ref_date[0] - comp_date[0]).days + 365 * abs(
-                int(ref_date[1]) - int(comp_date[1])
-            )
-        except Exception as e:
+        if ref_date is None or comp_date is None:
             return 500
-
-    def parse_dates_from_text(self, text: str) -> tuple:
+        return abs(ref_date[0] - comp_date[0]) + 365 * abs(ref_date[1] - comp_date[1])
+
+    def parse_date(self, match: re.Match) -> Optional[Tuple[int, int]]:
+        """Returns the day of the year and the year of a match of DATE_PATTERN, or None if the date does not exist."""
+        groups = [group for group in match.groups() if group is not None]
+        _, first, second, year = groups
+
+        if match.lastgroup in ("numeric", "numeric_short"):
+            first, second = int(first), int(second)
+            # Month first, unless the first number cannot be a month
+            if first > 12:
+                first, second = second, first
+            doy = day_of_year(first, second)
+        elif match.lastgroup == "day_month":
+            doy = day_of_year(MONTHS[second], int(first))
+        else:
+            doy = day_of_year(MONTHS[first], int(second))
+
+        return None if doy is None else (doy, int(year))
+
+    def parse_dates_from_text(self, text: str) -> Optional[Tuple[int, int]]:
         """
-        Parses dates from a body of text, handling various formats, and returns pandas datetime objects.
+        Parses a date from a body of text, handling various formats. When there are several dates, the first one in the
+        format with the highest priority is returned.
 
         Args:
             text (str): The text to parse.
 
         Returns:
-            tuple: A tuple containing a datemtime object with they year set at 2000 and the actual year.
+            Optional[Tuple[int, int]]: The day of the year (within a leap year) and the year, or None if there is no date.
         """
+        best_date, best_priority = None, len(PRIORITY)
+        for match in DATE_PATTERN.finditer(text):
+            priority = PRIORITY[match.lastgroup]
+            if priority >= best_priority:
+                continue
+            date = self.parse_date(match)
+            if date is not None:
+                best_date, best_priority = date, priority
+                if priority == 0:
+                    break
+
+        return best_date
+
+    def date_scores(
+        self,
+        ref_date: Optional[Tuple[int, int]],
+        comp_dates: List[Optional[Tuple[int, int]]],
+    ) -> np.ndarray:
+        """Assign scores based on the difference between the reference date and each completion date using a negative
+        exponential function.
 
-        date_patterns = [
-            r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{3,4})\b",  # MM/DD/YYYY or DD/MM/YYYY
-            r"\b(\d{1,2})[-/](\d{1,2})[-/](\d{2})\b",  # MM/DD/YY or DD/MM/YY
-            r"\b(\d{1,2}) (January|February|March|April|May|June|July|August|September|October|November|December) (\d{3,4})\b",  # DD Month, YYYY
-            r"\b(January|February|March|April|May|June|July|August|September|October|November|December) (\d{1,2})(,\s*)?(\d{3,4})\b",  # Month DD, YYYY
-        ]
+        Args:
+            ref_date (Optional[Tuple[int, int]]): The parsed reference date.
+            comp_dates (List[Optional[Tuple[int, int]]]): The parsed completion dates.
 
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                try:
-                    # Attempt to create a datetime object with year 2000 (datetime objects cannot take dates more than 200 years in the past)
-                    parsed_date = pd.to_datetime(
-                        match[0] + "/" + match[1] + "/" + "2000"
-                    )
-                    year = match[-1]
-                    # Check if the year is a number
-                    if year.isdigit():
-                        # If the year is a digit, return the parsed date and the year in a tuple
-                        return (parsed_date, year)
-                    else:
-                        raise ValueError
-                except ValueError:
-                    pass
-
-        return
+        Returns:
+            np.ndarray: The scores."""
+        diffs = np.array(
+            [self.date_diff(ref_date, comp_date) for comp_date in comp_dates],
+            dtype=np.int64,
+        )
+        scores = DATE_SCORES[np.minimum(diffs, len(DATE_SCORES) - 1)]
+        return scores
 
     def date_score(self, reference: str, completion: str) -> float:
         """Assign a score based on the difference between two dates using a negative exponential function.
@@ -74,16 +148,9 @@ class DateRewardModel(BaseRewardModel):
 
         Returns:
             float: The score."""
-        score = 0
-        if not completion:
-            return score
         ref_date = self.parse_dates_from_text(reference)
         comp_date = self.parse_dates_from_text(completion)
-        score = np.exp(-(self.date_diff(ref_date, comp_date) ** 2 / 1000))
-        # Clip any very small scores
-        if score < 0.001:
-            score = 0
-        return score
+        return float(self.date_scores(ref_date, [comp_date])[0])
 
     def reward(self, reference: str, completions: List[str]) -> BatchRewardOutput:
         """Compute difference scores given a completion and reference pair.
@@ -95,14 +162,19 @@ class DateRewardModel(BaseRewardModel):
         Returns:
             BatchRewardOutput: A BatchRewardOutput object containing the rewards and timings.
         """
-        rewards = []
+        ref_date = self.parse_dates_from_text(reference)
+        comp_dates = []
         timings = []
 
         for completion in completions:
             t0 = time.time()
-            reward = self.date_score(reference, completion)
+            comp_dates.append(self.parse_dates_from_text(completion))
             timings.append(time.time() - t0)
-            rewards.append(reward)
+
+        t0 = time.time()
+        rewards = self.date_scores(ref_date, comp_dates)
+        # The scores are computed for the whole batch at once, so each completion gets an equal share of the time
+        timings = np.array(timings) + (time.time() - t0) / max(len(completions), 1)
 
         output = BatchRewardOutput(
             rewards=torch.FloatTensor(rewards),
@@ -0,0 +1,170 @@
+import os
+import hashlib
+import threading
+import numpy as np
+import torch
+import bittensor as bt
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class EmbeddingCache:
+    """Cache of text embeddings keyed by a hash of the text.
+
+    Embeddings are kept in an in-memory LRU which is bounded by bytes. If a path is given, embeddings are also written to
+    a memory-mapped float32 store on disk, so that they survive restarts with the same precision as in memory. The disk
+    store holds at most `disk_capacity` embeddings and stops growing when it is full. A store which was created with another `dim` or `disk_capacity` is
+    discarded.
+
+    The disk store must not be shared between processes, as the rows and keys written by one process are not
+    synchronized with the others.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        max_bytes: int = 2**28,
+        path: str = None,
+        disk_capacity: int = 100_000,
+    ):
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self.path = path
+        self.disk_capacity = disk_capacity
+
+        self.memory = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.disk = None
+        self.disk_rows: Dict[str, int] = {}
+        if path is not None:
+            self._open_disk()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(dim={self.dim}, max_bytes={self.max_bytes}, path={self.path!r}, entries={len(self.memory)})"
+
+    def __len__(self):
+        return len(self.memory)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _open_disk(self):
+        """Opens the disk store, creating it if needed. Each line of the keys file is the key of the matching row."""
+        os.makedirs(self.path, exist_ok=True)
+        embeddings_path = os.path.join(self.path, "embeddings.f32")
+        self.keys_path = os.path.join(self.path, "keys.txt")
+
+        mode = "r+" if os.path.exists(embeddings_path) else "w+"
+        expected_size = self.disk_capacity * self.dim * np.dtype(np.float32).itemsize
+        if mode == "r+" and os.path.getsize(embeddings_path) != expected_size:
+            # The rows of a store of another shape would be read at the wrong offsets
+            bt.logging.warning(
+                f"Embedding cache at {self.path} does not have shape ({self.disk_capacity}, {self.dim}), recreating it"
+            )
+            mode = "w+"
+            if os.path.exists(self.keys_path):
+                os.remove(self.keys_path)
+
+        self.disk = np.memmap(
+            embeddings_path,
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.disk_capacity, self.dim),
+        )
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                keys = f.read().split()
+            self.disk_rows = {key: row for row, key in enumerate(keys)}
+
+        bt.logging.info(
+            f"Loaded {len(self.disk_rows)} cached embeddings from {self.path}"
+        )
+
+    def _remember(self, key: str, embedding: torch.Tensor):
+        """Adds the embedding to the in-memory LRU and evicts the least recently used ones which don't fit."""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+
+        self.memory[key] = embedding
+        self.bytes += embedding.element_size() * embedding.nelement()
+        while self.bytes > self.max_bytes and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.bytes -= evicted.element_size() * evicted.nelement()
+
+    def get(
+        self, texts: List[str], keys: List[str] = None
+    ) -> List[Optional[torch.Tensor]]:
+        """Looks up the embeddings of the texts.
+
+        Args:
+            texts (List[str]): The texts to look up.
+            keys (List[str], optional): The keys of the texts, if they are already hashed. Defaults to None.
+
+        Returns:
+            List[Optional[torch.Tensor]]: The cached embedding of each text, or None if it is not cached.
+        """
+        if keys is None:
+            keys = [self.key(text) for text in texts]
+
+        embeddings = []
+        with self.lock:
+            for key in keys:
+                embedding = self.memory.get(key)
+                if embedding is not None:
+                    self.memory.move_to_end(key)
+                elif key in self.disk_rows:
+                    row = self.disk[self.disk_rows[key]]
+                    embedding = torch.from_numpy(np.array(row))
+                    self._remember(key, embedding)
+
+                if embedding is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                embeddings.append(embedding)
+
+        return embeddings
+
+    def put(self, texts: List[str], embeddings: torch.Tensor, keys: List[str] = None):
+        """Adds the embeddings of the texts to the cache.
+
+        Args:
+            texts (List[str]): The texts which were embedded.
+            embeddings (torch.Tensor): The embeddings, one row per text.
+            keys (List[str], optional): The keys of the texts, if they are already hashed. Defaults to None.
+        """
+        if keys is None:
+            keys = [self.key(text) for text in texts]
+
+        embeddings = embeddings.detach().float().cpu()
+        with self.lock:
+            new_keys = []
+            for key, embedding in zip(keys, embeddings):
+                # Cloned so that the cache does not keep the whole batch alive
+                self._remember(key, embedding.clone())
+
+                if self.disk is None or key in self.disk_rows:
+                    continue
+                row = len(self.disk_rows)
+                if row >= self.disk_capacity:
+                    continue
+                self.disk[row] = embedding.numpy()
+                self.disk_rows[key] = row
+                new_keys.append(key)
+
+            if new_keys:
+                # Rows are flushed before their keys are written, so a crash never leaves a key without its row
+                self.disk.flush()
+                with open(self.keys_path, "a") as f:
+                    f.write("".join(f"{key}\n" for key in new_keys))
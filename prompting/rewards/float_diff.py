@@ -1,40 +1,279 @@
+import re
+import sys
+import json
+import math
 import time
 import torch
-from typing import List
-from sympy.parsing.sympy_parser import parse_expr
+import select
+import threading
+import subprocess
+import bittensor as bt
+from typing import List, Optional
+from dataclasses import dataclass
 from prompting.rewards import BaseRewardModel, BatchRewardOutput, RewardModelTypeEnum
 
 
+NUMBER = r"(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+# Plain numbers, including scientific notation, and fractions of two numbers
+NUMBER_PATTERN = re.compile(rf"([-+]?{NUMBER})(?:/({NUMBER}))?")
+# \frac{a}{b} and its \dfrac and \tfrac variants, with plain numbers in both braces
+LATEX_FRAC_PATTERN = re.compile(
+    rf"([-+]?)\\[dt]?frac\{{([-+]?{NUMBER})\}}\{{([-+]?{NUMBER})\}}"
+)
+# Math delimiters and \boxed{}, which do not change the value of what is inside
+LATEX_WRAPPER_PATTERN = re.compile(
+    r"\$+(.*?)\$+|\\\((.*)\\\)|\\\[(.*)\\\]|\\boxed\{(.*)\}"
+)
+# Expressions which are worth evaluating with sympy, before they are checked token by token with is_sympy_expression
+EXPRESSION_PATTERN = re.compile(r"[0-9a-zA-Z+\-*/^().]*\d[0-9a-zA-Z+\-*/^().]*")
+# Numbers, names and arithmetic operators, which are the only tokens of an expression sent to sympy
+EXPRESSION_TOKEN_PATTERN = re.compile(rf"{NUMBER}|[a-zA-Z]+|[+\-*/^()]")
+
+CONSTANTS = {"pi": math.pi, "E": math.e, "oo": math.inf}
+
+# The only names which an expression can use. The sandbox evaluates expressions with just these names and without
+# builtins, so that a completion cannot run arbitrary code in it
+SYMPY_NAMES = (
+    "sqrt cbrt root exp log ln sin cos tan cot sec csc asin acos atan sinh cosh tanh floor ceiling factorial "
+    "binomial gcd lcm Abs pi E oo"
+).split()
+
+SYMPY_WORKER_SOURCE = """
+import sys, json
+import sympy
+from sympy.parsing.sympy_parser import parse_expr, auto_number, repeated_decimals
+
+# Only the results are written to the protocol stream, so that nothing printed while evaluating can corrupt it
+protocol = sys.stdout
+sys.stdout = sys.stderr
+names = {name: getattr(sympy, name) for name in json.loads(sys.argv[1])}
+# Names used by the auto_number transformation
+names.update(Integer=sympy.Integer, Float=sympy.Float, Rational=sympy.Rational)
+print("ready", file=protocol, flush=True)
+for line in sys.stdin:
+    try:
+        # Without the auto_symbol transformation, unknown names fail instead of becoming symbols
+        expression = parse_expr(
+            json.loads(line),
+            local_dict={},
+            global_dict={"__builtins__": {}, **names},
+            transformations=(repeated_decimals, auto_number),
+        )
+        result = float(expression.evalf())
+    except Exception:
+        result = None
+    print(json.dumps(result), file=protocol, flush=True)
+"""
+
+
+def is_sympy_expression(word: str) -> bool:
+    """Whether the word only consists of numbers, arithmetic operators and the allowed sympy names."""
+    position = 0
+    for match in EXPRESSION_TOKEN_PATTERN.finditer(word):
+        if match.start() != position:
+            return False
+        if match.group().isalpha() and match.group() not in SYMPY_NAMES:
+            return False
+        position = match.end()
+    return position == len(word)
+
+
+class SympySandbox:
+    """Evaluates expressions with sympy in a separate process, which is killed if an expression takes too long.
+
+    Args:
+        startup_timeout (float, optional): Seconds to wait for the process to import sympy. Defaults to 60.
+    """
+
+    def __init__(self, startup_timeout: float = 60):
+        self.startup_timeout = startup_timeout
+        self.process: subprocess.Popen = None
+        self.lock = threading.Lock()
+
+    def _readline(self, timeout: float) -> Optional[str]:
+        ready, _, _ = select.select([self.process.stdout], [], [], max(timeout, 0))
+        return self.process.stdout.readline() if ready else None
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", SYMPY_WORKER_SOURCE, json.dumps(SYMPY_NAMES)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        if self._readline(self.startup_timeout) != "ready\n":
+            self.close()
+            raise RuntimeError("Sympy sandbox failed to start")
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def evaluate(self, expression: str, timeout: float) -> Optional[float]:
+        """Evaluates an expression to a float.
+
+        Args:
+            expression (str): The expression to evaluate.
+            timeout (float): Seconds to wait for the result, not counting the start of the process.
+
+        Returns:
+            Optional[float]: The value, or None if the expression is not a number. An answer of the process which is
+                not a number is a protocol error, which also gives None and restarts the process on next use.
+
+        Raises:
+            TimeoutError: If the expression takes longer than timeout. The process is killed and restarted on next use.
+        """
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+
+            self.process.stdin.write(json.dumps(expression) + "\n")
+            self.process.stdin.flush()
+            line = self._readline(timeout)
+            if not line:
+                self.close()
+                raise TimeoutError(f"Evaluating {expression!r} took too long")
+            try:
+                result = json.loads(line)
+            except ValueError:
+                result = ""
+            if result is not None and not isinstance(result, (int, float)):
+                bt.logging.error(
+                    f"Sympy sandbox gave an invalid answer {line[:100]!r}, restarting it"
+                )
+                self.close()
+                return None
+            return result
+
+
+# One sandbox per process, which is started on first use so that it is not copied with the model to other processes
+_sandbox: SympySandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def get_sympy_sandbox() -> SympySandbox:
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = SympySandbox()
+        return _sandbox
+
+
+def parse_number(word: str) -> Optional[float]:
+    """Parses numbers, fractions, scientific notation and simple LaTeX forms without sympy.
+
+    Returns:
+        Optional[float]: The value, or None if the word is not in one of these forms.
+    """
+    match = LATEX_WRAPPER_PATTERN.fullmatch(word)
+    while match:
+        word = next(group for group in match.groups() if group is not None)
+        match = LATEX_WRAPPER_PATTERN.fullmatch(word)
+
+    match = NUMBER_PATTERN.fullmatch(word)
+    if match:
+        numerator, denominator = match.groups()
+        if denominator is None:
+            return float(numerator)
+        # Like sympy, a division by zero gives no number
+        return float(numerator) / float(denominator) if float(denominator) else None
+
+    match = LATEX_FRAC_PATTERN.fullmatch(word)
+    if match:
+        sign, numerator, denominator = match.groups()
+        value = float(numerator) / float(denominator) if float(denominator) else None
+        return -value if value is not None and sign == "-" else value
+
+    if word in CONSTANTS:
+        return CONSTANTS[word]
+
+    # Words such as inf and nan
+    if word.isalpha():
+        try:
+            return float(word)
+        except ValueError:
+            return None
+
+
+@dataclass
+class SlowPathCounts:
+    """Number of words evaluated with sympy, and how many of those ran out of time."""
+
+    count: int = 0
+    timeouts: int = 0
+
+
 class FloatDiffModel(BaseRewardModel):
+    """Scores completions by the relative difference between the last number in the completion and the reference.
+
+    Numbers are parsed without sympy when they are in a common form. Sympy is only used for expressions, and runs in a
+    sandbox process with a budget of `sympy_timeout` seconds per completion.
+
+    Args:
+        sympy_timeout (float, optional): Seconds of sympy evaluation allowed per completion. Defaults to 1.0.
+    """
+
     @property
     def name(self) -> str:
         return "float_diff"
 
-    def __init__(self, **kwargs):
+    def __init__(self, sympy_timeout: float = 1.0, **kwargs):
         super().__init__()
+        self.sympy_timeout = sympy_timeout
+
+    def extract_number(
+        self, text: str, counts: SlowPathCounts = None
+    ) -> Optional[float]:
+        """Extract a number from a string.
 
-    @staticmethod
-    def extract_number(text: str) -> float:
-        """Extract a number from a string."""
-        # loop over all words reversed and try to cast as a float, break when you find the first one
+        Args:
+            text (str): The text, whose last number is extracted.
+            counts (SlowPathCounts, optional): Counts of the sympy evaluations of the caller, which are added to.
+                Defaults to None.
+        """
+        # Counted per call rather than on the model, as completions may be scored concurrently
+        counts = counts if counts is not None else SlowPathCounts()
+        deadline = time.time() + self.sympy_timeout
+        # loop over all words reversed and return the first one which is a number
         words = text.split()
         for word in reversed(words):
             cleaned = word.strip(".").replace(",", "")
+            number = parse_number(cleaned)
+            if number is not None:
+                return number
+
+            remaining = deadline - time.time()
+            # Fractions with a zero denominator are already known not to be numbers
+            if (
+                remaining <= 0
+                or NUMBER_PATTERN.fullmatch(cleaned)
+                or not EXPRESSION_PATTERN.fullmatch(cleaned)
+                or not is_sympy_expression(cleaned)
+            ):
+                continue
+
+            counts.count += 1
             try:
-                return float(parse_expr(cleaned).evalf())
-            except Exception:
-                # fall back to simpler parsing if required
-                try:
-                    return float(cleaned)
-                except Exception:
-                    continue
-
-    @staticmethod
-    def math_score(reference: str, completion: str) -> float:
+                number = get_sympy_sandbox().evaluate(cleaned, timeout=remaining)
+            except TimeoutError:
+                counts.timeouts += 1
+                bt.logging.warning(
+                    f"Sympy took longer than {self.sympy_timeout}s to evaluate {cleaned[:100]!r}"
+                )
+                continue
+            if number is not None:
+                return number
+
+    def math_score(
+        self, reference: str, completion: str, counts: SlowPathCounts = None
+    ) -> float:
         """Compute a score based on the difference between a reference and a completion."""
         # Convert the strings to a float
         reference = float(reference)
-        pred = FloatDiffModel.extract_number(completion)
+        pred = self.extract_number(completion, counts)
         if pred is None:
             return 0.0
 
@@ -56,10 +295,11 @@ class FloatDiffModel(BaseRewardModel):
         """Compute difference scores given a completion and reference pair."""
         rewards = []
         timings = []
+        counts = SlowPathCounts()
 
         for completion in completions:
             t0 = time.time()
-            reward = self.math_score(reference, completion)
+            reward = self.math_score(reference, completion, counts)
             timings.append(time.time() - t0)
             rewards.append(reward)
 
@@ -68,6 +308,8 @@ class FloatDiffModel(BaseRewardModel):
             timings=torch.FloatTensor(timings),
             extra_info={
                 "type": "math",
+                "slow_path_count": counts.count,
+                "slow_path_timeouts": counts.timeouts,
             },
         )
         return output
@@ -0,0 +1,171 @@
+import itertools
+from typing import Collection, Dict, List, Set
+
+
+def split_sentences(text: str) -> List[str]:
+    """Splits the text into sentences exactly like the `rouge` package."""
+    return [" ".join(_.split()) for _ in text.split(".") if len(_) > 0]
+
+
+def split_words(text: str) -> List[List[str]]:
+    """Splits the text into the words of each sentence, like the `rouge` package."""
+    return [sentence.split(" ") for sentence in split_sentences(text)]
+
+
+def ngrams(words: List[str], n: int) -> List[tuple]:
+    return [tuple(words[i : i + n]) for i in range(len(words) - n + 1)]
+
+
+def f_r_p(overlapping_count: int, evaluated_count: int, reference_count: int):
+    # Same formula and edge cases as the `rouge` package
+    precision = overlapping_count / evaluated_count if evaluated_count else 0.0
+    recall = overlapping_count / reference_count if reference_count else 0.0
+    f1_score = 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+    return {"f": f1_score, "p": precision, "r": recall}
+
+
+def popcount(x: int) -> int:
+    return bin(x).count("1")
+
+
+class NativeRouge:
+    """ROUGE-1, ROUGE-2 and ROUGE-L scores which match the `rouge` package (with its default exclusive=True).
+
+    A fixed text is scored against a batch of other texts. The fixed text is tokenized into ids and its n-grams and LCS
+    match masks are computed once, so that this work is not repeated for every text in the batch. ROUGE-L uses the
+    bit-parallel LCS algorithm of Hyyrö (2004), with one bit per token of the fixed text, and reconstructs the same LCS
+    as the `rouge` package.
+
+    Args:
+        text (str): The fixed text.
+        text_is_hypothesis (bool, optional): Whether the fixed text takes the role of the hypothesis rather than the
+            reference in `Rouge().get_scores`. Defaults to False.
+    """
+
+    def __init__(self, text: str, text_is_hypothesis: bool = False):
+        self.text_is_hypothesis = text_is_hypothesis
+        self.sentence_words = split_words(text)
+        self.vocab: Dict[str, int] = {}
+        self.sentences = [
+            [self.vocab.setdefault(word, len(self.vocab)) for word in sentence]
+            for sentence in self.sentence_words
+        ]
+        self.words = list(itertools.chain(*self.sentences))
+        self.ngrams_cache = {}
+
+        # For each sentence, a bitmask per token of the positions where it appears
+        self.masks = []
+        for sentence in self.sentences:
+            masks = {}
+            for position, token in enumerate(sentence):
+                masks[token] = masks.get(token, 0) | (1 << position)
+            self.masks.append(masks)
+
+    def tokenize(self, words: List[str]) -> List[int]:
+        # Words which are not in the fixed text never match, so they can all share an id which is not in the vocab
+        return [self.vocab.get(word, -1) for word in words]
+
+    def f_r_p(self, overlapping_count: int, count: int, other_count: int):
+        if self.text_is_hypothesis:
+            return f_r_p(overlapping_count, count, other_count)
+        return f_r_p(overlapping_count, other_count, count)
+
+    def rouge_n(self, other_ngrams: Collection[tuple], n: int) -> Dict[str, float]:
+        if n not in self.ngrams_cache:
+            self.ngrams_cache[n] = set(
+                ngrams(list(itertools.chain(*self.sentence_words)), n)
+            )
+        fixed_ngrams = self.ngrams_cache[n]
+
+        return self.f_r_p(
+            len(fixed_ngrams.intersection(other_ngrams)),
+            len(fixed_ngrams),
+            len(other_ngrams),
+        )
+
+    def lcs_tokens(
+        self, sentence: List[int], masks: Dict[int, int], other: List[int]
+    ) -> Set[int]:
+        """Returns the tokens of the LCS of a sentence of the fixed text and another sentence, reconstructed like the
+        `rouge` package does from the full dynamic programming table.
+        """
+        full = (1 << len(sentence)) - 1
+        # rows[b] has a zero bit at position a when lcs(a + 1, b) > lcs(a, b)
+        rows = [full]
+        row = full
+        for token in other:
+            match = row & masks.get(token, 0)
+            row = ((row + match) | (row - match)) & full
+            rows.append(row)
+
+        if rows[-1] == full:
+            return set()
+
+        def lcs(a: int, b: int) -> int:
+            # Length of the LCS of sentence[:a] and other[:b]
+            return a - popcount(rows[b] & ((1 << a) - 1))
+
+        # The `rouge` package walks the table of (reference, hypothesis) from the end
+        x, y = (other, sentence) if self.text_is_hypothesis else (sentence, other)
+
+        def table(i: int, j: int) -> int:
+            return lcs(j, i) if self.text_is_hypothesis else lcs(i, j)
+
+        tokens = set()
+        i, j = len(x), len(y)
+        while i > 0 and j > 0:
+            if x[i - 1] == y[j - 1]:
+                tokens.add(x[i - 1])
+                i -= 1
+                j -= 1
+            elif table(i - 1, j) > table(i, j - 1):
+                i -= 1
+            else:
+                j -= 1
+        return tokens
+
+    def rouge_l(self, other_sentences: List[List[str]]) -> Dict[str, float]:
+        union = set()
+        other_tokens = [self.tokenize(other) for other in other_sentences]
+        for sentence, masks in zip(self.sentences, self.masks):
+            for other in other_tokens:
+                union |= self.lcs_tokens(sentence, masks, other)
+
+        other_words = set(itertools.chain(*other_sentences))
+        return self.f_r_p(len(union), len(set(self.words)), len(other_words))
+
+    def score(
+        self,
+        other: str,
+        ngram: str = "rouge-l",
+        other_sentences: List[List[str]] = None,
+        other_ngrams: Collection[tuple] = None,
+    ) -> Dict[str, float]:
+        """Scores the other text against the fixed text.
+
+        Args:
+            other (str): The text to score.
+            ngram (str, optional): One of "rouge-1", "rouge-2" or "rouge-l". Defaults to "rouge-l".
+            other_sentences (List[List[str]], optional): The words of the sentences of the other text, if they are
+                already split. Defaults to None.
+            other_ngrams (Collection[tuple], optional): The n-grams of the other text for rouge-1 or rouge-2, if they
+                are already computed. Defaults to None.
+
+        Returns:
+            Dict[str, float]: The f, p and r scores. All are 0 if either text has no sentences.
+        """
+        if other_sentences is None:
+            other_sentences = split_words(other)
+        if not other_sentences or not self.sentences:
+            return {"f": 0.0, "p": 0.0, "r": 0.0}
+
+        if ngram == "rouge-l":
+            return self.rouge_l(other_sentences)
+        elif ngram in ("rouge-1", "rouge-2"):
+            n = int(ngram[-1])
+            if other_ngrams is None:
+                other_ngrams = set(ngrams(list(itertools.chain(*other_sentences)), n))
+            return self.rouge_n(other_ngrams, n=n)
+        raise ValueError(
+            f"ngram {ngram} not supported. Please choose from rouge-1, rouge-2, rouge-l"
+        )
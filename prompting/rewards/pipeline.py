@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 
 from prompting.tasks import TASKS
 from prompting.rewards import (
@@ -8,7 +8,9 @@ from prompting.rewards import (
     RelevanceRewardModel,
     FloatDiffModel,
     DateRewardModel,
+    ProcessPoolRewardModel,
 )
+from prompting.rewards.reward import compile_weights
 
 REWARD_MODELS = {
     "rouge": RougeRewardModel,
@@ -20,11 +22,47 @@ REWARD_MODELS = {
 
 
 class RewardPipeline:
-    def __init__(self, selected_tasks: List[str], device):
+    def __init__(
+        self,
+        selected_tasks: List[str],
+        device,
+        cascade: bool = False,
+        cascade_floor: float = 0.0,
+        cascade_fill: float = 0.0,
+        cascade_status_codes: List[int] = (200, 408),
+        model_kwargs: Dict[str, dict] = None,
+    ):
+        """Loads the reward models of the selected tasks.
+
+        Args:
+            selected_tasks (List[str]): The tasks which the pipeline scores.
+            device (str): Device to run the reward models on.
+            cascade (bool, optional): Run the cheap models first, and expensive models only on the completions which
+                are not empty, have one of cascade_status_codes and a cheap reward of at least cascade_floor. Defaults
+                to False.
+            cascade_floor (float, optional): The weighted reward of the cheap models needed to run expensive models.
+                Defaults to 0.
+            cascade_fill (float, optional): The reward of expensive models for completions which they skip. Defaults
+                to 0.
+            cascade_status_codes (List[int], optional): The status codes of completions which expensive models score,
+                where 408 is a timed out but partial completion. Defaults to (200, 408).
+            model_kwargs (Dict[str, dict], optional): Arguments of reward models by name, which are set by the
+                machine rather than the task, e.g. {"relevance": {"backend": "int8"}}. Defaults to None.
+        """
         self.selected_tasks = selected_tasks
         self.device = device
+        self.cascade = cascade
+        self.cascade_floor = cascade_floor
+        self.cascade_fill = cascade_fill
+        self.cascade_status_codes = cascade_status_codes
+        self.model_kwargs = model_kwargs or {}
         self.validate_tasks()
         self.load_reward_pipeline()
+        # The reward and penalty weights of each task class, which RewardResult combines the model rewards with
+        self.task_weights = {
+            TASKS[task]: compile_weights(TASKS[task], device=device)
+            for task in selected_tasks
+        }
 
     def __getitem__(self, __key: str) -> BaseRewardModel:
         return self.reward_models.get(__key)
@@ -105,6 +143,17 @@ class RewardPipeline:
             cls = REWARD_MODELS[name]
 
             params = {k: v for k, v in model.items() if k not in ["name", "weight"]}
+            params.update(self.model_kwargs.get(name, {}))
+            # CPU-bound models can opt in to run in worker processes with e.g. dict(name="diff", processes=4)
+            processes = params.pop("processes", 0)
+            completion_timeout = params.pop("completion_timeout", 1.0)
+
             reward_models[name] = cls(device=self.device, **params)
+            if processes:
+                reward_models[name] = ProcessPoolRewardModel(
+                    reward_models[name],
+                    processes=processes,
+                    completion_timeout=completion_timeout,
+                )
 
         self.reward_models = reward_models
@@ -0,0 +1,239 @@
+import time
+import signal
+import torch
+import numpy as np
+import threading
+import multiprocessing
+import bittensor as bt
+from typing import List, Tuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from prompting.rewards import BaseRewardModel, BatchRewardOutput
+
+
+class CompletionTimeout(Exception):
+    pass
+
+
+# The reward model of each worker process, which is sent once when the worker starts and kept for all steps
+_worker_model: BaseRewardModel = None
+
+
+def _init_worker(reward_model: BaseRewardModel):
+    global _worker_model
+    _worker_model = reward_model
+
+
+def _ping() -> bool:
+    return True
+
+
+@contextmanager
+def time_limit(seconds: float):
+    """Raises CompletionTimeout in the main thread of the process if the block runs for longer than seconds."""
+    if not seconds:
+        yield
+        return
+
+    def handler(signum, frame):
+        raise CompletionTimeout()
+
+    previous_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def merge_extra_info(extra_infos: List[dict]) -> dict:
+    """Merges the extra info of several shards. Counts are summed, and other values are taken from the first shard
+    which has them.
+    """
+    merged = {}
+    for extra_info in extra_infos:
+        for key, value in extra_info.items():
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] += value
+    return merged
+
+
+def _reward_shard(
+    reference: str, completions: List[str], completion_timeout: float
+) -> Tuple[np.ndarray, np.ndarray, int, dict]:
+    """Scores a shard of completions one at a time in a worker process, each under its own time limit.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, int, dict]: The rewards, timings, number of timeouts and extra info of the model.
+    """
+    rewards = np.zeros(len(completions), dtype=np.float32)
+    timings = np.zeros(len(completions), dtype=np.float32)
+    timeouts = 0
+    extra_infos = []
+
+    for i, completion in enumerate(completions):
+        t0 = time.time()
+        try:
+            with time_limit(completion_timeout):
+                output = _worker_model.reward(reference, [completion])
+            rewards[i] = output.rewards[0].item()
+            extra_infos.append(output.extra_info)
+        except CompletionTimeout:
+            # Only the completion which takes too long to score gets no reward
+            timeouts += 1
+        timings[i] = time.time() - t0
+
+    return rewards, timings, timeouts, merge_extra_info(extra_infos)
+
+
+def _reward_batch(
+    requests: List[Tuple[str, List[str]]], batch_timeout: float
+) -> List[BatchRewardOutput]:
+    """Scores several requests in one call of the `reward_batch` of the model in a worker process.
+
+    Returns:
+        List[BatchRewardOutput]: The outputs of the requests, or None if they took longer than batch_timeout.
+    """
+    try:
+        with time_limit(batch_timeout):
+            return _worker_model.reward_batch(requests)
+    except CompletionTimeout:
+        return None
+
+
+class ProcessPoolRewardModel(BaseRewardModel):
+    """Runs a CPU-bound reward model in a pool of worker processes, so that it is not limited by the GIL.
+
+    The completions are sharded across the workers, which keep their copy of the model across steps. Each completion
+    is scored under `completion_timeout` seconds, and gets a reward of 0 if it takes longer. The pool is restarted if
+    one of its workers dies.
+    """
+
+    @property
+    def name(self) -> str:
+        return self.reward_model.name
+
+    @property
+    def uses_gpu(self) -> bool:
+        return self.reward_model.uses_gpu
+
+    @property
+    def is_expensive(self) -> bool:
+        return self.reward_model.is_expensive
+
+    def __init__(
+        self,
+        reward_model: BaseRewardModel,
+        processes: int = 2,
+        completion_timeout: float = 1.0,
+    ):
+        super().__init__()
+        self.reward_model = reward_model
+        self.processes = processes
+        self.completion_timeout = completion_timeout
+        self.lock = threading.Lock()
+        self.pool = self.start_pool()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.reward_model!r}, processes={self.processes}, completion_timeout={self.completion_timeout})"
+
+    def start_pool(self) -> ProcessPoolExecutor:
+        # Workers are spawned rather than forked, as forking a process with CUDA and running threads is not safe
+        pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.reward_model,),
+        )
+        # Start all workers now so that the first step does not pay for it
+        for _ in range(self.processes):
+            pool.submit(_ping)
+        return pool
+
+    def run(self, calls: List[tuple]) -> list:
+        """Runs the calls in the pool and returns their results. If a worker died, the pool is restarted and the
+        calls are run once more.
+        """
+        for attempt in range(2):
+            pool = self.pool
+            try:
+                futures = [pool.submit(*call) for call in calls]
+                return [future.result() for future in futures]
+            except BrokenProcessPool as e:
+                if attempt:
+                    raise
+                bt.logging.error(
+                    f"A worker of {self.name} died, restarting the process pool: {e}"
+                )
+                with self.lock:
+                    # Concurrent steps share the pool, which is only restarted by the first one to find it broken
+                    if self.pool is pool:
+                        pool.shutdown(wait=False)
+                        self.pool = self.start_pool()
+
+    def reward(self, reference: str, completions: List[str]) -> BatchRewardOutput:
+        # Interleaved shards balance the work when long completions are next to each other
+        shards = [
+            list(range(i, len(completions), self.processes))
+            for i in range(min(self.processes, len(completions)))
+        ]
+        results = self.run(
+            [
+                (
+                    _reward_shard,
+                    reference,
+                    [completions[j] for j in shard],
+                    self.completion_timeout,
+                )
+                for shard in shards
+            ]
+        )
+
+        rewards = np.zeros(len(completions), dtype=np.float32)
+        timings = np.zeros(len(completions), dtype=np.float32)
+        timeouts = 0
+        for shard, (shard_rewards, shard_timings, shard_timeouts, _) in zip(
+            shards, results
+        ):
+            rewards[shard] = shard_rewards
+            timings[shard] = shard_timings
+            timeouts += shard_timeouts
+
+        if timeouts:
+            bt.logging.warning(
+                f"{timeouts} completions took longer than {self.completion_timeout}s to score with {self.name}"
+            )
+
+        return BatchRewardOutput(
+            rewards=torch.from_numpy(rewards),
+            timings=torch.from_numpy(timings),
+            extra_info={
+                **merge_extra_info([result[3] for result in results]),
+                "processes": self.processes,
+                "timeouts": timeouts,
+            },
+        )
+
+    def reward_batch(
+        self, requests: List[Tuple[str, List[str]]]
+    ) -> List[BatchRewardOutput]:
+        # Models which share work between requests score them all in one worker, and the others are sharded as usual
+        if type(self.reward_model).reward_batch is BaseRewardModel.reward_batch:
+            return super().reward_batch(requests)
+
+        num_completions = sum(len(completions) for _, completions in requests)
+        (outputs,) = self.run(
+            [(_reward_batch, requests, self.completion_timeout * num_completions)]
+        )
+        if outputs is not None:
+            return outputs
+
+        # One of the completions may be holding up the batch, so each completion is scored under its own time limit
+        bt.logging.warning(
+            f"Scoring {num_completions} completions together with {self.name} took too long, scoring them one by one"
+        )
+        return super().reward_batch(requests)
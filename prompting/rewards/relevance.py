@@ -1,6 +1,7 @@
+import os
 import time
 import torch
-from typing import List
+from typing import Dict, List, Tuple
 from angle_emb import AnglE
 from torch.nn.functional import cosine_similarity
 from prompting.rewards import (
@@ -8,56 +9,268 @@ from prompting.rewards import (
     BatchRewardOutput,
     RewardModelTypeEnum,
 )
+from prompting.rewards.embedding_cache import EmbeddingCache
+from prompting.rewards.completion_batch import as_completion_batch
 
 
 class RelevanceRewardModel(BaseRewardModel):
+    """Rewards completions by the cosine similarity of their UAE-Large embedding with the embedding of the reference.
+
+    Args:
+        threshold (float, optional): Logged with the rewards. Defaults to None.
+        device (str, optional): Device of the model. Defaults to None.
+        pooling_strategy (str, optional): Pooling strategy of AnglE. Defaults to "cls".
+        batch_size (int, optional): Number of texts encoded together. Defaults to 32.
+        cache_max_bytes (int, optional): Size of the in-memory embedding cache. Defaults to 2**28.
+        cache_path (str, optional): Directory of the on-disk embedding cache, if any. It must not be shared between
+            processes, such as several validators on one machine. Defaults to None.
+        backend (str, optional): "torch" to run the model as loaded, or "int8" to apply dynamic int8 quantization to
+            its linear layers, which is much faster on cpu. Check the accuracy of "int8" with
+            `python -m prompting.rewards.relevance_accuracy`. Defaults to "torch".
+        max_length (int, optional): Number of tokens of each text which are encoded, including special tokens.
+            Defaults to 512.
+        chunking (str, optional): "truncate" to encode the first max_length tokens of longer texts, or "head_tail"
+            to encode their first and last max_length tokens and average the two embeddings. Defaults to "truncate".
+        num_threads (int, optional): Number of threads torch uses on cpu. Defaults to None, which keeps the torch
+            default.
+    """
+
     @property
     def name(self) -> str:
         return "relevance"
 
-    def __init__(self, threshold=None, device=None, pooling_strategy="cls"):
+    def __init__(
+        self,
+        threshold=None,
+        device=None,
+        pooling_strategy="cls",
+        batch_size=32,
+        cache_max_bytes=2**28,
+        cache_path=None,
+        backend="torch",
+        max_length=512,
+        chunking="truncate",
+        num_threads=None,
+    ):
         super().__init__()
         self.threshold = threshold
+        self.batch_size = batch_size
+        self.device = device
+        self.backend = backend
+        self.max_length = max_length
+        self.chunking = chunking
+        if chunking not in ("truncate", "head_tail"):
+            raise ValueError(
+                f"chunking {chunking} not supported. Please choose from truncate, head_tail"
+            )
+        if backend not in ("torch", "int8"):
+            raise ValueError(
+                f"backend {backend} not supported. Please choose from torch, int8"
+            )
+        if backend == "int8" and not device.startswith("cpu"):
+            raise ValueError(f"The int8 backend runs on cpu, not {device}")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
         self.model = AnglE.from_pretrained(
             "WhereIsAI/UAE-Large-V1", pooling_strategy=pooling_strategy, device=device
         )
         if device.startswith("cuda"):
             # This line is necessary to pass the model to the device defined at its initialization
             self.model = self.model.cuda()
+        if backend == "int8":
+            # Quantized in place, as the pooler of AnglE keeps a reference to the backbone
+            torch.quantization.quantize_dynamic(
+                self.model.backbone, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        # Longer texts are truncated when they are encoded
+        self.model.max_length = max_length
+        if cache_path is not None:
+            # Embeddings of different backends and length policies differ slightly, so they are not cached together
+            cache_path = os.path.join(cache_path, f"{backend}_{max_length}_{chunking}")
+
+        # The embedding of an empty string (a failed completion) is the same for every reference
+        self.baseline_embedding = (
+            self.model.encode("", to_numpy=False).float().cpu().reshape(1, -1)
+        )
+        # Identical references and completions (empty strings, echoes, copied answers) are only embedded once
+        self.cache = EmbeddingCache(
+            dim=self.baseline_embedding.shape[-1],
+            max_bytes=cache_max_bytes,
+            path=cache_path,
+        )
+
+    @property
+    def uses_gpu(self) -> bool:
+        return self.device.startswith("cuda")
+
+    @property
+    def is_expensive(self) -> bool:
+        return True
+
+    def segment(
+        self, texts: List[str], stats: Dict[str, int]
+    ) -> Tuple[List[str], List[int], List[List[int]]]:
+        """Splits texts into the segments which are encoded, according to the length policy. Texts which fit in
+        max_length tokens are a single segment. Longer texts are truncated by the model, or split into their first
+        and last max_length tokens with chunking="head_tail".
+
+        Returns:
+            Tuple[List[str], List[int], List[List[int]]]: The segments, their lengths in tokens, and the indices of the
+                segments of each text.
+        """
+        segments, lengths, text_segments = [], [], []
+        if not texts:
+            return segments, lengths, text_segments
+
+        # Room for the [CLS] and [SEP] tokens which the model adds
+        cap = self.max_length - 2
+        tokenizer = self.model.tokenizer
+        for text, ids in zip(
+            texts, tokenizer(texts, add_special_tokens=False)["input_ids"]
+        ):
+            if len(ids) > cap and self.chunking == "head_tail":
+                stats["chunked"] += 1
+                text_segments.append([len(segments), len(segments) + 1])
+                segments += [tokenizer.decode(ids[:cap]), tokenizer.decode(ids[-cap:])]
+                lengths += [cap, cap]
+                continue
+
+            if len(ids) > cap:
+                stats["truncated"] += 1
+            text_segments.append([len(segments)])
+            segments.append(text)
+            lengths.append(min(len(ids), cap))
+
+        return segments, lengths, text_segments
+
+    def encode(
+        self, texts: List[str], keys: List[str] = None, stats: Dict[str, int] = None
+    ) -> torch.Tensor:
+        """Looks up the embeddings of the texts in the cache, and encodes the others in micro-batches of texts with
+        a similar number of tokens, so that short texts are not padded to the length of the longest one.
+
+        Args:
+            texts (List[str]): The texts to encode.
+            keys (List[str], optional): The cache keys of the texts, if they are already hashed. Defaults to None.
+            stats (Dict[str, int], optional): Counts of the texts which are "truncated" or "chunked" to max_length,
+                which are incremented. Defaults to None.
+
+        Returns:
+            torch.Tensor: The embeddings on the cpu, in the same order as the texts.
+        """
+        if keys is None:
+            keys = [self.cache.key(text) for text in texts]
+        if stats is None:
+            stats = {"truncated": 0, "chunked": 0}
+        embeddings = self.cache.get(texts, keys=keys)
+        text_keys = dict(zip(texts, keys))
+
+        # Each missing text is encoded once, even if it appears several times
+        missing = list(
+            dict.fromkeys(
+                text for text, embedding in zip(texts, embeddings) if embedding is None
+            )
+        )
+        segments, lengths, text_segments = self.segment(missing, stats)
+
+        order = sorted(range(len(segments)), key=lambda i: lengths[i])
+        segment_embeddings = [None] * len(segments)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            batch_embeddings = self.model.encode(
+                [segments[i] for i in batch], to_numpy=False
+            )
+            for i, embedding in zip(batch, batch_embeddings.float().cpu()):
+                segment_embeddings[i] = embedding
+
+        # The embedding of a chunked text is the mean of the embeddings of its chunks
+        encoded = {
+            text: torch.stack([segment_embeddings[i] for i in indices]).mean(dim=0)
+            for text, indices in zip(missing, text_segments)
+        }
+        if missing:
+            self.cache.put(
+                missing,
+                torch.stack([encoded[text] for text in missing]),
+                keys=[text_keys[text] for text in missing],
+            )
+
+        return torch.stack(
+            [
+                encoded[text] if embedding is None else embedding
+                for text, embedding in zip(texts, embeddings)
+            ]
+        )
 
     def reward(self, reference: str, completions: List[str]) -> BatchRewardOutput:
         """Calculates the cosine similarity between sentence embeddings of the reference and completions.
         We subtract a baseline score which is what an empty string would get (a failed completion). This is usually around 0.35
         We also clip the rewards between 0 and 1. The maximum effective score is around 0.65
         """
-        reference_embedding = self.model.encode(reference, to_numpy=False)
-        rewards = []
-        timings = []
-        # baseline is the cosine similarity between the reference and an empty string
-        baseline = cosine_similarity(
-            reference_embedding.reshape(1, -1),
-            self.model.encode("", to_numpy=False).reshape(1, -1),
-        )
+        return self.reward_batch([(reference, completions)])[0]
+
+    def reward_batch(
+        self, requests: List[Tuple[str, List[str]]]
+    ) -> List[BatchRewardOutput]:
+        """Scores several (reference, completions) requests with the texts of all of them encoded together."""
+        t0 = time.time()
+        texts = []
+        keys = []
+        for reference, completions in requests:
+            # The hashes of the completions are shared with the other models of the step
+            completions = as_completion_batch(completions)
+            texts += [reference] + completions
+            keys += [self.cache.key(reference)] + completions.hashes
+        stats = {"truncated": 0, "chunked": 0}
+        embeddings = self.encode(texts, keys=keys, stats=stats)
 
-        for comp in completions:
-            t0 = time.time()
+        # Completions are encoded together, so each one is assigned an equal share of the batch time
+        num_completions = len(texts) - len(requests)
+        timing = (time.time() - t0) / max(num_completions, 1)
 
-            emb = self.model.encode(comp, to_numpy=False)
-            # Calculate cosine similarity between reference and completion embeddings, and subtract baseline
-            score = (
-                cosine_similarity(
-                    reference_embedding.reshape(1, -1), emb.reshape(1, -1)
+        outputs = []
+        start = 0
+        for _, completions in requests:
+            end = start + 1 + len(completions)
+            outputs.append(
+                self.similarity_output(
+                    embeddings[start : start + 1],
+                    embeddings[start + 1 : end],
+                    timing,
+                    stats,
                 )
-                - baseline
             )
+            start = end
+        return outputs
 
-            rewards.append(score)
-            timings.append(time.time() - t0)
+    def similarity_output(
+        self,
+        reference_embedding: torch.Tensor,
+        completion_embeddings: torch.Tensor,
+        timing: float,
+        stats: Dict[str, int],
+    ) -> BatchRewardOutput:
+        # baseline is the cosine similarity between the reference and an empty string
+        baseline = cosine_similarity(reference_embedding, self.baseline_embedding)
+        # Calculate cosine similarity between reference and all completion embeddings at once, and subtract baseline
+        rewards = (
+            cosine_similarity(reference_embedding, completion_embeddings) - baseline
+        )
 
         output = BatchRewardOutput(
-            rewards=torch.FloatTensor(rewards).clip(min=0, max=1),
-            timings=torch.FloatTensor(timings),
-            extra_info={"threshold": self.threshold},
+            rewards=rewards.float().cpu().clip(min=0, max=1),
+            timings=torch.FloatTensor([timing] * len(completion_embeddings)),
+            extra_info={
+                "threshold": self.threshold,
+                "backend": self.backend,
+                "max_length": self.max_length,
+                "chunking": self.chunking,
+                # Texts encoded for the whole batch which were longer than max_length, including those of other requests
+                **stats,
+                "embedding_cache_hit_rate": self.cache.hit_rate,
+                "embedding_cache_bytes": self.cache.bytes,
+            },
         )
 
         return output
@@ -0,0 +1,144 @@
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from typing import List, Tuple
+from torch.nn.functional import cosine_similarity
+from prompting.rewards.relevance import RelevanceRewardModel
+
+# A fixed corpus of references, each with completions which range from close paraphrases to unrelated text
+CORPUS: List[Tuple[str, List[str]]] = [
+    (
+        "The capital of Texas is Austin, which is also the fourth largest city in the state.",
+        [
+            "Austin is the capital of Texas.",
+            "Texas has its capital in Austin, one of its largest cities.",
+            "Dallas is a large city in Texas.",
+            "The Eiffel Tower is in Paris.",
+            "",
+        ],
+    ),
+    (
+        "Photosynthesis is the process by which plants use sunlight, water and carbon dioxide to produce glucose and oxygen.",
+        [
+            "Plants make glucose and oxygen from sunlight, water and CO2 through photosynthesis.",
+            "Photosynthesis happens in the chloroplasts of plant cells.",
+            "Animals breathe in oxygen and breathe out carbon dioxide.",
+            "The stock market closed higher today.",
+        ],
+    ),
+    (
+        "def add(a, b):\n    return a + b",
+        [
+            "def add(x, y):\n    return x + y",
+            "def add(a, b):\n    return a - b",
+            "The function adds two numbers and returns the result.",
+            "import os",
+        ],
+    ),
+    (
+        "The French Revolution began in 1789 and led to the end of the monarchy in France.",
+        [
+            "In 1789 the French Revolution started, which ended the French monarchy.",
+            "The revolution in France abolished the monarchy.",
+            "Napoleon became emperor of France in 1804.",
+            "Basketball was invented in 1891.",
+        ],
+    ),
+    (
+        "To make a cup of tea, boil water, pour it over a tea bag and let it steep for three to five minutes.",
+        [
+            "Steep a tea bag in boiling water for a few minutes.",
+            "Boil the water first, then add the tea and wait about four minutes.",
+            "Coffee is brewed from roasted coffee beans.",
+            "The train leaves at 5pm.",
+        ],
+    ),
+    (
+        "The derivative of x squared is two x.",
+        [
+            "d/dx x^2 = 2x",
+            "The derivative of x^2 with respect to x is 2x.",
+            "The integral of x is x squared over two.",
+            "Blue whales are the largest animals on Earth.",
+        ],
+    ),
+]
+
+
+def cosine_scores(
+    model: RelevanceRewardModel, corpus: List[Tuple[str, List[str]]]
+) -> Tuple[np.ndarray, float]:
+    """Returns the cosine similarity of every completion of the corpus with its reference, and the seconds it took."""
+    scores = []
+    t0 = time.time()
+    for reference, completions in corpus:
+        embeddings = model.model.encode([reference] + completions, to_numpy=False)
+        embeddings = embeddings.float().cpu()
+        scores.append(cosine_similarity(embeddings[:1], embeddings[1:]).numpy())
+    return np.concatenate(scores), time.time() - t0
+
+
+def compare_relevance(
+    reference_model: RelevanceRewardModel,
+    candidate_model: RelevanceRewardModel,
+    corpus: List[Tuple[str, List[str]]] = CORPUS,
+) -> dict:
+    """Compares the cosine scores of a candidate backend with those of a reference backend on the corpus.
+
+    Returns:
+        dict: The maximum and mean absolute difference of the scores, the fraction of pairs of completions of the same
+            reference which both backends rank in the same order, and the time each backend took.
+    """
+    reference_scores, reference_time = cosine_scores(reference_model, corpus)
+    candidate_scores, candidate_time = cosine_scores(candidate_model, corpus)
+    diffs = np.abs(reference_scores - candidate_scores)
+
+    agreements = []
+    start = 0
+    for _, completions in corpus:
+        end = start + len(completions)
+        for i in range(start, end):
+            for j in range(i + 1, end):
+                agreements.append(
+                    np.sign(reference_scores[i] - reference_scores[j])
+                    == np.sign(candidate_scores[i] - candidate_scores[j])
+                )
+        start = end
+
+    return {
+        "max_abs_diff": float(diffs.max()),
+        "mean_abs_diff": float(diffs.mean()),
+        "rank_agreement": float(np.mean(agreements)),
+        "reference_time": reference_time,
+        "candidate_time": candidate_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks the cosine scores of the int8 cpu relevance backend against the fp32 model."
+    )
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--num_threads", type=int, default=None)
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    args = parser.parse_args()
+
+    reference_model = RelevanceRewardModel(device=args.device, backend="torch")
+    candidate_model = RelevanceRewardModel(
+        device="cpu",
+        backend="int8",
+        max_length=args.max_length,
+        num_threads=args.num_threads,
+    )
+    results = compare_relevance(reference_model, candidate_model)
+    print(json.dumps(results, indent=2))
+
+    if results["max_abs_diff"] > args.tolerance:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
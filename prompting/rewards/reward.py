@@ -1,10 +1,21 @@
+import os
 import torch
 import time
 import bittensor as bt
-from typing import List
+from typing import List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
+from prompting.rewards.completion_batch import CompletionBatch
+
+
+# Reward models are applied concurrently. GPU models share a single worker so that they don't contend for the device,
+# while CPU models get their own pool so that they run alongside them.
+GPU_REWARD_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu_reward")
+CPU_REWARD_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="cpu_reward"
+)
 
 
 class RewardModelTypeEnum(Enum):
@@ -36,6 +47,18 @@ class RewardEvent:
         }
 
 
+def compile_weights(task, device=None) -> Tuple[torch.FloatTensor, torch.FloatTensor]:
+    """Returns the weights of the reward and penalty models of a task, in the order of their definitions."""
+    return tuple(
+        torch.tensor(
+            [model_info["weight"] for model_info in definition or []],
+            dtype=torch.float32,
+            device=device,
+        )
+        for definition in (task.reward_definition, task.penalty_definition)
+    )
+
+
 class RewardResult:
     def __init__(self, reward_pipeline, agent, response_event, device):
         """Passes the responses through the reward models and calculates the total reward
@@ -51,35 +74,215 @@ class RewardResult:
         self.response_event = response_event
         self.device = device
         self.task_rewards = agent.task.reward_definition
-        self.task_penalties = agent.task.penalty_definition
-        self.reward_events = self.reward_responses(
+        self.task_penalties = agent.task.penalty_definition or []
+        # The weights of the models in definition order, which the pipeline compiles once per task class
+        task_weights = getattr(reward_pipeline, "task_weights", {})
+        self.reward_weights, self.penalty_weights = task_weights.get(
+            type(agent.task)
+        ) or compile_weights(agent.task, device)
+        # Identical completions (empty responses, timeouts, copied answers) are scored once, and their results are
+        # scattered back to every uid which returned them
+        unique_completions = list(dict.fromkeys(response_event.completions))
+        positions = {completion: i for i, completion in enumerate(unique_completions)}
+        self.unique_index = torch.tensor(
+            [positions[completion] for completion in response_event.completions],
+            dtype=torch.long,
+        )
+        self.dedup_ratio = 1 - len(unique_completions) / max(
+            len(response_event.completions), 1
+        )
+        bt.logging.debug(
+            f"Scoring {len(unique_completions)} unique completions out of {len(response_event.completions)} (dedup ratio {self.dedup_ratio:.2f})"
+        )
+        # Shared by all models, so that the completions are only tokenized and hashed once
+        self.completions = CompletionBatch(unique_completions)
+
+        # In cascade mode, expensive models wait for the cheap ones and only score the completions which pass a gate
+        self.cascade = getattr(reward_pipeline, "cascade", False)
+        self.cascade_skipped = 0
+
+        # All other reward and penalty models are submitted before waiting on any of them, so that they run concurrently
+        t0 = time.time()
+        reward_futures = self.submit_reward_responses(
             reference=agent.task.reference,
             models=self.task_rewards,
             reward_type=RewardModelTypeEnum.WEIGHTED_REWARD,
         )
-        self.penalty_events = self.reward_responses(
+        penalty_futures = self.submit_reward_responses(
             reference=agent.challenge,
             models=self.task_penalties,
             reward_type=RewardModelTypeEnum.PENALTY,
         )
+        reward_events = [
+            future.result() if future else None for future in reward_futures
+        ]
+        penalty_events = [
+            future.result() if future else None for future in penalty_futures
+        ]
+
+        if any(event is None for event in reward_events + penalty_events):
+            passed = self.cascade_gate(reward_events)
+            reward_events = self.run_deferred(
+                agent.task.reference,
+                self.task_rewards,
+                reward_events,
+                passed,
+                RewardModelTypeEnum.WEIGHTED_REWARD,
+            )
+            penalty_events = self.run_deferred(
+                agent.challenge,
+                self.task_penalties,
+                penalty_events,
+                passed,
+                RewardModelTypeEnum.PENALTY,
+            )
+
+        self.reward_events = [self.scatter(event) for event in reward_events]
+        self.penalty_events = [self.scatter(event) for event in penalty_events]
+        # Wall clock time of all models together, which is less than the sum of their batch times when they overlap
+        self.batch_time = time.time() - t0
+
         self.rewards = self.total_reward()
 
     def __state_dict__(self, full=False):
-        state = {"rewards": self.rewards.tolist()}
+        state = {
+            "rewards": self.rewards.tolist(),
+            "reward_pipeline_time": self.batch_time,
+            "unique_completions": len(self.completions),
+            "dedup_ratio": self.dedup_ratio,
+            "cascade_skipped": self.cascade_skipped,
+        }
         for event in self.reward_events + self.penalty_events:
             state.update(event.asdict())
         return state
 
-    def reward_responses(
-        self, reference: str, models: List[dict], reward_type: RewardModelTypeEnum
+    def scatter(self, event: RewardEvent) -> RewardEvent:
+        """Expands an event of the unique completions to one value per completion."""
+        return replace(
+            event,
+            rewards=event.rewards[self.unique_index],
+            rewards_normalized=event.rewards_normalized[self.unique_index],
+            timings=event.timings[self.unique_index],
+        )
+
+    def cascade_gate(self, reward_events: List[RewardEvent]) -> torch.BoolTensor:
+        """Selects the unique completions which expensive models score in cascade mode: those which are not empty, were
+        returned with an accepted status code by at least one uid, and whose weighted score from the cheap reward models
+        reaches the floor of the pipeline.
+        """
+        passed = torch.tensor(
+            [bool(completion.strip()) for completion in self.completions],
+            dtype=torch.bool,
+        )
+
+        status_codes = getattr(self.response_event, "status_codes", None)
+        if status_codes is not None:
+            accepted = torch.zeros(len(self.completions), dtype=torch.bool)
+            for index, status_code in zip(self.unique_index.tolist(), status_codes):
+                if status_code in self.reward_pipeline.cascade_status_codes:
+                    accepted[index] = True
+            passed &= accepted
+
+        cheap = [
+            (event, reward_info["weight"])
+            for event, reward_info in zip(reward_events, self.task_rewards)
+            if event is not None
+        ]
+        total_weight = sum(weight for _, weight in cheap)
+        if total_weight:
+            score = sum(weight * event.rewards.cpu() for event, weight in cheap)
+            passed &= score / total_weight >= self.reward_pipeline.cascade_floor
+
+        return passed
+
+    def run_deferred(
+        self,
+        reference: str,
+        models: List[dict],
+        events: List[RewardEvent],
+        passed: torch.BoolTensor,
+        reward_type: RewardModelTypeEnum,
     ) -> List[RewardEvent]:
-        """Calculates the rewards for the responses given the task and returns a RewardEvent for each reward model
+        """Applies the deferred models to the completions which passed the cascade gate. The other completions get the
+        fill value of the pipeline.
+        """
+        indices = passed.nonzero().flatten()
+        deferred = [model for model, event in zip(models, events) if event is None]
+        skipped = len(deferred) * (len(self.completions) - len(indices))
+        self.cascade_skipped += skipped
+        bt.logging.debug(
+            f"Cascade skipped {skipped} evaluations of {[model['name'] for model in deferred]}"
+        )
+
+        futures = iter(
+            self.submit_reward_responses(
+                reference,
+                models=deferred,
+                reward_type=reward_type,
+                completions=self.completions.subset(indices),
+                defer=False,
+            )
+            if len(indices)
+            else [None] * len(deferred)
+        )
+
+        filled_events = []
+        for model, event in zip(models, events):
+            if event is None:
+                event = self.fill(model["name"], next(futures), indices, reward_type)
+            filled_events.append(event)
+        return filled_events
+
+    def fill(
+        self,
+        model_name: str,
+        future: Future,
+        indices: torch.LongTensor,
+        reward_type: RewardModelTypeEnum,
+    ) -> RewardEvent:
+        """Expands an event of the completions which passed the cascade gate to all unique completions. The rewards are
+        normalized again over all unique completions, so that the filled and scored ones are on the same scale.
+        """
+        fill_value = self.reward_pipeline.cascade_fill
+        rewards = torch.full((len(self.completions),), fill_value, dtype=torch.float32)
+        timings = torch.zeros(len(self.completions))
+        if future is None:
+            return RewardEvent(
+                model_name=model_name,
+                rewards=rewards,
+                rewards_normalized=normalize(rewards),
+                timings=timings,
+                model_type=reward_type,
+                batch_time=0,
+                extra_info={},
+            )
+
+        event = future.result()
+        rewards[indices] = event.rewards.float().cpu()
+        timings[indices] = event.timings.float().cpu()
+        return replace(
+            event,
+            rewards=rewards,
+            rewards_normalized=normalize(rewards),
+            timings=timings,
+        )
+
+    def submit_reward_responses(
+        self,
+        reference: str,
+        models: List[dict],
+        reward_type: RewardModelTypeEnum,
+        completions: CompletionBatch = None,
+        defer: bool = True,
+    ) -> List[Optional[Future]]:
+        """Submits the reward models to their executors and returns a future of a RewardEvent for each reward model,
+        in the same order as the models. In cascade mode, expensive models are deferred and get None instead.
         reward_events: List[RewardEvent] = [
             RewardEvent(model_name='rouge', rewards=torch.zeros(50), timings=torch.zeros(50), ...),
             RewardEvent(model_name='relevance', rewards=torch.zeros(50), timings=torch.zeros(50), ...),
         ]
         """
-        reward_events = []
+        reward_futures = []
 
         for reward_info in models:
             # Select the reward model from preloaded reward model pipeline
@@ -88,44 +291,58 @@ class RewardResult:
                 raise ValueError(
                     f"Reward model {reward_info['name']} not supported. Please choose from {self.reward_pipeline.keys()}"
                 )
+            if defer and self.cascade and reward_model.is_expensive:
+                reward_futures.append(None)
+                continue
+
+            executor = (
+                GPU_REWARD_EXECUTOR if reward_model.uses_gpu else CPU_REWARD_EXECUTOR
+            )
             # Compute the rewards for the responses given the prompt
-            reward_event = reward_model.apply(
-                reference, self.response_event, reward_type=reward_type
+            reward_futures.append(
+                executor.submit(
+                    reward_model.apply,
+                    reference,
+                    self.completions if completions is None else completions,
+                    reward_type=reward_type,
+                )
             )
-            reward_events.append(reward_event)
 
-        return reward_events
+        return reward_futures
 
     def total_reward(self) -> torch.FloatTensor:
         """Combines the rewards from all the reward models into a single reward tensor"""
 
         # TODO: How would using the Agent as a reward model fit into this flow?
-        # Compute the rewards for the responses given the prompt
-        rewards = torch.zeros_like(
-            self.response_event.uids, dtype=torch.float32, device=self.device
+        # The events are stacked into one [models x uids] tensor, which is moved to the device once
+        rewards = torch.zeros(
+            len(self.response_event.uids), dtype=torch.float32, device=self.device
         )
-        rewards = torch.zeros_like(
-            self.response_event.uids, dtype=torch.float32, device=self.device
-        )
-
-        for event in self.reward_events:
-            for reward_info in filter(
-                lambda x: x["name"] == event.model_name, self.task_rewards
-            ):
-                rewards += reward_info["weight"] * event.rewards.to(self.device)
+        if self.reward_events:
+            event_rewards = self.stack_rewards(self.reward_events)
+            rewards = self.reward_weights.to(self.device) @ event_rewards
 
-        for event in self.penalty_events:
-            for reward_info in filter(
-                lambda x: x["name"] == event.model_name, self.task_penalties
-            ):
-                rewards *= 1 - reward_info["weight"] * event.rewards.to(self.device)
+        if self.penalty_events:
+            event_penalties = self.stack_rewards(self.penalty_events)
+            penalty_weights = self.penalty_weights.to(self.device).unsqueeze(1)
+            rewards *= (1 - penalty_weights * event_penalties).prod(dim=0)
 
         return rewards
 
+    def stack_rewards(self, events: List[RewardEvent]) -> torch.FloatTensor:
+        return torch.stack([event.rewards.float().cpu() for event in events]).to(
+            self.device
+        )
+
     def __str__(self):
         return f"{self.__class__.__name__}(rewards={self.rewards!r}, reward_events={self.reward_events!r}, penalty_events={self.penalty_events!r})"
 
 
+def normalize(rewards: torch.FloatTensor) -> torch.FloatTensor:
+    """Min-max normalizes the rewards of a batch."""
+    return (rewards - rewards.min()) / (rewards.max() - rewards.min() + 1e-6)
+
+
 @dataclass
 class BatchRewardOutput:
     rewards: torch.FloatTensor
@@ -138,9 +355,7 @@ class BatchRewardOutput:
                 f"rewards.shape {self.rewards.shape} != timings.shape {self.timings.shape}"
             )
 
-        self.rewards_normalized = (self.rewards - self.rewards.min()) / (
-            self.rewards.max() - self.rewards.min() + 1e-6
-        )
+        self.rewards_normalized = normalize(self.rewards)
 
 
 class BaseRewardModel(ABC):
@@ -153,13 +368,35 @@ class BaseRewardModel(ABC):
     def __init__(self, **kwargs):
         pass
 
+    @property
+    def uses_gpu(self) -> bool:
+        """Whether the model runs on the gpu, which decides the executor it is applied on."""
+        return False
+
+    @property
+    def is_expensive(self) -> bool:
+        """Whether the model is expensive, so that it only scores completions which pass the gate in cascade mode."""
+        return False
+
     @abstractmethod
     def reward(self, reference: str, completions: List[str]) -> BatchRewardOutput:
         pass
 
-    def apply(self, reference: str, response_event, reward_type) -> RewardEvent:
+    def reward_batch(
+        self, requests: List[Tuple[str, List[str]]]
+    ) -> List[BatchRewardOutput]:
+        """Scores several (reference, completions) requests. Models which can share work between requests, such as
+        encoding all texts together, override this.
+        """
+        return [
+            self.reward(reference, completions) for reference, completions in requests
+        ]
+
+    def apply(
+        self, reference: str, completions: CompletionBatch, reward_type
+    ) -> RewardEvent:
         t0 = time.time()
-        batch_rewards_output = self.reward(reference, response_event.completions)
+        batch_rewards_output = self.reward(reference, completions)
         batch_rewards_time = time.time() - t0
 
         return RewardEvent(
@@ -2,6 +2,8 @@ import time
 import torch
 from typing import List
 from rouge import Rouge
+from prompting.rewards.native_rouge import NativeRouge
+from prompting.rewards.completion_batch import as_completion_batch
 from prompting.rewards import (
     BaseRewardModel,
     BatchRewardOutput,
@@ -14,11 +16,21 @@ class RougeRewardModel(BaseRewardModel):
     def name(self) -> str:
         return "rouge"
 
-    def __init__(self, ngram="rouge-l", metric="f", avg=False, device=None, **kwargs):
+    def __init__(
+        self,
+        ngram="rouge-l",
+        metric="f",
+        avg=False,
+        device=None,
+        native=False,
+        **kwargs
+    ):
         super().__init__()
         self.ngram = ngram
         self.metric = metric
         self.avg = avg
+        # The native engine processes the reference once per batch, and matches the default `rouge` settings
+        self.native = native
         self.rouge = Rouge(**kwargs)
 
     def rouge_score(self, reference, completion):
@@ -32,10 +44,33 @@ class RougeRewardModel(BaseRewardModel):
         """Compute ROUGE scores given a completion and reference pair."""
         rewards = []
         timings = []
+        # rouge_score passes the reference as the hypothesis, which the native engine reproduces
+        native_rouge = (
+            NativeRouge(reference, text_is_hypothesis=True) if self.native else None
+        )
+
+        if native_rouge is not None:
+            # The sentences and n-grams of the completions are shared with the other models of the step
+            completions = as_completion_batch(completions)
+            sentences = completions.sentences
+            ngram_counts = (
+                completions.ngram_counts(int(self.ngram[-1]))
+                if self.ngram in ("rouge-1", "rouge-2")
+                else [None] * len(completions)
+            )
 
-        for completion in completions:
+        for i, completion in enumerate(completions):
             t0 = time.time()
-            rewards.append(self.rouge_score(reference, completion))
+            if native_rouge is not None:
+                score = native_rouge.score(
+                    completion,
+                    ngram=self.ngram,
+                    other_sentences=sentences[i],
+                    other_ngrams=ngram_counts[i],
+                )[self.metric]
+            else:
+                score = self.rouge_score(reference, completion)
+            rewards.append(score)
             timings.append(time.time() - t0)
 
         output = BatchRewardOutput(
@@ -45,6 +80,7 @@ class RougeRewardModel(BaseRewardModel):
                 "ngram": self.ngram,
                 "metric": self.metric,
                 "avg": self.avg,
+                "native": self.native,
             },
         )
 
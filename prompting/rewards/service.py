@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import torch
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+import bittensor as bt
+from typing import Any, Dict, List
+from prompting.tasks import TASKS
+from prompting.rewards import BaseRewardModel, BatchRewardOutput
+from prompting.rewards.pipeline import RewardPipeline
+
+# Messages are JSON objects, each prefixed with its length in bytes
+HEADER = struct.Struct(">I")
+
+
+def send_message(sock: socket.socket, message: dict):
+    data = json.dumps(message, default=str).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+def recv_message(sock: socket.socket) -> dict:
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+class _Request:
+    def __init__(self, reference: str, completions: List[str]):
+        self.reference = reference
+        self.completions = completions
+        self.done = threading.Event()
+        self.output: BatchRewardOutput = None
+        self.error = None
+
+
+class _ModelBatcher:
+    """Collects the requests of all clients for one model, and scores them together with `reward_batch`."""
+
+    def __init__(
+        self, reward_model: BaseRewardModel, window: float, max_batch_size: int
+    ):
+        self.reward_model = reward_model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending: List[_Request] = []
+        self.condition = threading.Condition()
+        self.num_batches = 0
+        self.num_requests = 0
+
+        self.dispatcher = threading.Thread(
+            target=self.dispatch,
+            name=f"reward_batch_dispatcher_{reward_model.name}",
+            daemon=True,
+        )
+        self.dispatcher.start()
+
+    def __call__(self, reference: str, completions: List[str]) -> BatchRewardOutput:
+        request = _Request(reference, completions)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify_all()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.output
+
+    def next_batch(self) -> List[_Request]:
+        """Waits for a request, then keeps collecting requests until the window closes or the batch is full."""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+
+            deadline = time.time() + self.window
+            while len(self.pending) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.pending[: self.max_batch_size]
+            self.pending = self.pending[self.max_batch_size :]
+            return batch
+
+    def dispatch(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                outputs = self.reward_model.reward_batch(
+                    [(request.reference, request.completions) for request in batch]
+                )
+                for request, output in zip(batch, outputs):
+                    request.output = output
+            except Exception as e:
+                bt.logging.error(
+                    f"Scoring {len(batch)} requests with {self.reward_model.name} failed: {e}"
+                )
+                for request in batch:
+                    request.error = e
+
+            self.num_batches += 1
+            self.num_requests += len(batch)
+            for request in batch:
+                request.done.set()
+
+
+class RewardServer:
+    """Hosts reward models once for several validator processes on the same machine, over a Unix domain socket.
+
+    Each client connection is served by its own thread. The requests of all clients for a model which overrides
+    `reward_batch` are collected for up to `window` seconds and scored together, so that e.g. the embeddings of several
+    validators are computed in one batch. Other models score each request directly on its connection thread.
+
+    Args:
+        reward_models (Dict[str, BaseRewardModel]): The models to serve, by name.
+        path (str): Path of the socket. A stale socket at this path is replaced.
+        window (float, optional): Seconds to wait for requests of other clients. Defaults to 0.01.
+        max_batch_size (int, optional): The maximum number of requests scored together. Defaults to 16.
+    """
+
+    def __init__(
+        self,
+        reward_models: Dict[str, BaseRewardModel],
+        path: str,
+        window: float = 0.01,
+        max_batch_size: int = 16,
+    ):
+        self.reward_models = reward_models
+        self.path = path
+        # Only models which share work between requests are batched, the others are scored on the connection thread
+        self.batchers = {
+            name: _ModelBatcher(model, window=window, max_batch_size=max_batch_size)
+            for name, model in reward_models.items()
+            if type(model).reward_batch is not BaseRewardModel.reward_batch
+        }
+
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, self._handler())
+        self.server.daemon_threads = True
+        # Only processes of the same user can send requests
+        os.chmod(path, 0o600)
+        self.thread = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(path={self.path!r}, models={list(self.reward_models)})"
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        message = recv_message(self.request)
+                    except ConnectionError:
+                        return
+                    send_message(self.request, server.handle(message))
+
+        return Handler
+
+    def handle(self, message: dict) -> dict:
+        """Answers a request of a client."""
+        if message.get("op") == "models":
+            return {
+                "models": {
+                    name: {"is_expensive": model.is_expensive}
+                    for name, model in self.reward_models.items()
+                }
+            }
+
+        if message.get("op") == "reward":
+            reward_model = self.reward_models.get(message["model"])
+            if reward_model is None:
+                return {"error": f"Reward model {message['model']} is not served"}
+            score = self.batchers.get(message["model"], reward_model.reward)
+            try:
+                output = score(message["reference"], message["completions"])
+            except Exception as e:
+                return {"error": f"{type(e).__name__}: {e}"}
+            return {
+                "rewards": output.rewards.tolist(),
+                "timings": output.timings.tolist(),
+                "extra_info": output.extra_info,
+            }
+
+        return {"error": f"Unknown op {message.get('op')}"}
+
+    def start(self):
+        """Serves in a background thread."""
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="reward_server", daemon=True
+        )
+        self.thread.start()
+
+    def serve_forever(self):
+        bt.logging.info(f"Serving {list(self.reward_models)} on {self.path}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RewardClient:
+    """Client of a RewardServer. Each thread has its own connection, so that models can be applied concurrently."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+    def request(self, message: dict) -> dict:
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self.local.sock = sock
+
+        try:
+            send_message(sock, message)
+            response = recv_message(sock)
+        except (ConnectionError, OSError):
+            # The connection is opened again on the next request, e.g. after the server restarted
+            sock.close()
+            self.local.sock = None
+            raise
+
+        if "error" in response:
+            raise RuntimeError(f"Reward server error: {response['error']}")
+        return response
+
+    def models(self) -> Dict[str, dict]:
+        return self.request({"op": "models"})["models"]
+
+    def reward(
+        self, model: str, reference: str, completions: List[str]
+    ) -> Dict[str, Any]:
+        return self.request(
+            {
+                "op": "reward",
+                "model": model,
+                "reference": reference,
+                "completions": list(completions),
+            }
+        )
+
+
+class RemoteRewardModel(BaseRewardModel):
+    """A reward model which is hosted by a RewardServer."""
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def is_expensive(self) -> bool:
+        return self._is_expensive
+
+    def __init__(self, name: str, client: RewardClient, is_expensive: bool = False):
+        self._name = name
+        self._is_expensive = is_expensive
+        self.client = client
+
+    def reward(self, reference: str, completions: List[str]) -> BatchRewardOutput:
+        response = self.client.reward(self.name, reference, completions)
+        return BatchRewardOutput(
+            rewards=torch.FloatTensor(response["rewards"]),
+            timings=torch.FloatTensor(response["timings"]),
+            extra_info=response["extra_info"],
+        )
+
+
+class RemoteRewardPipeline(RewardPipeline):
+    """RewardPipeline whose models are hosted by a RewardServer at `path` instead of being loaded in this process."""
+
+    def __init__(self, selected_tasks: List[str], device, path: str, **kwargs):
+        self.client = RewardClient(path)
+        super().__init__(selected_tasks, device, **kwargs)
+
+    def load_reward_pipeline(self):
+        served_models = self.client.models()
+
+        reward_models = {}
+        for task in self.selected_tasks:
+            for model in TASKS[task].reward_definition + (
+                TASKS[task].penalty_definition or []
+            ):
+                name = model.get("name")
+                if name not in served_models:
+                    raise ValueError(
+                        f"Reward model {name} is not served at {self.client.path}. It serves {list(served_models)}"
+                    )
+                reward_models[name] = RemoteRewardModel(
+                    name, self.client, **served_models[name]
+                )
+
+        self.reward_models = reward_models
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Hosts the reward models of the given tasks for the validators on this machine."
+    )
+    parser.add_argument("--path", type=str, default="/tmp/prompting_rewards.sock")
+    parser.add_argument("--tasks", type=str, nargs="+", default=list(TASKS))
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--window", type=float, default=0.01)
+    parser.add_argument("--max_batch_size", type=int, default=16)
+    parser.add_argument(
+        "--relevance_backend", type=str, choices=["torch", "int8"], default="torch"
+    )
+    parser.add_argument("--relevance_max_length", type=int, default=512)
+    parser.add_argument(
+        "--relevance_chunking",
+        type=str,
+        choices=["truncate", "head_tail"],
+        default="truncate",
+    )
+    parser.add_argument("--relevance_num_threads", type=int, default=None)
+    parser.add_argument("--relevance_cache_path", type=str, default=None)
+    args = parser.parse_args()
+
+    reward_pipeline = RewardPipeline(
+        selected_tasks=args.tasks,
+        device=args.device,
+        model_kwargs={
+            "relevance": dict(
+                backend=args.relevance_backend,
+                max_length=args.relevance_max_length,
+                chunking=args.relevance_chunking,
+                num_threads=args.relevance_num_threads,
+                cache_path=args.relevance_cache_path,
+            )
+        },
+    )
+    RewardServer(
+        reward_pipeline.reward_models,
+        path=args.path,
+        window=args.window,
+        max_batch_size=args.max_batch_size,
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
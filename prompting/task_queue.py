@@ -0,0 +1,285 @@
+# The MIT License (MIT)
+# Copyright © 2024 Yuma Rao
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import sys
+import time
+import queue
+import asyncio
+import threading
+import numpy as np
+import bittensor as bt
+from typing import List
+from collections import deque
+
+from prompting.agent import HumanAgent
+from prompting.conversation import create_task
+from prompting.llms import BasePipeline, vLLM_LLM, batch_query
+from prompting.tasks import Task
+from prompting.cleaners.cleaner import CleanerPipeline
+from prompting.utils.misc import serialize_exception_to_string
+
+
+def create_agent(
+    llm_pipeline: BasePipeline, tasks: List[str], task_p: List[float]
+) -> HumanAgent:
+    """Samples a task according to task_p, creates it and wraps it in an agent which has already generated its challenge.
+
+    Args:
+        llm_pipeline (BasePipeline): The pipeline used to generate the query and challenge.
+        tasks (List[str]): The task names to sample from.
+        task_p (List[float]): The probability of sampling each task.
+
+    Returns:
+        HumanAgent: Agent which is ready to be used in a forward pass.
+    """
+    while True:
+        bt.logging.info(f"📋 Selecting task... from {tasks} with distribution {task_p}")
+        # Create a specific task
+        task_name = np.random.choice(tasks, p=task_p)
+        bt.logging.info(f"📋 Creating {task_name} task... ")
+        try:
+            task = create_task(
+                llm_pipeline=llm_pipeline,
+                task_name=task_name,
+                create_reference=False,
+            )
+            break
+        except Exception as e:
+            bt.logging.error(
+                f"Failed to create {task_name} task. {sys.exc_info()}. Skipping to next task."
+            )
+            continue
+
+    # Create random agent with task, topic, profile...
+    bt.logging.info(f"🤖 Creating agent for {task_name} task... ")
+    return HumanAgent(task=task, llm_pipeline=llm_pipeline, begin_conversation=True)
+
+
+def make_cleaner(task: Task) -> CleanerPipeline:
+    if hasattr(task, "cleaning_pipeline"):
+        return CleanerPipeline(cleaning_pipeline=task.cleaning_pipeline)
+
+
+def create_agents(
+    llm_pipeline: BasePipeline, tasks: List[str], task_p: List[float], n: int
+) -> List[HumanAgent]:
+    """Creates up to n agents, generating the queries of all tasks in one batch and then the challenges and references
+    in a second batch. Tasks which fail to be created are skipped.
+
+    Args:
+        llm_pipeline (BasePipeline): The pipeline used to generate the queries, challenges and references.
+        tasks (List[str]): The task names to sample from.
+        task_p (List[float]): The probability of sampling each task.
+        n (int): The number of agents to create.
+
+    Returns:
+        List[HumanAgent]: Agents which are ready to be used in a forward pass, with their references generated.
+    """
+    created_tasks = []
+    for task_name in np.random.choice(tasks, p=task_p, size=n):
+        try:
+            created_tasks.append(
+                create_task(
+                    llm_pipeline=llm_pipeline,
+                    task_name=task_name,
+                    create_reference=False,
+                    create_query=False,
+                )
+            )
+        except Exception as e:
+            bt.logging.error(
+                f"Failed to create {task_name} task. {sys.exc_info()}. Skipping to next task."
+            )
+
+    bt.logging.info(f"🤖 Generating {len(created_tasks)} queries...")
+    query_tasks = [task for task in created_tasks if not task.static_query]
+    t0 = time.time()
+    queries = batch_query(
+        llms=[
+            vLLM_LLM(llm_pipeline, system_prompt=task.query_system_prompt)
+            for task in query_tasks
+        ],
+        messages=[task.query_prompt for task in query_tasks],
+        cleaners=[make_cleaner(task) for task in query_tasks],
+    )
+    for task, query in zip(query_tasks, queries):
+        task.query = query
+        task.query_time = time.time() - t0
+
+    # The agent system prompts contain the queries, so they can only be created now
+    agents = [
+        HumanAgent(task=task, llm_pipeline=llm_pipeline, begin_conversation=False)
+        for task in created_tasks
+    ]
+    reference_tasks = [task for task in created_tasks if not task.static_reference]
+
+    bt.logging.info(f"🤖 Generating {len(agents)} challenges and references...")
+    t0 = time.time()
+    responses = batch_query(
+        llms=agents
+        + [
+            vLLM_LLM(llm_pipeline, system_prompt=task.reference_system_prompt)
+            for task in reference_tasks
+        ],
+        messages=[HumanAgent.challenge_prompt] * len(agents)
+        + [task.reference_prompt for task in reference_tasks],
+        cleaners=[make_cleaner(task) for task in created_tasks + reference_tasks],
+    )
+    for agent, challenge in zip(agents, responses[: len(agents)]):
+        agent.challenge = agent.task.format_challenge(challenge)
+        agent.challenge_time = time.time() - t0
+    for task, reference in zip(reference_tasks, responses[len(agents) :]):
+        task.reference = reference
+        task.reference_time = time.time() - t0
+
+    return agents
+
+
+class TaskQueue:
+    """Bounded queue of agents which are prepared by background worker threads, so that the forward pass does not wait
+    for the dataset fetch, query generation and challenge generation.
+
+    Each worker prepares batch_size agents at a time, so that their queries, challenges and references are generated
+    in batches. With num_workers=0 no threads are started and agents are created on demand when `get` is called.
+    """
+
+    # Seconds between checks of an empty queue.
+    POLL_INTERVAL = 0.1
+    # Seconds to wait after a worker fails to create agents, doubled after each consecutive failure.
+    ERROR_BACKOFF = 1
+    MAX_ERROR_BACKOFF = 60
+
+    def __init__(
+        self,
+        llm_pipeline: BasePipeline,
+        tasks: List[str],
+        task_p: List[float],
+        maxsize: int = 4,
+        num_workers: int = 1,
+        batch_size: int = 1,
+    ):
+        self.llm_pipeline = llm_pipeline
+        self.tasks = tasks
+        self.task_p = task_p
+        self.maxsize = maxsize
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.workers: List[threading.Thread] = []
+        self.stop_event = threading.Event()
+
+        # Statistics used for tuning the queue size and number of workers
+        self.fill_times = deque(maxlen=100)
+        self.wait_time = 0
+        self.starvations = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(maxsize={self.maxsize}, num_workers={self.num_workers}, batch_size={self.batch_size}, depth={self.queue.qsize()})"
+
+    def start(self):
+        """Starts the worker threads if they are not running yet."""
+        if self.workers or self.num_workers == 0:
+            return
+
+        bt.logging.info(f"Starting {self.num_workers} task queue workers.")
+        self.stop_event.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(
+                target=self.fill, name=f"task_queue_worker_{i}", daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """Signals the worker threads to stop and waits for them to finish their current item."""
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(5)
+        self.workers = []
+
+    def fill(self):
+        """Worker loop which keeps the queue filled with prepared agents."""
+        backoff = self.ERROR_BACKOFF
+        while not self.stop_event.is_set():
+            t0 = time.time()
+            try:
+                agents = create_agents(
+                    self.llm_pipeline, self.tasks, self.task_p, n=self.batch_size
+                )
+            except Exception as e:
+                bt.logging.error(
+                    f"Task queue worker failed to create agents: {serialize_exception_to_string(e)}"
+                )
+                # Back off so that a persistent failure, such as an unreachable dataset, does not spin the worker
+                self.stop_event.wait(backoff)
+                backoff = min(2 * backoff, self.MAX_ERROR_BACKOFF)
+                continue
+            backoff = self.ERROR_BACKOFF
+
+            if agents:
+                # Record the time per agent so that the statistic does not depend on the batch size
+                self.fill_times.append((time.time() - t0) / len(agents))
+
+            for agent in agents:
+                # Block until there is space in the queue, but keep checking whether we should stop.
+                while not self.stop_event.is_set():
+                    try:
+                        self.queue.put(agent, timeout=self.POLL_INTERVAL)
+                        break
+                    except queue.Full:
+                        continue
+
+    async def get(self) -> HumanAgent:
+        """Returns a prepared agent, waiting for one to be ready if the queue is empty.
+        Waiting is done by polling so that a cancelled forward does not consume an agent.
+        """
+        if self.num_workers == 0:
+            # Created in the default executor, so that the other forwards keep running meanwhile
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, create_agent, self.llm_pipeline, self.tasks, self.task_p
+            )
+
+        self.start()
+        t0 = time.time()
+        try:
+            agent = self.queue.get_nowait()
+        except queue.Empty:
+            self.starvations += 1
+            bt.logging.warning(
+                "Task queue is empty, waiting for a task to be prepared. Consider increasing --neuron.task_queue_workers"
+            )
+            while True:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                try:
+                    agent = self.queue.get_nowait()
+                    break
+                except queue.Empty:
+                    continue
+
+        self.wait_time = time.time() - t0
+        return agent
+
+    def __state_dict__(self):
+        return {
+            "task_queue_depth": self.queue.qsize(),
+            "task_queue_fill_time": float(np.mean(self.fill_times))
+            if self.fill_times
+            else 0,
+            "task_queue_wait_time": self.wait_time,
+            "task_queue_starvations": self.starvations,
+        }
@@ -116,7 +116,7 @@ class DebuggingTask(Task):
     static_reference = True
     static_query = True
 
-    def __init__(self, llm_pipeline, context, create_reference=True):
+    def __init__(self, llm_pipeline, context, create_reference=True, create_query=True):
         self.context = context
 
         # No LLM involved in generating the query, we just apply some language-independent corruption to the code
@@ -62,7 +62,7 @@ Data Generation:
 @dataclass
 class GenericInstructionTask(Task):
     reward_definition = [
-        dict(name="rouge", ngram="rouge-1", metric="f", weight=1.0),
+        dict(name="rouge", ngram="rouge-1", metric="f", native=True, weight=1.0),
         dict(name="relevance", threshold=None, weight=1.0),
     ]
 
@@ -18,7 +18,7 @@ class MathTask(Task):
     static_reference = True
     static_query = True
 
-    def __init__(self, llm_pipeline, context, create_reference=True):
+    def __init__(self, llm_pipeline, context, create_reference=True, create_query=True):
         self.context = context
 
         self.query = (
@@ -45,11 +45,11 @@ class QuestionAnsweringTask(Task):
     goal = "to get the answer to the following question"
 
     reward_definition = [
-        dict(name="rouge", ngram="rouge-1", metric="f", weight=0.5),
+        dict(name="rouge", ngram="rouge-1", metric="f", native=True, weight=0.5),
         dict(name="relevance", weight=0.5),
     ]
     penalty_definition = [
-        dict(name="rouge", ngram="rouge-1", metric="f", weight=0.5),
+        dict(name="rouge", ngram="rouge-1", metric="f", native=True, weight=0.5),
     ]
 
     cleaning_pipeline = [
@@ -58,20 +58,26 @@ class QuestionAnsweringTask(Task):
         dict(name="remove_roles"),
     ]
 
-    def __init__(self, llm_pipeline, context, create_reference=True):
+    def __init__(self, llm_pipeline, context, create_reference=True, create_query=True):
         self.context = context
 
         self.query_system_prompt = QUERY_SYSTEM_PROMPT
         self.query_prompt = QUERY_PROMPT_TEMPLATE.format(context=context.content)
-        self.query = self.generate_query(llm_pipeline)
+        self.query = ""
+        if create_query:
+            self.query = self.generate_query(llm_pipeline)
 
         self.reference_system_prompt = REFERENCE_SYSTEM_PROMPT
-        self.reference_prompt = REFERENCE_PROMPT_TEMPLATE.format(
-            context=context.content, question=self.query
-        )
         if create_reference:
             self.reference = self.generate_reference(llm_pipeline)
 
         self.topic = context.title
         self.subtopic = context.topic
         self.tags = context.tags
+
+    @property
+    def reference_prompt(self):
+        # Built on access because the query may be generated after the task is created
+        return REFERENCE_PROMPT_TEMPLATE.format(
+            context=self.context.content, question=self.query
+        )
@@ -31,10 +31,12 @@ class SummarizationTask(Task):
     goal = "summarize the following topic"
 
     reward_definition = [
-        dict(name="rouge", ngram="rouge-l", metric="f", weight=0.5),
+        dict(name="rouge", ngram="rouge-l", metric="f", native=True, weight=0.5),
         dict(name="relevance", weight=0.5),
     ]
-    penalty_definition = [dict(name="rouge", ngram="rouge-1", metric="f", weight=0.5)]
+    penalty_definition = [
+        dict(name="rouge", ngram="rouge-1", metric="f", native=True, weight=0.5)
+    ]
 
     # This is where you define cleaning procedures for the generation.
     # Can be used when wanting to clean the challenge.
@@ -46,7 +48,13 @@ class SummarizationTask(Task):
 
     static_query = True
 
-    def __init__(self, llm_pipeline: Pipeline, context: str, create_reference=True):
+    def __init__(
+        self,
+        llm_pipeline: Pipeline,
+        context: str,
+        create_reference=True,
+        create_query=True,
+    ):
         self.context = context
 
         # Query is just the article title and section name
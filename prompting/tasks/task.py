@@ -94,6 +94,24 @@ class Task(ABC):
         self.reference_time = time.time() - t0
         return self.reference
 
+    async def agenerate_reference(self, pipeline: BasePipeline, clean=True) -> str:
+        """Async equivalent of `generate_reference`, for pipelines which implement `agenerate`"""
+        t0 = time.time()
+        if not self.static_reference:
+            bt.logging.info("🤖 Generating reference...")
+
+            cleaner = (
+                CleanerPipeline(cleaning_pipeline=self.cleaning_pipeline)
+                if clean
+                else None
+            )
+            self.reference = await vLLM_LLM(
+                pipeline, system_prompt=self.reference_system_prompt
+            ).aquery(message=self.reference_prompt, cleaner=cleaner)
+
+        self.reference_time = time.time() - t0
+        return self.reference
+
     def generate_query(self, pipeline: BasePipeline, clean=True) -> str:
         """Generates a query to be used for generating the challenge"""
         t0 = time.time()
@@ -254,6 +254,41 @@ def add_miner_args(cls, parser):
         help="Batch size in tokens for streaming forward calls.",
     )
 
+    parser.add_argument(
+        "--neuron.streaming_batch_bytes",
+        type=int,
+        default=1024,
+        help="Batch size in bytes for streaming forward calls. A batch is sent when it reaches either size.",
+    )
+
+    parser.add_argument(
+        "--neuron.streaming_max_latency",
+        type=float,
+        default=0.1,
+        help="The maximum number of seconds streamed tokens wait before they are sent.",
+    )
+
+    parser.add_argument(
+        "--neuron.continuous_batching",
+        action="store_true",
+        help="If set, the HuggingFace miner generates concurrent requests in one shared decoding batch.",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--neuron.max_batch_size",
+        type=int,
+        default=8,
+        help="The maximum number of requests generated together with continuous batching.",
+    )
+
+    parser.add_argument(
+        "--neuron.max_kv_cache_gb",
+        type=float,
+        default=None,
+        help="The maximum size in GB of the KV cache of the continuous batch. If not set, only the batch size is limited.",
+    )
+
 
 def add_validator_args(cls, parser):
     """Add validator specific arguments to the parser."""
@@ -309,6 +344,113 @@ def add_validator_args(cls, parser):
         default=1,
     )
 
+    parser.add_argument(
+        "--neuron.task_queue_size",
+        type=int,
+        help="The maximum number of prepared tasks (with their challenge) waiting to be used by a forward.",
+        default=4,
+    )
+
+    parser.add_argument(
+        "--neuron.task_queue_workers",
+        type=int,
+        help="The number of background threads preparing tasks. If 0, tasks are created inline in the forward.",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--neuron.task_queue_batch_size",
+        type=int,
+        help="The number of tasks each worker prepares at once. Their queries, challenges and references are generated in batches.",
+        default=4,
+    )
+
+    parser.add_argument(
+        "--neuron.llm_async",
+        action="store_true",
+        help="If set, the validator LLM runs on the async vLLM engine, which batches in-flight requests and aborts references of timed out forwards.",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--neuron.llm_batch_window",
+        type=float,
+        help="Seconds to wait for concurrent LLM calls to be generated together in one batch. If 0, calls are not batched.",
+        default=0.01,
+    )
+
+    parser.add_argument(
+        "--neuron.llm_max_batch_size",
+        type=int,
+        help="The maximum number of concurrent LLM calls generated together in one batch.",
+        default=16,
+    )
+
+    parser.add_argument(
+        "--neuron.reward_cascade",
+        action="store_true",
+        help="If set, expensive reward models such as relevance only score the completions which are not empty, not failed and reach the cascade floor with the cheap models.",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--neuron.reward_cascade_floor",
+        type=float,
+        help="The weighted reward of the cheap models which a completion needs to be scored by expensive models in cascade mode.",
+        default=0.0,
+    )
+
+    parser.add_argument(
+        "--neuron.reward_cascade_fill",
+        type=float,
+        help="The reward of expensive models for completions which they skip in cascade mode.",
+        default=0.0,
+    )
+
+    parser.add_argument(
+        "--neuron.reward_server_path",
+        type=str,
+        help="Path of the Unix socket of a reward server (python -m prompting.rewards.service). If set, the reward models are not loaded by the validator.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--neuron.relevance_backend",
+        type=str,
+        choices=["torch", "int8"],
+        help="Backend of the relevance reward model. int8 applies dynamic quantization for scoring on cpu.",
+        default="torch",
+    )
+
+    parser.add_argument(
+        "--neuron.relevance_max_length",
+        type=int,
+        help="The number of tokens of each text which the relevance reward model encodes.",
+        default=512,
+    )
+
+    parser.add_argument(
+        "--neuron.relevance_chunking",
+        type=str,
+        choices=["truncate", "head_tail"],
+        help="How the relevance reward model encodes texts longer than its max length. head_tail averages the embeddings of their first and last tokens.",
+        default="truncate",
+    )
+
+    parser.add_argument(
+        "--neuron.relevance_num_threads",
+        type=int,
+        help="The number of threads torch uses for the relevance reward model on cpu. If not set, the torch default is kept.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--neuron.relevance_cache_path",
+        type=str,
+        help="Directory of the on-disk embedding cache of the relevance reward model, which survives restarts. It must not be shared between processes. If not set, embeddings are only cached in memory.",
+        default=None,
+    )
+
     parser.add_argument(
         "--neuron.sample_size",
         type=int,
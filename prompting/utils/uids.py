@@ -1,8 +1,12 @@
 import torch
 import random
+import asyncio
 import bittensor as bt
 from typing import List
 
+# Seconds to wait before retrying when all available uids are being queried by concurrent forwards.
+UID_RESERVATION_INTERVAL = 0.5
+
 
 def check_uid_availability(
     metagraph: "bt.metagraph.Metagraph",
@@ -89,3 +93,29 @@ def get_random_uids(self, k: int, exclude: List[int] = None) -> torch.LongTensor
         return torch.tensor(random.sample(candidate_uids, k))
     else:
         raise ValueError(f"No eligible uids were found. Cannot return {k} uids")
+
+
+async def reserve_uids(self, k: int, exclude: List[int]) -> torch.LongTensor:
+    """Samples k random uids which are not being queried by a concurrent forward and marks them as in flight.
+    If every available uid is in flight, waits for a concurrent forward to release its uids.
+
+    Args:
+        k (int): The number of uids to sample.
+        exclude (List[int]): The list of uids to exclude from the sampling.
+
+    Returns:
+        torch.LongTensor: The reserved uids. The caller must remove them from `self.uids_in_flight` when done.
+    """
+    while True:
+        try:
+            uids = get_random_uids(
+                self, k=k, exclude=exclude + list(self.uids_in_flight)
+            )
+            break
+        except ValueError:
+            if not self.uids_in_flight:
+                raise
+            await asyncio.sleep(UID_RESERVATION_INTERVAL)
+
+    self.uids_in_flight.update(uids.tolist())
+    return uids
@@ -0,0 +1,28 @@
+import torch
+
+
+class CharTokenizer:
+    """Tokenizes text into one token per character."""
+
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [[ord(char) for char in text] for text in texts]}
+
+    def decode(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+class MockAnglE:
+    """Deterministic bag-of-characters embeddings, which is enough to check the batching."""
+
+    def __init__(self):
+        self.tokenizer = CharTokenizer()
+
+    def encode(self, inputs, to_numpy=False):
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        embeddings = torch.ones(len(inputs), 26)
+        for i, text in enumerate(inputs):
+            for char in text.lower():
+                if char.isalpha():
+                    embeddings[i, ord(char) - ord("a")] += 1
+        return embeddings
@@ -0,0 +1,89 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from prompting.llms import BatchingPipeline
+from prompting.mock import MockPipeline
+
+
+class RecordingPipeline(MockPipeline):
+    def __init__(self, fail=False, error=RuntimeError("Generation failed")):
+        super().__init__()
+        self.fail = fail
+        self.error = error
+        self.batches = []
+
+    def generate_batch(self, composed_prompts, model_kwargs):
+        if self.fail:
+            raise self.error
+        self.batches.append(composed_prompts)
+        # Echo the prompts so that each caller can check it got its own response
+        return [f"response to {prompt}" for prompt in composed_prompts]
+
+
+class ShortPipeline(RecordingPipeline):
+    def generate_batch(self, composed_prompts, model_kwargs):
+        return super().generate_batch(composed_prompts, model_kwargs)[:-1]
+
+
+@pytest.mark.parametrize("num_calls, max_batch_size", [(8, 16), (8, 3)])
+def test_concurrent_calls_are_batched(num_calls: int, max_batch_size: int):
+    pipeline = RecordingPipeline()
+    batching_pipeline = BatchingPipeline(
+        pipeline, window=0.2, max_batch_size=max_batch_size
+    )
+    prompts = [f"prompt {i}" for i in range(num_calls)]
+
+    with ThreadPoolExecutor(max_workers=num_calls) as executor:
+        responses = list(executor.map(batching_pipeline, prompts))
+
+    assert responses == [f"response to {prompt}" for prompt in prompts]
+    assert sum(len(batch) for batch in pipeline.batches) == num_calls
+    assert all(len(batch) <= max_batch_size for batch in pipeline.batches)
+    assert len(pipeline.batches) < num_calls
+
+
+def test_failed_generation_is_raised_to_caller():
+    batching_pipeline = BatchingPipeline(RecordingPipeline(fail=True), window=0)
+
+    with pytest.raises(RuntimeError, match="Generation failed"):
+        batching_pipeline("prompt")
+
+
+def test_generate_batch_is_batched_with_concurrent_calls():
+    pipeline = RecordingPipeline()
+    batching_pipeline = BatchingPipeline(pipeline, window=0.2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        call = executor.submit(batching_pipeline, "single")
+        batch = executor.submit(batching_pipeline.generate_batch, ["a", "b"], [{}, {}])
+
+    assert call.result() == "response to single"
+    assert batch.result() == ["response to a", "response to b"]
+    assert len(pipeline.batches) == 1
+
+
+def test_missing_responses_are_raised_to_caller():
+    batching_pipeline = BatchingPipeline(ShortPipeline(), window=0)
+
+    with pytest.raises(ValueError, match="1 responses for 2 requests"):
+        batching_pipeline.generate_batch(["a", "b"], [{}, {}])
+
+
+def test_dispatcher_is_restarted_after_base_exception():
+    pipeline = RecordingPipeline(fail=True, error=SystemExit("stopped"))
+    batching_pipeline = BatchingPipeline(pipeline, window=0)
+
+    # The caller is woken up with the error instead of waiting forever
+    with pytest.raises(SystemExit):
+        batching_pipeline("prompt")
+    batching_pipeline.dispatcher.join(5)
+
+    pipeline.fail = False
+    assert batching_pipeline("prompt") == "response to prompt"
+
+
+def test_attributes_are_forwarded_to_wrapped_pipeline():
+    pipeline = RecordingPipeline()
+    batching_pipeline = BatchingPipeline(pipeline)
+
+    assert batching_pipeline.tokenizer is pipeline.tokenizer
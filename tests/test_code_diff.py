@@ -0,0 +1,104 @@
+import os
+import ast
+import glob
+import pytest
+import numpy as np
+
+from prompting.tasks.debugging import corrupt
+from prompting.rewards import DiffRewardModel
+from prompting.rewards.code_diff import LCSRatio
+
+
+def code_samples(max_samples: int = 30):
+    """Functions of 5 to 100 lines from this repository, which are real code of the size of the debugging task."""
+    # Resolved from this file, so that the samples do not depend on the directory pytest is run from
+    package_dir = os.path.join(os.path.dirname(__file__), "..", "prompting")
+    samples = []
+    paths = glob.glob(os.path.join(package_dir, "**", "*.py"), recursive=True)
+    for path in sorted(paths):
+        source = open(path).read()
+        for node in ast.walk(ast.parse(source)):
+            if isinstance(node, ast.FunctionDef):
+                code = ast.get_source_segment(source, node)
+                if 5 <= code.count("\n") <= 100:
+                    samples.append(code)
+    return samples[:max_samples]
+
+
+@pytest.fixture(scope="module")
+def corrupted_pairs():
+    pairs = []
+    for seed, code in enumerate(code_samples()):
+        for sep, n_remove, n_swap in [
+            (" ", 2, 0),
+            (" ", 0, 2),
+            ("\n", 1, 1),
+            ("", 3, 0),
+        ]:
+            try:
+                corrupted = corrupt(
+                    code, n_remove=n_remove, n_swap=n_swap, seed=seed, sep=sep
+                )
+            except ValueError:
+                # Not enough chunks of the right length to corrupt
+                continue
+            pairs.append((code, corrupted))
+    return pairs
+
+
+def test_lcs_ratio_agrees_with_sequence_matcher(corrupted_pairs):
+    pairs = corrupted_pairs
+    assert len(pairs) > 50
+
+    # Compared with the difflib engine of the reward model as it is deployed
+    difflib_model = DiffRewardModel(engine="difflib")
+    errors = np.array(
+        [
+            difflib_model.reward(code, [corrupted]).rewards[0].item()
+            - LCSRatio(code).ratio(corrupted)
+            for code, corrupted in pairs
+        ]
+    )
+
+    assert np.abs(errors).mean() < 0.03
+    assert np.percentile(np.abs(errors), 95) < 0.06
+    assert np.abs(errors).max() < 0.15
+
+
+@pytest.mark.parametrize("level", ["token", "line"])
+def test_lcs_ratio_edge_cases(level: str):
+    code = "def f(x):\n    return x + 1\n"
+
+    assert LCSRatio(code, level=level).ratio(code) == 1.0
+    assert LCSRatio(code, level=level).ratio("") == 0.0
+    assert LCSRatio("", level=level).ratio("") == 1.0
+
+
+def test_lcs_ratio_caps_the_length():
+    code = "a b c d"
+
+    # Only the first two tokens are compared, the other two count as not matching
+    assert LCSRatio(code, max_tokens=2).ratio(code) == pytest.approx(0.5)
+
+
+def test_lcs_ratio_min_score():
+    code = " ".join(f"x{i}" for i in range(200))
+    completion = " ".join(f"x{i}" for i in range(100))
+    ratio = LCSRatio(code).ratio(completion)
+
+    assert LCSRatio(code).ratio(completion, min_score=ratio) == pytest.approx(ratio)
+    assert LCSRatio(code).ratio(completion, min_score=ratio + 0.01) == 0.0
+
+
+def test_diff_reward_model_lcs_engine(corrupted_pairs):
+    reference, corrupted = corrupted_pairs[0]
+    completions = [reference, corrupted, ""]
+
+    output = DiffRewardModel(engine="lcs").reward(reference, completions)
+
+    assert output.rewards.tolist() == pytest.approx(
+        [LCSRatio(reference).ratio(completion) for completion in completions]
+    )
+    assert output.timings.shape == output.rewards.shape
+    assert output.extra_info["engine"] == "lcs"
+    assert output.extra_info["level"] == "token"
@@ -0,0 +1,76 @@
+import pickle
+import pytest
+from unittest.mock import patch
+
+from prompting.rewards import CompletionBatch, RougeRewardModel
+from prompting.rewards.native_rouge import split_words
+
+
+completions = ["The dog sleeps. The fox jumps", "", "The dog sleeps"]
+
+
+def test_completion_batch_is_a_list_of_completions():
+    batch = CompletionBatch(completions)
+
+    assert batch == completions
+    assert ["reference"] + batch == ["reference"] + completions
+    assert pickle.loads(pickle.dumps(batch)) == completions
+
+
+def test_completion_batch_memoizes_transformations():
+    batch = CompletionBatch(completions)
+
+    with patch(
+        "prompting.rewards.completion_batch.split_words", wraps=split_words
+    ) as mock_split_words:
+        sentences = batch.sentences
+        ngram_counts = batch.ngram_counts(2)
+
+        assert batch.sentences is sentences
+        assert batch.ngram_counts(2) is ngram_counts
+        assert mock_split_words.call_count == len(completions)
+
+    assert sentences[0] == [["The", "dog", "sleeps"], ["The", "fox", "jumps"]]
+    assert ngram_counts[0][("The", "dog")] == 1
+    assert len(batch.hashes) == len(set(batch.hashes)) == len(completions)
+
+
+def test_completion_batch_memoizes_normalized_text():
+    batch = CompletionBatch(completions)
+
+    assert batch.normalized == [completion.lower() for completion in completions]
+    assert batch.normalized is batch.normalized
+
+
+def test_completion_batch_subsets_reuse_memoized_transformations():
+    batch = CompletionBatch(completions)
+    sentences = batch.sentences
+
+    with patch(
+        "prompting.rewards.completion_batch.split_words", wraps=split_words
+    ) as mock_split_words:
+        subset = batch.subset([2, 0])
+
+        assert subset == [completions[2], completions[0]]
+        assert subset.sentences == [sentences[2], sentences[0]]
+        assert subset.sentences[0] is sentences[2]
+        assert subset.ngram_counts(1)[1][("The",)] == 2
+        mock_split_words.assert_not_called()
+
+    # Transformations which the parent has not computed are computed for the subset only
+    assert subset.hashes == [batch.hashes[2], batch.hashes[0]]
+
+
+@pytest.mark.parametrize("ngram", ["rouge-1", "rouge-2", "rouge-l"])
+def test_rouge_rewards_are_the_same_for_lists_and_batches(ngram: str):
+    model = RougeRewardModel(ngram=ngram, native=True)
+    reference = "The dog sleeps. The cat sleeps"
+
+    batch = CompletionBatch(completions)
+    batch_rewards = model.reward(reference, batch).rewards
+    # The same batch scored against another text, like a penalty against the challenge
+    model.reward("The fox jumps", batch)
+
+    assert (
+        batch_rewards.tolist() == model.reward(reference, completions).rewards.tolist()
+    )
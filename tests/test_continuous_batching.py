@@ -0,0 +1,152 @@
+import time
+import torch
+import pytest
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from prompting.llms import ContinuousBatchingScheduler
+
+
+class CharTokenizer:
+    """Tokenizes text into one token per character, and decodes each token to a printable character."""
+
+    eos_token_id = None
+
+    def __call__(self, text, add_special_tokens=False, return_tensors=None):
+        return {"input_ids": torch.tensor([[ord(char) % 128 for char in text]])}
+
+    def decode(self, ids, **kwargs):
+        return "".join(chr(33 + i % 90) for i in ids)
+
+
+PROMPTS = ["hello", "a much longer prompt than the others", "xy", "medium prompt"]
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = GPT2Config(n_layer=2, n_head=2, n_embd=32, vocab_size=128)
+    # Double precision, so that padding does not change the greedy tokens
+    return GPT2LMHeadModel(config).double().eval()
+
+
+def generate(model, prompt: str, max_new_tokens: int) -> str:
+    tokenizer = CharTokenizer()
+    input_ids = tokenizer(prompt)["input_ids"]
+    output = model.generate(
+        input_ids, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=0
+    )
+    return tokenizer.decode(output[0, input_ids.shape[1] :].tolist())
+
+
+def submit_all(scheduler, prompts):
+    first = scheduler.submit(prompts[0], max_new_tokens=200, do_sample=False)
+    # The other requests join the batch while the first one is decoded
+    outputs = [next(first)]
+    streamers = [
+        scheduler.submit(prompt, max_new_tokens=8 + 4 * i, do_sample=False)
+        for i, prompt in enumerate(prompts[1:])
+    ]
+    outputs[0] += "".join(first)
+    return outputs + ["".join(streamer) for streamer in streamers]
+
+
+def expected_outputs(model, prompts):
+    return [generate(model, prompts[0], 200)] + [
+        generate(model, prompt, 8 + 4 * i) for i, prompt in enumerate(prompts[1:])
+    ]
+
+
+def test_sequences_joining_the_batch_match_generate(model):
+    scheduler = ContinuousBatchingScheduler(model, CharTokenizer(), max_batch_size=4)
+
+    outputs = submit_all(scheduler, PROMPTS)
+
+    assert outputs == expected_outputs(model, PROMPTS)
+    assert scheduler.mean_batch_size > 1
+
+
+def test_kv_memory_caps_the_batch(model):
+    scheduler = ContinuousBatchingScheduler(model, CharTokenizer(), max_kv_bytes=1)
+
+    outputs = submit_all(scheduler, PROMPTS[:3])
+
+    assert outputs == expected_outputs(model, PROMPTS[:3])
+    assert scheduler.mean_batch_size == 1
+
+
+def test_kv_bytes_per_token(model):
+    scheduler = ContinuousBatchingScheduler(model, CharTokenizer())
+    past_key_values = model(torch.tensor([[1, 2, 3]]), use_cache=True).past_key_values
+
+    kv_bytes = sum(
+        tensor.numel() * tensor.element_size()
+        for layer_cache in past_key_values
+        for tensor in layer_cache
+    )
+    assert scheduler.kv_bytes_per_token * 3 == kv_bytes
+
+
+def test_cancelled_sequence_leaves_the_batch(model):
+    scheduler = ContinuousBatchingScheduler(model, CharTokenizer())
+
+    cancelled = scheduler.submit("cancel me", max_new_tokens=10_000, do_sample=False)
+    other = scheduler.submit("hello", max_new_tokens=20, do_sample=False)
+    next(cancelled)
+    cancelled.cancel()
+
+    assert len("".join(cancelled)) < 10_000
+    assert "".join(other) == generate(model, "hello", 20)
+
+
+def test_deadline_and_sampling(model):
+    scheduler = ContinuousBatchingScheduler(model, CharTokenizer())
+
+    t0 = time.time()
+    streamer = scheduler.submit(
+        "hello", max_new_tokens=100_000, top_k=5, deadline=time.time() + 0.5
+    )
+    text = "".join(streamer)
+
+    assert 0 < len(text) < 100_000
+    assert time.time() - t0 < 2
+
+
+class FailingModel:
+    """Wraps the model, and raises the error instead of running it once armed."""
+
+    def __init__(self, model, error: BaseException):
+        self.model = model
+        self.error = error
+        self.armed = False
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, *args, **kwargs):
+        if self.armed:
+            raise self.error
+        return self.model(*args, **kwargs)
+
+
+@pytest.mark.parametrize("error", [RuntimeError("failed"), SystemExit(1)])
+def test_failure_ends_every_streamer_and_the_scheduler_restarts(model, error):
+    failing_model = FailingModel(model, error)
+    scheduler = ContinuousBatchingScheduler(
+        failing_model, CharTokenizer(), max_batch_size=1
+    )
+
+    active = scheduler.submit("hello", max_new_tokens=10_000, do_sample=False)
+    while not scheduler.active:
+        time.sleep(0.01)
+    # The batch is full, so the second sequence waits to be admitted
+    pending = scheduler.submit("xy", max_new_tokens=10, do_sample=False)
+    failing_model.armed = True
+
+    for streamer in [active, pending]:
+        with pytest.raises(type(error)):
+            "".join(streamer)
+    assert not scheduler.pending
+
+    failing_model.armed = False
+    streamer = scheduler.submit("hello", max_new_tokens=20, do_sample=False)
+    assert "".join(streamer) == generate(model, "hello", 20)
@@ -0,0 +1,49 @@
+import random
+import pytest
+
+from prompting.miners.utils import EchoFilter
+
+
+def stream(echo_filter: EchoFilter, chunks) -> str:
+    return "".join(echo_filter.feed(chunk) for chunk in chunks) + echo_filter.flush()
+
+
+def test_echo_is_removed_across_chunks():
+    echo_filter = EchoFilter("What is the capital of Texas?", max_hold=1000)
+    chunks = ["<|system|> Be nice <|user|> What is the ", "capital of Tex", "as?"]
+    chunks += [" <|assistant|>", " Austin", " is the capital."]
+
+    assert stream(echo_filter, chunks) == " <|assistant|> Austin is the capital."
+    assert echo_filter.echo_found
+
+
+def test_overlapping_prefixes_of_the_pattern():
+    echo_filter = EchoFilter("aab", max_hold=1000)
+
+    assert stream(echo_filter, ["a", "a", "a", "ab", "aab"]) == "aab"
+
+
+@pytest.mark.parametrize("max_hold", [0, 10])
+def test_stream_without_echo_is_released(max_hold: int):
+    echo_filter = EchoFilter("What is the capital of Texas?", max_hold=max_hold)
+    chunks = ["Austin", " is the", " capital", " of Texas."]
+
+    outputs = [echo_filter.feed(chunk) for chunk in chunks]
+
+    assert "".join(outputs) + echo_filter.flush() == "".join(chunks)
+    # Nothing is held back once more than max_hold characters arrived
+    assert outputs[-1] == " of Texas."
+    assert not echo_filter.echo_found
+
+
+def test_matches_naive_search():
+    random.seed(0)
+    for _ in range(200):
+        pattern = "".join(random.choices("ab", k=random.randint(1, 5)))
+        text = "".join(random.choices("ab", k=random.randint(0, 30)))
+        cuts = sorted(random.sample(range(len(text) + 1), min(len(text), 4)))
+        chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+        index = text.find(pattern)
+        expected = text if index < 0 else text[index + len(pattern) :]
+        assert stream(EchoFilter(pattern, max_hold=1000), chunks) == expected
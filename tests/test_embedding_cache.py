@@ -0,0 +1,71 @@
+import os
+import torch
+import pytest
+
+from prompting.rewards.embedding_cache import EmbeddingCache
+
+
+DIM = 4
+
+
+def test_cache_hits_and_misses():
+    cache = EmbeddingCache(dim=DIM)
+    cache.put(["a", "b"], torch.rand(2, DIM))
+
+    embeddings = cache.get(["a", "c", "b"])
+
+    assert embeddings[0] is not None
+    assert embeddings[1] is None
+    assert embeddings[2] is not None
+    assert cache.hit_rate == pytest.approx(2 / 3)
+
+
+def test_least_recently_used_embeddings_are_evicted():
+    # Each float32 embedding takes 16 bytes, so only two fit
+    cache = EmbeddingCache(dim=DIM, max_bytes=32)
+    cache.put(["a", "b"], torch.rand(2, DIM))
+    cache.get(["a"])
+    cache.put(["c"], torch.rand(1, DIM))
+
+    assert cache.bytes == 32
+    assert [embedding is not None for embedding in cache.get(["a", "b", "c"])] == [
+        True,
+        False,
+        True,
+    ]
+
+
+def test_disk_store_survives_restarts(tmp_path):
+    embeddings = torch.rand(2, DIM)
+    cache = EmbeddingCache(dim=DIM, path=str(tmp_path))
+    cache.put(["a", "b"], embeddings)
+
+    restarted_cache = EmbeddingCache(dim=DIM, path=str(tmp_path))
+    cached_embeddings = restarted_cache.get(["a", "b", "c"])
+
+    # Embeddings read from disk are the same as in memory, so rewards do not change after a restart
+    assert torch.equal(cached_embeddings[0], embeddings[0])
+    assert torch.equal(cached_embeddings[1], embeddings[1])
+    assert cached_embeddings[2] is None
+
+
+def test_disk_store_stops_growing_when_full(tmp_path):
+    cache = EmbeddingCache(dim=DIM, max_bytes=0, path=str(tmp_path), disk_capacity=1)
+    cache.put(["a", "b"], torch.rand(2, DIM))
+
+    assert [embedding is not None for embedding in cache.get(["a", "b"])] == [
+        True,
+        False,
+    ]
+
+
+def test_disk_store_of_another_shape_is_recreated(tmp_path):
+    cache = EmbeddingCache(dim=DIM, path=str(tmp_path), disk_capacity=4)
+    cache.put(["a"], torch.rand(1, DIM))
+
+    resized_cache = EmbeddingCache(dim=2 * DIM, path=str(tmp_path), disk_capacity=4)
+    resized_cache.put(["b"], torch.rand(1, 2 * DIM))
+
+    assert resized_cache.get(["a"]) == [None]
+    assert resized_cache.get(["b"])[0].shape == (2 * DIM,)
+    assert os.path.getsize(tmp_path / "embeddings.f32") == 4 * 2 * DIM * 4
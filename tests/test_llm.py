@@ -1,6 +1,22 @@
 import pytest
-
-from prompting.llms import BaseLLM, BasePipeline, load_vllm_pipeline
+import time
+import torch
+import asyncio
+import threading
+
+from prompting.llms import (
+    BaseLLM,
+    BasePipeline,
+    load_vllm_pipeline,
+    vLLM_LLM,
+    vLLMPipeline,
+    AsyncvLLMPipeline,
+    batch_query,
+    HuggingFaceLLM,
+    CancellationCriteria,
+    CustomTextIteratorStreamer,
+)
+from prompting.llms.vllm_llm import load_async_vllm_engine
 from prompting.llms.utils import (
     contains_gpu_index_in_device,
     calculate_gpu_requirements,
@@ -79,6 +95,144 @@ def test_llm_forward(llm: BaseLLM):
     assert llm.messages[0]["role"] == "system"
 
 
+def mock_generate(prompts, sampling_params, use_tqdm):
+    # Echo the prompts so that the order of the outputs can be checked
+    return [MagicMock(outputs=[MagicMock(text=prompt)]) for prompt in prompts]
+
+
+@patch("prompting.llms.vllm_llm.load_vllm_pipeline")
+def test_vllm_pipeline_generate_batch(mock_load_vllm_pipeline):
+    mock_load_vllm_pipeline.return_value.generate.side_effect = mock_generate
+    pipeline = vLLMPipeline(model_id="test", device="cuda")
+
+    prompts = ["a", "b", "c", "d"]
+    model_kwargs = [
+        {"temperature": 0.7},
+        {"temperature": 0.1},
+        {"temperature": 0.7},
+        {"temperature": 0.1, "max_tokens": 10},
+    ]
+    responses = pipeline.generate_batch(prompts, model_kwargs)
+
+    assert responses == prompts
+    # One call to the engine per distinct set of sampling params
+    assert mock_load_vllm_pipeline.return_value.generate.call_count == 3
+
+
+def test_batch_query():
+    pipeline = MockPipeline("This is just another test.")
+    llms = [vLLM_LLM(pipeline, f"system {i}") for i in range(3)]
+    messages = [f"message {i}" for i in range(3)]
+
+    responses = batch_query(llms, messages)
+
+    assert responses == ["This is just another test."] * 3
+    for llm, message in zip(llms, messages):
+        assert len(llm.messages) == 3
+        assert len(llm.times) == 3
+        assert llm.messages[1]["content"] == message
+        assert llm.messages[2]["role"] == "assistant"
+
+
+class MockAsyncEngine:
+    def __init__(self, tokens, delay=0.01):
+        self.tokens = tokens
+        self.delay = delay
+        self.aborted = []
+
+    async def generate(self, prompt, sampling_params, request_id):
+        text = ""
+        for token in self.tokens:
+            await asyncio.sleep(self.delay)
+            text += token
+            yield MagicMock(outputs=[MagicMock(text=text)])
+
+    async def abort(self, request_id):
+        self.aborted.append(request_id)
+
+
+@patch("prompting.llms.vllm_llm.load_async_vllm_engine")
+def test_async_vllm_pipeline_agenerate_and_astream(mock_load_async_vllm_engine):
+    mock_load_async_vllm_engine.return_value = MockAsyncEngine(["a", "b", "c"])
+    pipeline = AsyncvLLMPipeline(model_id="test", device="cuda")
+
+    async def stream():
+        return [chunk async for chunk in pipeline.astream("prompt")]
+
+    assert asyncio.run(pipeline.agenerate("prompt")) == "abc"
+    assert asyncio.run(stream()) == ["a", "b", "c"]
+    assert pipeline("prompt") == "abc"
+    assert pipeline.generate_batch(["a", "b"], [{}, {}]) == ["abc", "abc"]
+
+
+@patch("prompting.llms.vllm_llm.load_async_vllm_engine")
+def test_async_vllm_pipeline_aborts_cancelled_request(mock_load_async_vllm_engine):
+    engine = MockAsyncEngine(["a"] * 100, delay=0.05)
+    mock_load_async_vllm_engine.return_value = engine
+    pipeline = AsyncvLLMPipeline(model_id="test", device="cuda")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(pipeline.agenerate("prompt"), timeout=0.2))
+
+    wait_for_aborts(engine, 1)
+    assert len(engine.aborted) == 1
+
+
+def wait_for_aborts(engine: MockAsyncEngine, n: int):
+    # The abort is done on the engine loop after the caller has stopped
+    for _ in range(20):
+        if len(engine.aborted) >= n:
+            break
+        time.sleep(0.05)
+
+
+@patch("prompting.llms.vllm_llm.load_async_vllm_engine")
+def test_async_vllm_pipeline_aborts_stopped_stream(mock_load_async_vllm_engine):
+    engine = MockAsyncEngine(["a"] * 100, delay=0.05)
+    mock_load_async_vllm_engine.return_value = engine
+    pipeline = AsyncvLLMPipeline(model_id="test", device="cuda")
+
+    async def consume():
+        async for _ in pipeline.astream("prompt"):
+            pass
+
+    async def first_chunk():
+        stream = pipeline.astream("prompt")
+        chunk = await stream.__anext__()
+        await stream.aclose()
+        return chunk
+
+    # Cancelled while a step is in flight on the engine loop
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(consume(), timeout=0.2))
+    wait_for_aborts(engine, 1)
+    assert len(engine.aborted) == 1
+
+    # Closed by the consumer between steps
+    assert asyncio.run(first_chunk()) == "a"
+    wait_for_aborts(engine, 2)
+    assert len(engine.aborted) == 2
+
+
+@patch("prompting.llms.vllm_llm.clean_gpu_cache")
+@patch("prompting.llms.vllm_llm.calculate_gpu_requirements", side_effect=[0.5, 0.6])
+@patch(
+    "prompting.llms.vllm_llm.AsyncLLMEngine.from_engine_args",
+    side_effect=[ValueError("First attempt failed"), MagicMock()],
+)
+def test_load_async_vllm_engine_success_second_try(
+    mock_from_engine_args, mock_calculate_gpu_requirements, mock_clean_gpu_cache
+):
+    result = load_async_vllm_engine(model_id="test", device="cuda")
+
+    assert isinstance(result, MagicMock)
+    assert [
+        call.args[0].gpu_memory_utilization
+        for call in mock_from_engine_args.call_args_list
+    ] == [0.5, 0.6]
+    mock_clean_gpu_cache.assert_called_once()
+
+
 @pytest.mark.parametrize(
     "device, expected_result", [("cpu", False), ("cuda", False), ("cuda:0", True)]
 )
@@ -185,3 +339,112 @@ def test_load_vllm_pipeline_exception_second_try(
         load_vllm_pipeline(model_id="HuggingFaceH4/zephyr-7b-beta", device="gpu0")
     assert mock_llm.call_count == 2  # LLM is called twice
     mock_clean_gpu_cache.assert_called_once()  # Ensures clean_gpu_cache was called
+
+
+class SlowStreamingPipeline:
+    """Puts a token in the streamer every 0.1 seconds, then optionally fails."""
+
+    def __init__(self, tokens, error=None):
+        self.tokenizer = MockPipeline().tokenizer
+        self.tokens = tokens
+        self.error = error
+
+    def __call__(self, prompt, streamer=None, stopping_criteria=None, **kwargs):
+        self.kwargs = kwargs
+        for token in self.tokens:
+            time.sleep(0.1)
+            if stopping_criteria is not None and stopping_criteria(None, None):
+                break
+            streamer.on_finalized_text(token)
+        if self.error is not None:
+            raise self.error
+        streamer.end()
+        return "".join(self.tokens)
+
+
+def test_hf_llm_stream_returns_before_generation_ends():
+    llm = HuggingFaceLLM(SlowStreamingPipeline(["a", "b", "c", "d", "e"]), "")
+
+    t0 = time.time()
+    streamer = llm.stream("prompt")
+    first_token = next(streamer)
+    first_token_time = time.time() - t0
+
+    assert first_token == "a"
+    assert first_token_time < 0.3
+    assert list(streamer) == ["b", "c", "d", "e", ""]
+    assert not streamer.thread.is_alive()
+
+
+def test_hf_llm_stream_raises_generation_errors():
+    llm = HuggingFaceLLM(
+        SlowStreamingPipeline(["a", "b"], error=RuntimeError("out of memory")), ""
+    )
+
+    tokens = []
+    with pytest.raises(RuntimeError, match="out of memory"):
+        for token in llm.stream("prompt"):
+            tokens.append(token)
+
+    assert tokens == ["a", "b", ""]
+
+
+def test_hf_llm_stream_mock_pipeline():
+    llm = HuggingFaceLLM(MockPipeline("This is just another test."), "")
+
+    assert "".join(llm.stream("prompt")) == "This is just another test."
+
+
+def test_cancellation_criteria():
+    cancelled = threading.Event()
+
+    assert not CancellationCriteria(cancelled)(None, None)
+    assert not CancellationCriteria(cancelled, deadline=time.time() + 10)(None, None)
+    assert CancellationCriteria(cancelled, deadline=time.time() - 1)(None, None)
+    cancelled.set()
+    assert CancellationCriteria(cancelled)(None, None)
+
+
+def test_hf_llm_stream_cancel_stops_generation():
+    llm = HuggingFaceLLM(SlowStreamingPipeline(["a"] * 100), "")
+
+    t0 = time.time()
+    streamer = llm.stream("prompt")
+    next(streamer)
+    streamer.cancel()
+    streamer.join(timeout=1)
+
+    assert not streamer.thread.is_alive()
+    assert time.time() - t0 < 1
+
+
+def test_hf_llm_stream_stops_at_deadline_and_budgets_tokens():
+    pipeline = SlowStreamingPipeline(["a"] * 100)
+    llm = HuggingFaceLLM(pipeline, "", max_new_tokens=256)
+
+    tokens = list(
+        llm.stream("prompt", deadline=time.time() + 0.5, tokens_per_second=10)
+    )
+
+    assert len(tokens) < 10
+    assert 1 <= pipeline.kwargs["max_new_tokens"] <= 5
+
+
+class CharTokenizer:
+    def decode(self, ids, **kwargs):
+        return "".join(chr(i) for i in ids)
+
+
+def test_streamer_measures_tokens_per_second():
+    streamer = CustomTextIteratorStreamer(CharTokenizer())
+
+    # The prompt is not counted
+    streamer.put(torch.tensor([[ord("a")] * 50]))
+    assert streamer.tokens_per_second is None
+
+    for _ in range(5):
+        time.sleep(0.05)
+        streamer.put(torch.tensor([ord("b")]))
+
+    assert streamer.num_generated_tokens == 5
+    assert 10 < streamer.tokens_per_second < 25
@@ -0,0 +1,164 @@
+import time
+import torch
+import pytest
+
+from prompting.rewards import (
+    BaseRewardModel,
+    BatchRewardOutput,
+    DiffRewardModel,
+    ProcessPoolRewardModel,
+)
+
+
+class StallingRewardModel(BaseRewardModel):
+    """Stalls on completions which contain 'stall', like a pathological completion would."""
+
+    @property
+    def name(self) -> str:
+        return "stalling"
+
+    def __init__(self, **kwargs):
+        super().__init__()
+
+    def reward(self, reference, completions):
+        for completion in completions:
+            if "stall" in completion:
+                time.sleep(10)
+        return BatchRewardOutput(
+            rewards=torch.ones(len(completions)),
+            timings=torch.zeros(len(completions)),
+            extra_info={},
+        )
+
+
+class CountingRewardModel(BaseRewardModel):
+    """Counts the completions and requests it scores in each call."""
+
+    @property
+    def name(self) -> str:
+        return "counting"
+
+    @property
+    def uses_gpu(self) -> bool:
+        return True
+
+    @property
+    def is_expensive(self) -> bool:
+        return True
+
+    def __init__(self, **kwargs):
+        super().__init__()
+
+    def reward(self, reference, completions, num_requests=1):
+        return BatchRewardOutput(
+            rewards=torch.ones(len(completions)),
+            timings=torch.zeros(len(completions)),
+            extra_info={
+                "type": "counting",
+                "num_completions": len(completions),
+                "num_requests": num_requests,
+            },
+        )
+
+    def reward_batch(self, requests):
+        return [
+            self.reward(reference, completions, num_requests=len(requests))
+            for reference, completions in requests
+        ]
+
+
+class StallingBatchRewardModel(StallingRewardModel):
+    """Scores requests together with reward_batch, which stalls like reward does."""
+
+    def reward_batch(self, requests):
+        return [
+            self.reward(reference, completions) for reference, completions in requests
+        ]
+
+
+@pytest.fixture(scope="module")
+def diff_model():
+    model = ProcessPoolRewardModel(DiffRewardModel(), processes=2)
+    yield model
+    model.pool.shutdown()
+
+
+@pytest.mark.parametrize("num_completions", [1, 5])
+def test_process_pool_matches_in_process_rewards(diff_model, num_completions: int):
+    reference = "def f(x):\n    return x + 1"
+    completions = [reference[: 5 * i] for i in range(num_completions)]
+
+    output = diff_model.reward(reference, completions)
+    expected = DiffRewardModel().reward(reference, completions)
+
+    assert diff_model.name == "diff"
+    assert torch.allclose(output.rewards, expected.rewards)
+    assert output.timings.shape == output.rewards.shape
+    assert output.extra_info["timeouts"] == 0
+
+
+def test_process_pool_limits_time_per_completion():
+    model = ProcessPoolRewardModel(
+        StallingRewardModel(), processes=2, completion_timeout=0.2
+    )
+    # Wait for the workers to start, so that only the scoring is timed
+    model.reward("reference", ["fine", "fine"])
+
+    t0 = time.time()
+    output = model.reward("reference", ["fine", "stall", "fine", "fine"])
+    model.pool.shutdown()
+
+    # The second worker may still be starting, so the time limit is checked on the worker
+    assert time.time() - t0 < 10
+    assert output.timings.max() < 1
+    # The completion which shares a shard with the stalling one keeps its reward
+    assert output.rewards.tolist() == [1, 0, 1, 1]
+    assert output.extra_info["timeouts"] == 1
+
+
+def test_process_pool_scores_a_stalled_batch_one_by_one():
+    model = ProcessPoolRewardModel(
+        StallingBatchRewardModel(), processes=1, completion_timeout=0.2
+    )
+
+    outputs = model.reward_batch(
+        [("reference", ["fine", "stall"]), ("reference", ["fine"])]
+    )
+    model.pool.shutdown()
+
+    assert [output.rewards.tolist() for output in outputs] == [[1, 0], [1]]
+
+
+def test_process_pool_merges_extra_info_of_shards():
+    model = ProcessPoolRewardModel(CountingRewardModel(), processes=2)
+
+    output = model.reward("reference", ["a", "b", "c"])
+    model.pool.shutdown()
+
+    assert output.extra_info["num_completions"] == 3
+    assert output.extra_info["type"] == "counting"
+
+
+def test_process_pool_forwards_to_the_wrapped_model():
+    model = ProcessPoolRewardModel(CountingRewardModel(), processes=1)
+
+    outputs = model.reward_batch([("reference", ["a", "b"]), ("reference", ["c"])])
+    model.pool.shutdown()
+
+    assert model.uses_gpu and model.is_expensive
+    # The requests are scored in one call of the reward_batch of the model
+    assert [output.extra_info["num_requests"] for output in outputs] == [2, 2]
+    assert [len(output.rewards) for output in outputs] == [2, 1]
+
+
+def test_process_pool_restarts_after_a_worker_dies(diff_model):
+    diff_model.reward("reference", ["a", "b"])
+    pool = diff_model.pool
+    for process in list(pool._processes.values()):
+        process.kill()
+        process.join()
+
+    output = diff_model.reward("reference", ["reference", "b"])
+
+    assert diff_model.pool is not pool
+    assert output.rewards[0] == 1
@@ -0,0 +1,106 @@
+import torch
+import pytest
+from unittest.mock import patch
+
+from prompting.rewards import RelevanceRewardModel
+from prompting.rewards.relevance_accuracy import CORPUS, compare_relevance
+from .fixtures.relevance import CharTokenizer
+
+
+class TinyAnglE:
+    """A small stand-in for UAE-Large, with a linear backbone over bag-of-characters features."""
+
+    def __init__(self):
+        torch.manual_seed(0)
+        self.backbone = torch.nn.Sequential(
+            torch.nn.Linear(26, 64), torch.nn.ReLU(), torch.nn.Linear(64, 32)
+        )
+        self.max_length = 512
+        self.tokenizer = CharTokenizer()
+
+    def encode(self, inputs, to_numpy=False):
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        features = torch.ones(len(inputs), 26)
+        for i, text in enumerate(inputs):
+            # Room for the special tokens
+            for char in text.lower()[: self.max_length - 2]:
+                if char.isalpha():
+                    features[i, ord(char) - ord("a")] += 1
+        with torch.no_grad():
+            return self.backbone(features)
+
+
+def load_model(**kwargs) -> RelevanceRewardModel:
+    with patch(
+        "prompting.rewards.relevance.AnglE.from_pretrained", return_value=TinyAnglE()
+    ):
+        return RelevanceRewardModel(device="cpu", **kwargs)
+
+
+def test_int8_backend_quantizes_the_backbone():
+    model = load_model(backend="int8", max_length=128, num_threads=1)
+
+    assert isinstance(model.model.backbone[0], torch.ao.nn.quantized.dynamic.Linear)
+    assert model.model.max_length == 128
+    assert model.reward("reference", ["completion"]).extra_info["backend"] == "int8"
+
+
+def test_int8_backend_requires_cpu():
+    with pytest.raises(ValueError):
+        RelevanceRewardModel(device="cuda", backend="int8")
+
+
+def test_accuracy_harness():
+    results = compare_relevance(load_model(), load_model(backend="int8"))
+
+    assert results["max_abs_diff"] < 0.05
+    assert results["rank_agreement"] > 0.9
+
+    same = compare_relevance(load_model(), load_model(), corpus=CORPUS[:2])
+    assert same["max_abs_diff"] == pytest.approx(0, abs=1e-6)
+    assert same["rank_agreement"] == 1.0
+
+
+def test_truncate_policy_counts_long_texts():
+    model = load_model(max_length=12)
+
+    output = model.reward("reference", ["short", "a" * 50, "b" * 10])
+
+    assert output.extra_info["chunking"] == "truncate"
+    assert output.extra_info["max_length"] == 12
+    assert output.extra_info["truncated"] == 1
+    assert output.extra_info["chunked"] == 0
+
+
+def test_head_tail_policy_pools_the_head_and_tail():
+    model = load_model(max_length=12, chunking="head_tail")
+    stats = {"truncated": 0, "chunked": 0}
+
+    embedding = model.encode(["a" * 10 + "b" * 5 + "z" * 10, "short"], stats=stats)
+
+    expected = model.model.encode(["a" * 10, "z" * 10]).mean(dim=0)
+    assert torch.allclose(embedding[0], expected)
+    assert torch.allclose(embedding[1], model.model.encode("short")[0])
+    assert stats == {"truncated": 0, "chunked": 1}
+    assert model.reward("reference", ["c" * 20]).extra_info["chunked"] == 1
+
+
+def test_batches_are_bucketed_by_token_length():
+    model = load_model(max_length=32, batch_size=2)
+    batches = []
+    encode = model.model.encode
+    model.model.encode = lambda inputs, **kwargs: batches.append(inputs) or encode(
+        inputs, **kwargs
+    )
+
+    texts = ["a" * 20, "b", "c" * 100, "d" * 2]
+    embeddings = model.encode(texts)
+
+    assert batches == [["b", "d" * 2], ["a" * 20, "c" * 100]]
+    assert torch.allclose(embeddings, encode(texts))
+
+
+def test_unknown_chunking_policy():
+    with pytest.raises(ValueError):
+        load_model(chunking="middle")
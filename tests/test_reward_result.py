@@ -0,0 +1,197 @@
+import time
+import torch
+import pytest
+from types import SimpleNamespace
+
+from prompting.rewards import BaseRewardModel, BatchRewardOutput, RewardResult
+from prompting.rewards.reward import compile_weights
+
+
+class SleepyRewardModel(BaseRewardModel):
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def uses_gpu(self) -> bool:
+        return self._uses_gpu
+
+    def __init__(self, name, value, uses_gpu=False, delay=0.3):
+        self._name = name
+        self._uses_gpu = uses_gpu
+        self.value = value
+        self.delay = delay
+
+    def reward(self, reference, completions):
+        time.sleep(self.delay)
+        return BatchRewardOutput(
+            rewards=torch.full((len(completions),), self.value),
+            timings=torch.zeros(len(completions)),
+            extra_info={},
+        )
+
+
+def make_reward_result():
+    reward_pipeline = {
+        "relevance": SleepyRewardModel("relevance", 0.8, uses_gpu=True),
+        "rouge": SleepyRewardModel("rouge", 0.4),
+        "penalty": SleepyRewardModel("penalty", 0.5),
+    }
+    task = SimpleNamespace(
+        reference="reference",
+        reward_definition=[
+            dict(name="rouge", weight=0.5),
+            dict(name="relevance", weight=0.5),
+        ],
+        penalty_definition=[dict(name="penalty", weight=0.5)],
+    )
+    agent = SimpleNamespace(task=task, challenge="challenge")
+    response_event = SimpleNamespace(
+        completions=["a", "b", "c"], uids=torch.tensor([1, 2, 3])
+    )
+    return RewardResult(
+        reward_pipeline, agent=agent, response_event=response_event, device="cpu"
+    )
+
+
+def test_reward_models_run_concurrently():
+    reward_result = make_reward_result()
+
+    # Three models of 0.3s each, the gpu model overlaps with the cpu models even if the cpu pool has a single worker
+    assert reward_result.batch_time < 0.8
+    assert all(event.batch_time >= 0.3 for event in reward_result.reward_events)
+    assert reward_result.__state_dict__()["reward_pipeline_time"] == pytest.approx(
+        reward_result.batch_time
+    )
+
+
+def test_reward_events_keep_definition_order_and_total_reward():
+    reward_result = make_reward_result()
+
+    assert [event.model_name for event in reward_result.reward_events] == [
+        "rouge",
+        "relevance",
+    ]
+    assert [event.model_name for event in reward_result.penalty_events] == ["penalty"]
+    expected = (0.5 * 0.4 + 0.5 * 0.8) * (1 - 0.5 * 0.5)
+    assert torch.allclose(reward_result.rewards, torch.full((3,), expected))
+
+
+class LengthRewardModel(BaseRewardModel):
+    """Rewards the length of each completion and records the completions it scores."""
+
+    @property
+    def name(self) -> str:
+        return "length"
+
+    def __init__(self):
+        self.scored = []
+
+    def reward(self, reference, completions):
+        self.scored.extend(completions)
+        return BatchRewardOutput(
+            rewards=torch.FloatTensor([len(completion) for completion in completions]),
+            timings=torch.zeros(len(completions)),
+            extra_info={},
+        )
+
+
+def test_identical_completions_are_scored_once():
+    model = LengthRewardModel()
+    task = SimpleNamespace(
+        reference="reference",
+        reward_definition=[dict(name="length", weight=1.0)],
+        penalty_definition=[],
+    )
+    agent = SimpleNamespace(task=task, challenge="challenge")
+    completions = ["", "copied answer", "", "own answer", "copied answer", ""]
+    response_event = SimpleNamespace(
+        completions=completions, uids=torch.arange(len(completions))
+    )
+
+    reward_result = RewardResult(
+        {"length": model}, agent=agent, response_event=response_event, device="cpu"
+    )
+
+    assert model.scored == ["", "copied answer", "own answer"]
+    assert reward_result.rewards.tolist() == [len(c) for c in completions]
+    assert reward_result.reward_events[0].timings.shape == (len(completions),)
+    assert reward_result.__state_dict__()["dedup_ratio"] == pytest.approx(0.5)
+
+
+class ExpensiveLengthRewardModel(LengthRewardModel):
+    @property
+    def name(self) -> str:
+        return "expensive_length"
+
+    @property
+    def is_expensive(self) -> bool:
+        return True
+
+
+class CascadePipeline(dict):
+    cascade = True
+    cascade_floor = 0.5
+    cascade_fill = -1.0
+    cascade_status_codes = (200, 408)
+
+
+def test_cascade_runs_expensive_models_on_gated_completions():
+    cheap_model = SleepyRewardModel("cheap", 0.0, delay=0)
+    expensive_model = ExpensiveLengthRewardModel()
+    reward_pipeline = CascadePipeline(
+        cheap=cheap_model, expensive_length=expensive_model
+    )
+    # The cheap model gives 1 to completions containing "good"
+    cheap_model.reward = lambda reference, completions: BatchRewardOutput(
+        rewards=torch.FloatTensor([float("good" in c) for c in completions]),
+        timings=torch.zeros(len(completions)),
+        extra_info={},
+    )
+    task = SimpleNamespace(
+        reference="reference",
+        reward_definition=[
+            dict(name="expensive_length", weight=0.5),
+            dict(name="cheap", weight=0.5),
+        ],
+        penalty_definition=[],
+    )
+    agent = SimpleNamespace(task=task, challenge="challenge")
+    completions = ["good", "bad", "", "good too", "good but failed", "good"]
+    response_event = SimpleNamespace(
+        completions=completions,
+        uids=torch.arange(len(completions)),
+        status_codes=[200, 200, 204, 408, 500, 200],
+    )
+
+    reward_result = RewardResult(
+        reward_pipeline, agent=agent, response_event=response_event, device="cpu"
+    )
+
+    assert expensive_model.scored == ["good", "good too"]
+    assert [event.model_name for event in reward_result.reward_events] == [
+        "expensive_length",
+        "cheap",
+    ]
+    assert reward_result.reward_events[0].rewards.tolist() == [4, -1, -1, 8, -1, 4]
+    # Normalized over all completions, so that the filled ones are on the same scale as the scored ones
+    assert reward_result.reward_events[0].rewards_normalized.tolist() == pytest.approx(
+        [5 / 9, 0, 0, 1, 0, 5 / 9], abs=1e-5
+    )
+    # One expensive model skipped 3 of the 5 unique completions
+    assert reward_result.__state_dict__()["cascade_skipped"] == 3
+
+
+def test_compile_weights_follows_definition_order():
+    task = SimpleNamespace(
+        reward_definition=[
+            dict(name="rouge", weight=0.3),
+            dict(name="relevance", weight=0.7),
+        ],
+        penalty_definition=None,
+    )
+
+    reward_weights, penalty_weights = compile_weights(task)
+
+    assert reward_weights.tolist() == pytest.approx([0.3, 0.7])
+    assert penalty_weights.shape == (0,)
@@ -0,0 +1,108 @@
+import torch
+import pytest
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from prompting.rewards import DiffRewardModel, RelevanceRewardModel, RewardResult
+from prompting.rewards.service import (
+    RemoteRewardModel,
+    RemoteRewardPipeline,
+    RewardClient,
+    RewardServer,
+)
+from .fixtures.relevance import MockAnglE
+
+
+reference = "The capital of Texas is Austin"
+completions = ["Austin", "", "Dallas is in Texas", "The capital is Austin"]
+
+
+@pytest.fixture
+def server(tmp_path):
+    # A small stand-in embedding model, so that the service runs on cpu
+    with patch(
+        "prompting.rewards.relevance.AnglE.from_pretrained", return_value=MockAnglE()
+    ):
+        relevance = RelevanceRewardModel(device="cpu")
+    server = RewardServer(
+        {"relevance": relevance, "diff": DiffRewardModel()},
+        path=str(tmp_path / "rewards.sock"),
+        window=0.2,
+    )
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def test_remote_rewards_match_local_rewards(server):
+    client = RewardClient(server.path)
+    models = client.models()
+
+    for name, model in server.reward_models.items():
+        remote_model = RemoteRewardModel(name, client, **models[name])
+        remote_output = remote_model.reward(reference, completions)
+        local_output = model.reward(reference, completions)
+
+        assert remote_model.is_expensive == model.is_expensive
+        assert remote_output.rewards.tolist() == pytest.approx(
+            local_output.rewards.tolist()
+        )
+
+
+def test_requests_of_several_clients_are_batched(server):
+    outputs = {}
+
+    def score(i):
+        remote_model = RemoteRewardModel("relevance", RewardClient(server.path))
+        outputs[i] = remote_model.reward(reference, completions[i:])
+
+    threads = [threading.Thread(target=score, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    batcher = server.batchers["relevance"]
+    assert batcher.num_requests == 3
+    assert batcher.num_batches == 1
+    assert [len(outputs[i].rewards) for i in range(3)] == [4, 3, 2]
+
+
+def test_models_without_batching_are_not_batched(server):
+    assert "diff" not in server.batchers
+
+    output = RemoteRewardModel("diff", RewardClient(server.path)).reward(
+        reference, completions
+    )
+
+    assert len(output.rewards) == len(completions)
+
+
+def test_unknown_model_raises(server):
+    with pytest.raises(RuntimeError):
+        RewardClient(server.path).reward("unknown", reference, completions)
+
+
+def test_remote_reward_pipeline(server):
+    reward_pipeline = RemoteRewardPipeline(
+        selected_tasks=["debugging"], device="cpu", path=server.path
+    )
+    task = SimpleNamespace(
+        reference=reference,
+        reward_definition=[dict(name="diff", weight=1.0)],
+        penalty_definition=[],
+    )
+    response_event = SimpleNamespace(
+        completions=completions, uids=torch.arange(len(completions))
+    )
+
+    reward_result = RewardResult(
+        reward_pipeline,
+        agent=SimpleNamespace(task=task, challenge="challenge"),
+        response_event=response_event,
+        device="cpu",
+    )
+
+    expected = DiffRewardModel().reward(reference, completions).rewards
+    assert torch.allclose(reward_result.rewards, expected)
@@ -1,5 +1,17 @@
+import time
 import pytest
+import torch
 from datetime import datetime
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from torch.nn.functional import cosine_similarity
+from rouge import Rouge
+from prompting.rewards.native_rouge import NativeRouge
+from prompting.rewards.float_diff import (
+    SlowPathCounts,
+    SympySandbox,
+    is_sympy_expression,
+)
 from prompting.rewards import (
     DateRewardModel,
     DiffRewardModel,
@@ -8,6 +20,7 @@ from prompting.rewards import (
     FloatDiffModel,
     RewardPipeline,
 )
+from .fixtures.relevance import MockAnglE
 
 date1 = datetime.strptime("2022-01-01", "%Y-%m-%d")
 date2 = datetime.strptime("2022-01-03", "%Y-%m-%d")
@@ -35,6 +48,31 @@ def test_score_dates_with_different_format(reference, completion, expected_resul
     assert score == expected_result
 
 
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Born on 13/01/2000", (13, 2000)),  # day first when the month is invalid
+        ("Born on 2/30/2000", None),
+        ("February 29, 1996 or 03/01/1996", (61, 1996)),  # numeric formats first
+        ("5 May 21 then 1/2/21", (2, 21)),
+        ("No date here", None),
+    ],
+)
+def test_parse_dates_from_text(text, expected):
+    assert DateRewardModel().parse_dates_from_text(text) == expected
+
+
+def test_date_reward_matches_date_score():
+    model = DateRewardModel()
+    completions = dates1 + dates2 + dates3 + dates4 + ["", "no date"]
+
+    output = model.reward(ref, completions)
+
+    expected = [model.date_score(ref, completion) for completion in completions]
+    assert output.rewards.tolist() == pytest.approx(expected)
+    assert output.timings.shape == output.rewards.shape
+
+
 completion = ["0.5", "1/2", "1-0.5", "2*0.25"]
 expected_result = [1.0, 1.0, 1.0, 1.0]
 reference = ["0.5"] * len(completion)
@@ -111,3 +149,164 @@ def test_math_score_expression_parsing_with_zeros(
 ):
     score = FloatDiffModel().math_score(reference, completion)
     assert score == expected_result
+
+
+@pytest.mark.parametrize(
+    "completion, expected_result",
+    [
+        ("The answer is 3/4.", 0.75),
+        ("The answer is $\\frac{3}{4}$", 0.75),
+        ("So we get \\boxed{-\\dfrac{1}{2}}", -0.5),
+        ("Roughly 7.5e-1, the end", 0.75),
+        ("It is 1,000", 1000.0),
+        ("Dividing gives 1/0", None),
+    ],
+)
+def test_extract_number_fast_path(completion, expected_result):
+    counts = SlowPathCounts()
+
+    assert FloatDiffModel().extract_number(completion, counts) == expected_result
+    assert counts.count == 0
+
+
+def test_extract_number_slow_path_is_counted():
+    model = FloatDiffModel()
+    output = model.reward("23", ["It is 2*10+3", "23", "sqrt(4)"])
+
+    assert output.rewards.tolist() == pytest.approx([1.0, 1.0, 2 / 23])
+    assert output.extra_info["slow_path_count"] == 2
+
+
+def test_extract_number_slow_path_has_time_budget():
+    model = FloatDiffModel(sympy_timeout=0.5)
+    # Warm up the sympy process so that only the evaluation is timed
+    model.extract_number("1+1")
+
+    counts = SlowPathCounts()
+    t0 = time.time()
+    number = model.extract_number("The answer is 5 9**9**9**9", counts)
+
+    # The number before the expression which ran out of time is still found
+    assert time.time() - t0 < 2
+    assert number == 5
+    assert counts.timeouts == 1
+
+
+@pytest.mark.parametrize(
+    "word, expected_result",
+    [
+        ("2*10+3", True),
+        ("sqrt(4)/2", True),
+        ("-1.5e3^2", True),
+        ("exec(chr(112))", False),
+        ("x+1", False),
+        ("2e", False),
+    ],
+)
+def test_is_sympy_expression(word, expected_result):
+    assert is_sympy_expression(word) == expected_result
+
+
+def test_sympy_sandbox_has_no_builtins():
+    sandbox = SympySandbox()
+
+    assert sandbox.evaluate("print(42)", timeout=10) is None
+    assert sandbox.evaluate("__import__(1)", timeout=10) is None
+    # Anything printed while evaluating does not reach the protocol stream
+    assert sandbox.evaluate("1+1", timeout=10) == 2
+    sandbox.close()
+
+
+def test_sympy_sandbox_restarts_after_invalid_answer(monkeypatch):
+    monkeypatch.setattr(
+        "prompting.rewards.float_diff.SYMPY_WORKER_SOURCE",
+        "import sys\nprint('ready', flush=True)\nfor line in sys.stdin:\n    print('42 oops', flush=True)",
+    )
+    sandbox = SympySandbox()
+
+    assert sandbox.evaluate("1+1", timeout=10) is None
+    assert sandbox.process is None
+
+
+def test_slow_path_is_counted_per_call_under_concurrency():
+    model = FloatDiffModel()
+    completions = ["It is 2*10+3", "sqrt(4)", "23"]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(
+            executor.map(lambda _: model.reward("23", completions), range(8))
+        )
+
+    assert [output.extra_info["slow_path_count"] for output in outputs] == [2] * 8
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 32])
+@patch("prompting.rewards.relevance.AnglE.from_pretrained", return_value=MockAnglE())
+def test_relevance_batched_rewards_match_per_completion_rewards(
+    mock_angle, batch_size: int
+):
+    model = RelevanceRewardModel(device="cpu", batch_size=batch_size)
+    reference = "The capital of Texas is Austin"
+    completions = ["Austin", "", "Dallas is in Texas", "zzz", "The capital is Austin"]
+
+    output = model.reward(reference, completions)
+
+    reference_embedding = model.model.encode(reference)
+    baseline = cosine_similarity(reference_embedding, model.model.encode(""))
+    expected = [
+        (cosine_similarity(reference_embedding, model.model.encode(comp)) - baseline)
+        .clip(min=0, max=1)
+        .item()
+        for comp in completions
+    ]
+    assert output.rewards.tolist() == pytest.approx(expected, abs=1e-6)
+    assert output.timings.shape == output.rewards.shape
+
+
+rouge_reference = (
+    "The quick brown fox jumps over the lazy dog. The dog sleeps.  It was a sunny day."
+)
+rouge_completions = [
+    "The quick brown fox jumps over the lazy dog",
+    "A dog sleeps. The fox jumps. The day was sunny",
+    "the the the the. dog dog",
+    "Nothing in common here",
+    "The.. quick   brown. . fox",
+    "sleeps dog The. day sunny a was It",
+]
+
+
+@pytest.mark.parametrize("text_is_hypothesis", [False, True])
+@pytest.mark.parametrize("ngram", ["rouge-1", "rouge-2", "rouge-l"])
+@pytest.mark.parametrize("completion", rouge_completions)
+def test_native_rouge_matches_rouge_package(
+    ngram: str, completion: str, text_is_hypothesis: bool
+):
+    if text_is_hypothesis:
+        expected = Rouge().get_scores(rouge_reference, completion)[0][ngram]
+    else:
+        expected = Rouge().get_scores(completion, rouge_reference)[0][ngram]
+    result = NativeRouge(rouge_reference, text_is_hypothesis=text_is_hypothesis).score(
+        completion, ngram=ngram
+    )
+
+    for metric in ["f", "p", "r"]:
+        assert result[metric] == pytest.approx(expected[metric], abs=1e-9)
+
+
+@pytest.mark.parametrize("completion", ["", ".", " . "])
+def test_native_rouge_scores_empty_completions_zero(completion: str):
+    result = NativeRouge(rouge_reference).score(completion)
+
+    assert result == {"f": 0.0, "p": 0.0, "r": 0.0}
+
+
+@pytest.mark.parametrize("ngram", ["rouge-1", "rouge-l"])
+def test_rouge_reward_model_native_matches_package(ngram: str):
+    completions = rouge_completions + [""]
+    native_rewards = RougeRewardModel(ngram=ngram, native=True).reward(
+        rouge_reference, completions
+    )
+    package_rewards = RougeRewardModel(ngram=ngram).reward(rouge_reference, completions)
+
+    assert torch.allclose(native_rewards.rewards, package_rewards.rewards)
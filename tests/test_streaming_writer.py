@@ -0,0 +1,131 @@
+import time
+import asyncio
+import pytest
+
+from prompting.miners.utils import StreamingWriter, iterate_in_thread
+
+
+class RecordingSend:
+    """Records the bodies which are sent, taking `delay` seconds for each one."""
+
+    def __init__(self, delay: float = 0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.messages = []
+
+    async def __call__(self, message: dict):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.messages.append(message)
+
+    @property
+    def bodies(self):
+        return [message["body"].decode("utf-8") for message in self.messages]
+
+
+def test_flushes_on_token_count():
+    send = RecordingSend()
+
+    async def stream():
+        writer = StreamingWriter(send, max_tokens=3, max_latency=10)
+        for token in "abcdefg":
+            await writer.write(token)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(stream())
+
+    assert send.bodies == ["abc", "def", "g"]
+    assert [message["more_body"] for message in send.messages] == [True, True, False]
+    assert writer.num_flushes == 3
+    assert writer.completion == "abcdefg"
+
+
+def test_flushes_on_byte_size():
+    send = RecordingSend()
+
+    async def stream():
+        writer = StreamingWriter(send, max_tokens=100, max_bytes=4, max_latency=10)
+        for token in ["ab", "é", "cd", "e"]:
+            await writer.write(token)
+        await writer.close()
+
+    asyncio.run(stream())
+
+    assert send.bodies == ["abé", "cde"]
+
+
+def test_flushes_after_max_latency():
+    send = RecordingSend()
+
+    async def stream():
+        writer = StreamingWriter(send, max_tokens=100, max_latency=0.05)
+        await writer.write("first")
+        # No more tokens arrive, but the first one is still sent
+        await asyncio.sleep(0.2)
+        bodies = list(send.bodies)
+        await writer.write("second")
+        await writer.close()
+        return writer, bodies
+
+    writer, bodies = asyncio.run(stream())
+
+    assert bodies == ["first"]
+    assert send.bodies == ["first", "second"]
+    assert 0.04 < writer.time_to_first_token < 0.2
+
+
+def test_coalesces_sends_under_backpressure():
+    send = RecordingSend(delay=0.2)
+
+    async def stream():
+        writer = StreamingWriter(send, max_tokens=1)
+        for token in "abcdefghij":
+            await writer.write(token)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(stream())
+
+    # The tokens which arrive while the first one is sent are sent together, at the end of the stream
+    assert send.bodies == ["a", "bcdefghij"]
+    assert writer.num_flushes == 2
+    assert send.messages[-1]["more_body"] is False
+
+
+def test_send_errors_are_raised():
+    send = RecordingSend(error=ConnectionError("client disconnected"))
+
+    async def stream():
+        writer = StreamingWriter(send, max_tokens=1)
+        await writer.write("a")
+        await asyncio.sleep(0.01)
+        await writer.write("b")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(stream())
+
+
+def test_iterate_in_thread_does_not_block_the_event_loop():
+    def slow_tokens():
+        for token in "abc":
+            time.sleep(0.1)
+            yield token
+
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.time())
+            await asyncio.sleep(0.01)
+
+    async def stream():
+        ticker = asyncio.ensure_future(tick())
+        tokens = [token async for token in iterate_in_thread(slow_tokens())]
+        ticker.cancel()
+        return tokens
+
+    assert asyncio.run(stream()) == ["a", "b", "c"]
+    # Other coroutines kept running while the iterator blocked
+    assert len(ticks) > 10
@@ -0,0 +1,127 @@
+import time
+import pytest
+import asyncio
+from unittest.mock import patch
+
+from prompting.agent import HumanAgent
+from prompting.tasks import QuestionAnsweringTask
+from prompting.task_queue import TaskQueue, create_agents
+from prompting.tools import MockDataset
+
+from .fixtures.llm import mock_llm_pipeline
+
+
+def mock_create_task(llm_pipeline, task_name, create_reference=True, create_query=True):
+    return QuestionAnsweringTask(
+        llm_pipeline=llm_pipeline,
+        context=MockDataset().next(),
+        create_reference=create_reference,
+        create_query=create_query,
+    )
+
+
+def slow_create_task(*args, **kwargs):
+    # Makes sure the queue is still empty when the first agent is requested
+    time.sleep(0.1)
+    return mock_create_task(*args, **kwargs)
+
+
+def wait_for_depth(task_queue: TaskQueue, depth: int, timeout: float = 5):
+    t0 = time.time()
+    while task_queue.queue.qsize() < depth and time.time() - t0 < timeout:
+        time.sleep(0.01)
+
+
+@patch("prompting.task_queue.create_task", side_effect=mock_create_task)
+def test_task_queue_is_filled_up_to_maxsize(mock_task):
+    task_queue = TaskQueue(
+        llm_pipeline=mock_llm_pipeline(), tasks=["qa"], task_p=[1], maxsize=2
+    )
+    task_queue.start()
+    wait_for_depth(task_queue, depth=2)
+    task_queue.stop()
+
+    assert task_queue.queue.qsize() == 2
+    assert task_queue.__state_dict__()["task_queue_depth"] == 2
+    assert task_queue.__state_dict__()["task_queue_fill_time"] > 0
+
+    agent = asyncio.run(task_queue.get())
+    assert isinstance(agent, HumanAgent)
+    assert agent.challenge is not None
+    assert task_queue.starvations == 0
+
+
+@pytest.mark.parametrize("num_workers, expected_starvations", [(0, 0), (1, 1)])
+@patch("prompting.task_queue.create_task", side_effect=slow_create_task)
+def test_task_queue_get_from_empty_queue(
+    mock_task, num_workers: int, expected_starvations: int
+):
+    task_queue = TaskQueue(
+        llm_pipeline=mock_llm_pipeline(),
+        tasks=["qa"],
+        task_p=[1],
+        num_workers=num_workers,
+    )
+
+    agent = asyncio.run(task_queue.get())
+    task_queue.stop()
+
+    assert isinstance(agent, HumanAgent)
+    assert task_queue.starvations == expected_starvations
+
+
+@patch("prompting.task_queue.create_task", side_effect=slow_create_task)
+def test_task_queue_without_workers_does_not_block_the_event_loop(mock_task):
+    task_queue = TaskQueue(
+        llm_pipeline=mock_llm_pipeline(), tasks=["qa"], task_p=[1], num_workers=0
+    )
+    ticks = []
+
+    async def tick():
+        for _ in range(50):
+            ticks.append(time.time())
+            await asyncio.sleep(0.01)
+
+    async def get():
+        agent = await task_queue.get()
+        return agent, len(ticks)
+
+    async def main():
+        return await asyncio.gather(get(), tick())
+
+    (agent, num_ticks), _ = asyncio.run(main())
+
+    assert isinstance(agent, HumanAgent)
+    # The ticker ran while the task was created, which takes at least 0.1s
+    assert num_ticks > 3
+
+
+@patch("prompting.task_queue.create_agents", side_effect=RuntimeError("offline"))
+def test_task_queue_backs_off_after_errors(mock_create_agents):
+    task_queue = TaskQueue(llm_pipeline=mock_llm_pipeline(), tasks=["qa"], task_p=[1])
+    task_queue.ERROR_BACKOFF = 0.2
+
+    task_queue.start()
+    time.sleep(0.5)
+    t0 = time.time()
+    task_queue.stop()
+
+    # Waits of 0.2s and 0.4s, and the second wait is interrupted by stop
+    assert mock_create_agents.call_count == 2
+    assert time.time() - t0 < 0.5
+    assert not task_queue.workers
+
+
+@patch("prompting.task_queue.create_task", side_effect=mock_create_task)
+def test_create_agents_generates_queries_challenges_and_references(mock_task):
+    agents = create_agents(
+        llm_pipeline=mock_llm_pipeline(), tasks=["qa"], task_p=[1], n=3
+    )
+
+    assert len(agents) == 3
+    for agent in agents:
+        assert agent.task.query
+        assert agent.task.reference
+        assert agent.challenge
+        assert agent.task.query in agent.task.reference_prompt
+        assert agent.task.query in agent.system_prompt
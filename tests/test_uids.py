@@ -1,7 +1,8 @@
 import torch
 import pytest
+import asyncio
 from types import SimpleNamespace
-from prompting.utils.uids import get_random_uids
+from prompting.utils.uids import get_random_uids, reserve_uids
 
 
 def make_mock_neuron(unique_coldkeys=False, unique_ips=False, vpermit_tao_limit=1000):
@@ -51,3 +52,29 @@ def test_get_random_uids(unique_coldkeys, unique_ips, k, expected_result):
     assert (
         uids_returned == expected_result
     ), f"Incorrect uids returned., {uids_returned}"
+
+
+def test_reserve_uids_excludes_uids_in_flight():
+    mock_neuron = make_mock_neuron()
+    mock_neuron.uids_in_flight = {0, 1}
+
+    uids = asyncio.run(reserve_uids(mock_neuron, k=4, exclude=[]))
+    uids_returned = sorted(uids.tolist())
+
+    assert uids_returned == [2, 3]
+    assert mock_neuron.uids_in_flight == {0, 1, 2, 3}
+
+
+def test_reserve_uids_waits_for_uids_in_flight():
+    mock_neuron = make_mock_neuron()
+    mock_neuron.uids_in_flight = {0, 1, 2, 3}
+
+    async def release_and_reserve():
+        asyncio.get_running_loop().call_later(
+            0.1, mock_neuron.uids_in_flight.difference_update, [2, 3]
+        )
+        return await reserve_uids(mock_neuron, k=4, exclude=[])
+
+    uids_returned = sorted(asyncio.run(release_and_reserve()).tolist())
+
+    assert uids_returned == [2, 3]
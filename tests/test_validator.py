@@ -0,0 +1,61 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+from prompting.base.validator import BaseValidatorNeuron
+
+
+class MockValidator:
+    """Runs the forward passes of `BaseValidatorNeuron` with a forward which fails on given calls."""
+
+    timed_forward = BaseValidatorNeuron.timed_forward
+    concurrent_forward = BaseValidatorNeuron.concurrent_forward
+
+    def __init__(self, num_concurrent_forwards=4, forward_max_time=1, errors=()):
+        self.config = SimpleNamespace(
+            neuron=SimpleNamespace(
+                num_concurrent_forwards=num_concurrent_forwards,
+                forward_max_time=forward_max_time,
+            )
+        )
+        self.errors = list(errors)
+        self.num_calls = 0
+        self.completed = 0
+
+    async def forward(self):
+        index = self.num_calls
+        self.num_calls += 1
+        await asyncio.sleep(0.1)
+        if index < len(self.errors) and self.errors[index] is not None:
+            raise self.errors[index]
+        self.completed += 1
+
+
+def test_concurrent_forward_runs_forwards_concurrently():
+    validator = MockValidator(num_concurrent_forwards=4)
+
+    t0 = time.time()
+    asyncio.run(validator.concurrent_forward())
+
+    assert validator.completed == 4
+    assert time.time() - t0 < 0.3
+
+
+def test_failing_forward_does_not_cancel_the_others():
+    validator = MockValidator(
+        num_concurrent_forwards=3, errors=[ValueError("bad"), KeyError("missing")]
+    )
+
+    asyncio.run(validator.concurrent_forward())
+
+    assert validator.num_calls == 3
+    assert validator.completed == 1
+
+
+def test_timed_forward_cancels_a_slow_forward():
+    validator = MockValidator(forward_max_time=0.05)
+
+    asyncio.run(validator.timed_forward())
+
+    assert validator.num_calls == 1
+    assert validator.completed == 0